@@ -1,69 +1,295 @@
 # app.py - ВЕРСИЯ С LLM
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, session, g
 from llm_sql_converter import LLMSQLConverter  # Импортируем LLM конвертер
 from database import db, init_db
-import json
+from result_cache import ResultCache, DataVersionProbe
+from sql_validator import SQLValidator, SQLValidationError
+from schema_catalog import SchemaCatalog
+from query_planner import QueryPlanner, QueryCostError, parameterize, statement_name
+from config import config
+from history_store import HistoryStore
+from db_info import DB_INFO_QUERY, DbInfoSnapshot, etag_matches
+from index_advisor import WorkloadLog
+from single_flight import SingleFlight, SingleFlightTimeout
+from translation_cache import normalize_query
+from logging_setup import configure_logging
+from metrics import (
+    registry, register_service_gauges, CONTENT_TYPE,
+    HTTP_REQUESTS, HTTP_SECONDS, QUERY_OUTCOMES, ROWS_RETURNED
+)
+from query_service import (
+    result_body, rows_line, humanize_db_error, ndjson_line, StageTimings,
+    FALLBACK_SQL, SAMPLE_QUERIES
+)
+from wire_format import JSON, negotiate, choose_encoding, encode_body, compress_stream
+import atexit
+import logging
 import os
+import time
+import uuid
+from contextlib import ExitStack
 from datetime import datetime
 
 
+configure_logging(config.LOG_LEVEL, config.LOG_SAMPLE_RATE)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+app.secret_key = config.SECRET_KEY
 
-# Инициализация LLM-конвертера
-print("🚀 Инициализация Text2SQL системы с LLM...")
-converter = LLMSQLConverter()
+# Инициализация LLM-конвертера: модель грузится в фоне, сервис отвечает сразу
+# (пока модель не готова, запросы обслуживают кэш переводов и fallback-правила)
+logger.info("🚀 Инициализация Text2SQL системы с LLM...")
+converter = LLMSQLConverter(lazy=True)
+converter.start_loading()
 
-# ===== ФУНКЦИИ ДЛЯ РАБОТЫ С ИСТОРИЕЙ =====
-HISTORY_FILE = 'query_history.json'
+# Версия данных: по ней сбрасываются кэш результатов и снимок /api/db_info
+data_version = DataVersionProbe(db, source=config.DATA_VERSION_SOURCE, min_interval_ms=config.DATA_VERSION_CHECK_MS)
 
-def load_history():
-    """Загрузка истории запросов из файла"""
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                if isinstance(history, list):
-                    return history
-                else:
-                    return get_default_history()
-        except Exception as e:
-            print(f"Ошибка загрузки истории: {e}")
-            return get_default_history()
+# Кэш результатов SELECT (сбрасывается при изменении данных)
+result_cache = None
+if config.RESULT_CACHE_ENABLED:
+    result_cache = ResultCache(data_version, max_bytes=config.RESULT_CACHE_MAX_BYTES)
+
+# Статистика для панели: пересчитывается только при изменении данных
+db_info_snapshot = DbInfoSnapshot()
+
+# Журнал выполненных запросов (для index_advisor.py)
+workload_log = None
+if config.WORKLOAD_LOG_PATH:
+    workload_log = WorkloadLog(config.WORKLOAD_LOG_PATH, flush_interval=config.WORKLOAD_LOG_FLUSH_INTERVAL)
+    atexit.register(workload_log.stop)
+
+# Проверка SQL: белый список таблиц/столбцов приходит из каталога схемы
+sql_validator = SQLValidator(
+    max_rows=config.SQL_MAX_ROWS,
+    max_joins=config.SQL_MAX_JOINS,
+    cache_size=config.SQL_VALIDATION_CACHE_SIZE
+)
+
+# Оценка стоимости по EXPLAIN (планы кэшируются по форме запроса)
+query_planner = QueryPlanner(
+    max_cost=config.MAX_PLAN_COST,
+    max_rows=config.MAX_PLAN_ROWS,
+    cache_size=config.PLAN_CACHE_SIZE,
+    ttl=config.PLAN_CACHE_TTL
+)
+
+# История запросов: обновляется в памяти, на диск пишется фоновым потоком
+history_store = HistoryStore(
+    config.HISTORY_PATH,
+    limit=config.HISTORY_LIMIT,
+    flush_interval=config.HISTORY_FLUSH_INTERVAL,
+    users_path=config.HISTORY_USERS_PATH or None
+)
+atexit.register(history_store.stop)
+
+def current_user_id():
+    """Пользователь для личной истории (cookie сессии); None - общая история"""
+    if not config.HISTORY_USERS_PATH:
+        return None
+    if 'uid' not in session:
+        session['uid'] = uuid.uuid4().hex
+    return session['uid']
+
+def recent_history(n=10):
+    return history_store.recent(n, current_user_id())
+
+# Каталог схемы: читается в фоне и обновляется при изменении DDL
+def catalog_fetch(query):
+    results, _ = db.execute_query(query, timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS)
+    return results or []
+
+def apply_schema(catalog):
+    """Новая схема: текст для промпта LLM и белый список для проверки SQL"""
+    converter.set_schema(catalog.prompt_text(), catalog.whitelist())
+    sql_validator.set_whitelist(catalog.whitelist())
+    query_planner.clear()
+
+schema_catalog = SchemaCatalog(
+    catalog_fetch,
+    db_name=config.DB_NAME,
+    refresh_interval=config.SCHEMA_REFRESH_INTERVAL,
+    max_distinct=config.SCHEMA_MAX_DISTINCT,
+    values_ttl=config.SCHEMA_VALUES_TTL
+)
+schema_catalog.subscribe(apply_schema)
+schema_catalog.start()
+
+def explain_query(sql_query):
+    """План запроса без выполнения (EXPLAIN FORMAT JSON)"""
+    results, _ = db.execute_query(f"EXPLAIN (FORMAT JSON) {sql_query}",
+                                  timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS, read_only=True)
+    return results[0][0]
+
+def execute_limited(sql_query, params=None):
+    """Выполнение проверенного SQL со statement_timeout (через PREPARE/EXECUTE)"""
+    started = time.perf_counter()
+    if config.DB_PREPARED_STATEMENTS and params is None:
+        shape, values = parameterize(sql_query)
+        results, columns = db.execute_prepared(statement_name(shape), shape, values,
+                                               timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS, read_only=True)
     else:
-        return get_default_history()
+        results, columns = db.execute_query(sql_query, params, timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS,
+                                            read_only=True)
+    if workload_log is not None:
+        workload_log.record(sql_query, (time.perf_counter() - started) * 1000, len(results or []))
+    return results, columns
 
-def get_default_history():
-    """Возвращает историю по умолчанию"""
-    return [
-    ]
+# Одинаковые одновременные запросы ждут один результат: перевод - по
+# нормализованному тексту, выполнение - по каноническому SQL. Ожидание чужого
+# результата ограничено тем же, что и собственная работа
+translate_flight = SingleFlight('translate', timeout=config.LLM_REQUEST_TIMEOUT)
+execute_flight = SingleFlight(
+    'execute', timeout=config.SQL_STATEMENT_TIMEOUT_MS / 1000 + config.DB_POOL_ACQUIRE_TIMEOUT
+)
 
-def save_history(history):
-    """Сохранение истории запросов в файл"""
+def translate(user_query):
+    """NL -> SQL; (результат, shared), shared=True - результат чужого одинакового запроса"""
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return converter.convert(user_query), False
     try:
-        history_to_save = history[:20] if len(history) > 20 else history
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history_to_save, f, ensure_ascii=False, indent=2)
-        return True
-    except Exception as e:
-        print(f"Ошибка сохранения истории: {e}")
-        return False
+        return translate_flight.do(normalize_query(user_query), lambda: converter.convert(user_query))
+    except SingleFlightTimeout as e:
+        logger.warning("⏱️  %s, перевожу сам", e)
+        return converter.convert(user_query), False
+
+def execute_shared(sql_query, params=None):
+    """execute_limited, общий для одинаковых одновременных запросов"""
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return execute_limited(sql_query, params)
+    result, _ = execute_flight.do(ResultCache.make_key(sql_query, params),
+                                  lambda: execute_limited(sql_query, params))
+    return result
+
+# ===== ПОТОКОВАЯ ВЫДАЧА =====
+def wants_stream(data):
+    """Клиент просит потоковый ответ (NDJSON)"""
+    return bool(data.get('stream')) or 'application/x-ndjson' in request.headers.get('Accept', '')
 
-# Загружаем историю при запуске
-query_history = load_history()
+def response_type(data):
+    """Тип ответа по Accept: строчный JSON или столбцовая кодировка (wire_format.py)"""
+    return negotiate(request.headers.get('Accept', ''), data.get('layout'))
+
+def response_encoding():
+    """Сжатие ответа по Accept-Encoding (None - без сжатия)"""
+    if not config.RESPONSE_COMPRESSION_ENABLED:
+        return None
+    return choose_encoding(request.headers.get('Accept-Encoding', ''))
+
+def encoded_response(payload, media_type):
+    """Ответ в выбранной кодировке; длинный - сжатый"""
+    min_bytes = config.RESPONSE_COMPRESS_MIN_BYTES if config.RESPONSE_COMPRESSION_ENABLED else None
+    body, headers = encode_body(payload, media_type, request.headers.get('Accept-Encoding'), min_bytes)
+    return Response(body, content_type=media_type, headers=headers)
+
+def stream_query_response(user_query, sql_query, result, cached=None, estimate=None, columnar_layout=False):
+    """
+    Потоковый ответ NDJSON: строка meta, затем строки rows с порциями
+    результатов и завершающая строка end. Строки читаются из серверного
+    курсора и форматируются лениво, поэтому расход памяти не зависит
+    от размера результата. cached - готовый результат из кэша (results, columns).
+    columnar_layout - порции по столбцам (types/data) вместо строк-словарей.
+    """
+    stack = ExitStack()
+    if cached is not None:
+        columns, rows = cached[1], iter(cached[0])
+    else:
+        try:
+            # Выполняем запрос до начала ответа, чтобы ошибки SQL вернуть обычным JSON
+            started = time.perf_counter()
+            columns, rows = stack.enter_context(
+                db.stream_query(sql_query, timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS, read_only=True)
+            )
+            if workload_log is not None:
+                # Для потока - время до первой порции строк
+                workload_log.record(sql_query, (time.perf_counter() - started) * 1000)
+        except Exception:
+            stack.close()
+            raise
+    history = recent_history()
+
+    def generate():
+        with stack:
+            yield ndjson_line({
+                'type': 'meta',
+                'success': True,
+                'user_query': user_query,
+                'sql_query': sql_query,
+                'columns': columns,
+                'layout': 'columnar' if columnar_layout else 'rows',
+                'entities': result.get('entities', {}),
+                'cached': cached is not None,
+                'estimate': estimate,
+                'translation': result.get('translation'),
+                'history': history
+            })
+            row_count = 0
+            chunk = []
+            try:
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) >= config.STREAM_CHUNK_ROWS:
+                        row_count += len(chunk)
+                        yield rows_line(columns, chunk, columnar_layout)
+                        chunk = []
+                if chunk:
+                    row_count += len(chunk)
+                    yield rows_line(columns, chunk, columnar_layout)
+            except Exception as e:
+                logger.warning("❌ Ошибка потоковой выдачи: %s", e)
+                QUERY_OUTCOMES.inc(outcome='db_error')
+                yield ndjson_line({'type': 'error', 'error': f'Ошибка БД: {humanize_db_error(str(e))}'})
+                return
+            logger.info("📊 Отправлено потоком: %s строк", row_count)
+            QUERY_OUTCOMES.inc(outcome='ok')
+            ROWS_RETURNED.observe(row_count)
+            yield ndjson_line({'type': 'end', 'row_count': row_count})
+
+    encoding = response_encoding()
+    body = generate() if encoding is None else compress_stream(generate(), encoding)
+    response = Response(body, mimetype='application/x-ndjson', headers={'Vary': 'Accept, Accept-Encoding'})
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    # Если ответ так и не начали читать, соединение все равно вернется в пул
+    response.call_on_close(stack.close)
+    return response
+
+# ===== МЕТРИКИ =====
+register_service_gauges(converter, db.pool_stats, result_cache)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Счетчик и время ответа по шаблону маршрута (для потока - до начала тела)"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    return response
+
+if config.METRICS_ENABLED:
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return Response(registry.render(), content_type=CONTENT_TYPE)
 
 # ===== МАРШРУТЫ FLASK =====
 @app.route('/')
 def index():
     """Главная страница"""
     return render_template('index.html', 
-                         query_history=query_history[:10],
+                         query_history=recent_history(),
                          title="Text2SQL")
 
 @app.route('/api/query', methods=['POST'])
 def process_query():
     """Обработка запроса от пользователя с LLM"""
-    global query_history
-    
+    timings = StageTimings()
     try:
         # Получаем запрос из формы
         data = request.get_json()
@@ -76,29 +302,19 @@ def process_query():
             })
         
         # 1. ОБНОВЛЯЕМ ИСТОРИЮ
-        if user_query in query_history:
-            query_history.remove(user_query)
-        
-        query_history.insert(0, user_query)
-        
-        if len(query_history) > 20:
-            query_history = query_history[:20]
-        
-        save_history(query_history)
+        history_store.add(user_query, current_user_id())
+        timings.mark('history')
         
         # 2. КОНВЕРТИРУЕМ NL -> SQL ЧЕРЕЗ LLM
-        print(f"\n{'='*60}")
-        print(f"🔍 Пользовательский запрос: '{user_query}'")
-        
-        result = converter.convert(user_query)
+        result, shared = translate(user_query)
+        timings.mark('translate')
         
         if not result['success']:
             error_msg = result.get('error', 'Неизвестная ошибка LLM')
-            print(f"❌ Ошибка LLM: {error_msg}")
             
             # Пробуем fallback на простой запрос
-            fallback_sql = "SELECT first_name, last_name, position, department, salary FROM employees LIMIT 10;"
-            print(f"🔄 Использую fallback запрос: {fallback_sql}")
+            fallback_sql = FALLBACK_SQL
+            logger.warning("❌ Ошибка LLM: %s, использую fallback запрос", error_msg)
             
             result = {
                 'success': True,
@@ -108,115 +324,118 @@ def process_query():
             }
         
         sql_query = result['sql_query']
-        print(f"✅ LLM сгенерировал SQL: {sql_query}")
-        print(f"{'='*60}")
         
-        # 3. ПРОВЕРКА БЕЗОПАСНОСТИ SQL
-        def is_sql_safe(sql_query):
-            """Базовая проверка SQL-запроса на безопасность"""
-            # Приводим к верхнему регистру для проверки
-            sql_upper = sql_query.upper()
-            
-            # Запрещенные операции
-            dangerous_operations = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 
-                                   'TRUNCATE', 'CREATE', 'GRANT', 'REVOKE']
-            
-            for operation in dangerous_operations:
-                if operation in sql_upper:
-                    print(f"⚠️  Обнаружена опасная операция: {operation}")
-                    return False
-            
-            # Проверяем, что запрос начинается с SELECT (только чтение)
-            if not sql_upper.strip().startswith('SELECT'):
-                print(f"⚠️  Запрос не начинается с SELECT: {sql_query[:50]}...")
-                return False
-            
-            return True
+        # 3. ПРОВЕРКА SQL: один SELECT по разрешенным таблицам, LIMIT
+        try:
+            sql_query = sql_validator.validate(sql_query)['sql']
+            timings.mark('validate')
+        except SQLValidationError as e:
+            logger.info("⚠️  SQL отклонен: %s", e)
+            QUERY_OUTCOMES.inc(outcome='rejected')
+            return jsonify({
+                'success': False,
+                'error': f'Запрос отклонен: {e}',
+                'sql_query': sql_query,
+                'user_query': user_query,
+                'history': recent_history()
+            })
         
         # 4. ВЫПОЛНЯЕМ SQL-ЗАПРОС В БД
         db_results, columns = None, None
+        from_cache = False
+        estimate = None
         
-        # Проверяем SQL на безопасность
-        if is_sql_safe(sql_query):  # ← ИСПРАВЛЕНО! Теперь это обычная функция
-            try:
-                db_results, columns = db.execute_query(sql_query)
-                print(f"📊 Получено результатов: {len(db_results) if db_results else 0}")
-            except Exception as db_error:
-                error_msg = str(db_error)
-                print(f"❌ Ошибка выполнения SQL: {error_msg}")
-                
-                # Упрощаем сообщение для пользователя
-                if "relation" in error_msg.lower() and "does not exist" in error_msg.lower():
-                    error_msg = "Ошибка: таблица не найдена. Проверьте подключение к БД."
-                elif "syntax error" in error_msg.lower():
-                    error_msg = "Ошибка синтаксиса SQL. LLM сгенерировал некорректный запрос."
-                elif "column" in error_msg.lower() and "does not exist" in error_msg.lower():
-                    error_msg = "Ошибка: столбец не найден. Проверьте схему базы данных."
-                
-                return jsonify({
-                    'success': False,
-                    'error': f'Ошибка БД: {error_msg}',
-                    'sql_query': sql_query,
-                    'user_query': user_query,
-                    'history': query_history[:10]
-                })
-        else:
+        try:
+            # Оценка плана: дорогие запросы отклоняем, слишком "широкие" ограничиваем
+            sql_query, estimate = query_planner.check(sql_query, explain_query)
+            timings.mark('plan')
+            
+            if wants_stream(data):
+                # Потоковый режим: готовый результат берем из кэша, иначе читаем
+                # серверным курсором (такие результаты в кэш не попадают)
+                cached = result_cache.get(sql_query) if result_cache is not None else None
+                return stream_query_response(user_query, sql_query, result, cached, estimate,
+                                             columnar_layout=response_type(data) != JSON)
+            elif result_cache is not None:
+                db_results, columns, from_cache = result_cache.get_or_execute(
+                    sql_query, None, execute_shared
+                )
+            else:
+                db_results, columns = execute_shared(sql_query)
+            timings.mark('execute')
+        except QueryCostError as e:
+            logger.info("⚠️  SQL отклонен по оценке плана: %s", e)
+            QUERY_OUTCOMES.inc(outcome='too_expensive')
             return jsonify({
                 'success': False,
-                'error': 'Запрос содержит потенциально опасные операции',
+                'error': f'Запрос отклонен: {e}',
+                'sql_query': sql_query,
+                'estimate': e.estimate,
                 'user_query': user_query,
-                'history': query_history[:10]
+                'history': recent_history()
+            })
+        except Exception as db_error:
+            error_msg = str(db_error)
+            logger.warning("❌ Ошибка выполнения SQL: %s", error_msg)
+            QUERY_OUTCOMES.inc(outcome='db_error')
+            
+            # Упрощаем сообщение для пользователя
+            error_msg = humanize_db_error(error_msg)
+            
+            return jsonify({
+                'success': False,
+                'error': f'Ошибка БД: {error_msg}',
+                'sql_query': sql_query,
+                'user_query': user_query,
+                'history': recent_history()
             })
         
-        # 5. ФОРМАТИРУЕМ РЕЗУЛЬТАТЫ
-        formatted_results = []
-        if db_results and columns:
-            for row in db_results:
-                row_dict = {}
-                for i, col in enumerate(columns):
-                    value = row[i]
-                    if isinstance(value, datetime):
-                        row_dict[col] = value.strftime('%Y-%m-%d')
-                    elif value is None:
-                        row_dict[col] = None
-                    elif isinstance(value, (int, float)):
-                        # Для зарплаты добавляем форматирование
-                        if col == 'salary':
-                            row_dict[col] = f"{value:,.2f}".replace(',', ' ').replace('.', ',')
-                        else:
-                            row_dict[col] = value
-                    else:
-                        row_dict[col] = str(value)
-                formatted_results.append(row_dict)
+        # Выполнившийся перевод LLM пополняет библиотеку примеров для промпта
+        # (один раз на общий перевод)
+        if result.get('source') == 'llm' and not shared:
+            converter.remember_example(user_query, sql_query)
         
-        # 6. ЛОГИРОВАНИЕ ДЛЯ ОТЛАДКИ
-        print(f"\n📋 ИТОГИ ОБРАБОТКИ:")
-        print(f"   Запрос: {user_query}")
-        print(f"   SQL: {sql_query}")
-        print(f"   Результатов: {len(formatted_results)}")
-        if formatted_results and len(formatted_results) > 0:
-            print(f"   Пример строки: {formatted_results[0]}")
-        print(f"{'='*60}\n")
+        # 5. ФОРМАТИРУЕМ РЕЗУЛЬТАТЫ (строками или по столбцам - по Accept)
+        columns = columns or []
+        db_results = db_results or []
+        media_type = response_type(data)
+        body = result_body(columns, db_results, columnar_layout=media_type != JSON)
+        timings.mark('format')
         
-        return jsonify({
+        # 6. ЛОГИРОВАНИЕ (INFO - с выборкой LOG_SAMPLE_RATE)
+        logger.info("🔍 '%s' -> %s: %s строк%s", user_query, sql_query, len(db_results),
+                    ' (из кэша)' if from_cache else '')
+        if db_results:
+            logger.debug("   Пример строки: %s", db_results[0])
+        QUERY_OUTCOMES.inc(outcome='ok')
+        ROWS_RETURNED.observe(len(db_results))
+        
+        payload = {
             'success': True,
             'user_query': user_query,
             'sql_query': sql_query,
-            'results': formatted_results,
-            'columns': columns if columns else [],
+            'columns': columns,
+            'row_count': len(db_results),
             'entities': result.get('entities', {}),
-            'history': query_history[:10]
-        })
+            'cached': from_cache,
+            'estimate': estimate,
+            'translation': result.get('translation'),
+            'timings': timings.as_dict(),
+            'history': recent_history()
+        }
+        payload.update(body)
+        response = encoded_response(payload, media_type)
+        timings.mark('serialize')
+        return response
         
     except Exception as e:
-        print(f"💥 Критическая ошибка в process_query: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("💥 Критическая ошибка в process_query: %s", e)
+        QUERY_OUTCOMES.inc(outcome='error')
         
         return jsonify({
             'success': False,
             'error': f'Внутренняя ошибка сервера: {str(e)}',
-            'history': query_history[:10]
+            'history': recent_history()
         })
 
 @app.route('/api/history', methods=['GET'])
@@ -224,93 +443,49 @@ def get_history():
     """Получение истории запросов"""
     return jsonify({
         'success': True,
-        'history': query_history[:15]
+        'history': recent_history(15)
     })
 
 @app.route('/api/history/clear', methods=['POST'])
 def clear_history():
     """Очистка истории запросов"""
-    global query_history
-    query_history = get_default_history()
-    save_history(query_history)
+    history_store.clear(current_user_id())
     return jsonify({
         'success': True,
         'message': 'История очищена',
-        'history': query_history[:10]
+        'history': recent_history()
     })
 
 @app.route('/api/sample_queries', methods=['GET'])
 def get_sample_queries():
     """Примеры запросов для быстрого выбора"""
-    samples = [
-        "Показать всех сотрудников",
-        "Сотрудники IT отдела",
-        "Найти менеджеров",
-        "Зарплата больше 150000"
-    ]
-    return jsonify({'success': True, 'samples': samples})
+    return jsonify({'success': True, 'samples': SAMPLE_QUERIES})
 
 @app.route('/api/db_info', methods=['GET'])
 def get_db_info():
-    """Получение информации о базе данных"""
+    """
+    Информация о базе данных из снимка (один запрос на версию данных).
+    ETag позволяет браузеру не скачивать неизменившийся ответ.
+    """
     try:
-        # Количество записей
-        results, columns = db.execute_query("SELECT COUNT(*) as count FROM employees;")
-        count = results[0][0] if results else 0
-        
-        # Отделы
-        dept_results, _ = db.execute_query("SELECT DISTINCT department FROM employees ORDER BY department;")
-        departments = [row[0] for row in dept_results] if dept_results else []
-        
-        # Зарплаты
-        salary_results, _ = db.execute_query("""
-            SELECT 
-                MIN(salary) as min_salary,
-                MAX(salary) as max_salary,
-                ROUND(AVG(salary), 2) as avg_salary,
-                ROUND(SUM(salary), 2) as total_salary
-            FROM employees;
-        """)
-        
-        if salary_results:
-            min_salary, max_salary, avg_salary, total_salary = salary_results[0]
-        else:
-            min_salary = max_salary = avg_salary = total_salary = 0
-        
-        # Статистика по отделам
-        dept_stats_results, _ = db.execute_query("""
-            SELECT 
-                department,
-                COUNT(*) as employee_count,
-                ROUND(AVG(salary), 2) as avg_salary
-            FROM employees 
-            GROUP BY department 
-            ORDER BY avg_salary DESC;
-        """)
+        try:
+            version = data_version.current()
+        except Exception as e:
+            logger.warning("⚠️  Версия данных недоступна, снимок пересчитывается: %s", e)
+            version = None
         
-        dept_stats = []
-        if dept_stats_results:
-            for row in dept_stats_results:
-                dept_stats.append({
-                    'department': row[0],
-                    'count': row[1],
-                    'avg_salary': row[2]
-                })
+        snapshot = db_info_snapshot.current(version)
+        if snapshot is None:
+            results, _ = db.execute_query(DB_INFO_QUERY, timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS)
+            snapshot = db_info_snapshot.update(version, results or [])
+        body, etag = snapshot
         
-        return jsonify({
-            'success': True,
-            'stats': {
-                'total_employees': count,
-                'departments': departments,
-                'min_salary': min_salary,
-                'max_salary': max_salary,
-                'avg_salary': avg_salary,
-                'total_salary': total_salary,
-                'department_stats': dept_stats
-            }
-        })
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(status=304, headers=headers)
+        return Response(body, mimetype='application/json', headers=headers)
     except Exception as e:
-        print(f"Ошибка получения информации о БД: {e}")
+        logger.error("Ошибка получения информации о БД: %s", e)
         return jsonify({
             'success': False,
             'error': f'Не удалось получить информацию о БД: {str(e)}'
@@ -328,15 +503,28 @@ def health_check():
         except:
             db_ok = False
         
-        # Проверяем LLM (просто создаем экземпляр)
-        llm_ok = True  # Предполагаем что ок, если импортировался
-        
         return jsonify({
             'success': True,
             'status': {
                 'database': 'connected' if db_ok else 'disconnected',
-                'llm': 'ready' if llm_ok else 'not_ready',
-                'history_count': len(query_history),
+                'llm': converter.state,
+                'llm_status': converter.status(),
+                'history_count': len(history_store),
+                'history': history_store.stats(),
+                'db_pool': db.pool_stats(),
+                'llm_batching': converter.inference_stats(),
+                'translation_cache': converter.cache_stats(),
+                'few_shot': converter.few_shot_stats(),
+                'result_cache': result_cache.stats() if result_cache else None,
+                'db_info': db_info_snapshot.stats(),
+                'single_flight': {
+                    'translate': translate_flight.stats(),
+                    'execute': execute_flight.stats(),
+                },
+                'workload_log': workload_log.stats() if workload_log else None,
+                'sql_validator': sql_validator.stats(),
+                'query_planner': query_planner.stats(),
+                'schema': schema_catalog.stats(),
                 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
         })
@@ -348,41 +536,33 @@ def health_check():
 
 # ===== ЗАПУСК ПРИЛОЖЕНИЯ =====
 if __name__ == '__main__':
-    print("\n" + "="*80)
-    print("🚀 ЗАПУСК TEXT2SQL С LLM")
-    print("="*80)
+    logger.info("🚀 ЗАПУСК TEXT2SQL С LLM")
     
     # Информация о системе
-    print(f"📁 Рабочая директория: {os.getcwd()}")
-    print(f"🤖 Используемая модель: SQLCoder")
-    print(f"📜 Загружено запросов в истории: {len(query_history)}")
+    logger.info("📁 Рабочая директория: %s", os.getcwd())
+    logger.info("🤖 Используемая модель: %s (%s)", converter.model_name, converter.state)
+    logger.info("📜 Загружено запросов в истории: %s", len(history_store))
     
     # Инициализация БД
-    print("\n🔌 Подключение к базе данных...")
+    logger.info("🔌 Подключение к базе данных...")
     if init_db():
-        print("✅ База данных подключена успешно")
+        logger.info("✅ База данных подключена успешно")
         
         # Показываем статистику
         try:
             results, columns = db.execute_query("SELECT COUNT(*) FROM employees;")
             count = results[0][0] if results else 0
-            print(f"📊 В базе данных: {count} сотрудников")
+            logger.info("📊 В базе данных: %s сотрудников", count)
             
             # Примерные данные
             results, columns = db.execute_query("SELECT first_name, last_name, department FROM employees LIMIT 3;")
-            print(f"📋 Пример сотрудников:")
-            for row in results:
-                print(f"   - {row[0]} {row[1]} ({row[2]})")
+            logger.info("📋 Пример сотрудников: %s", ', '.join(f"{row[0]} {row[1]} ({row[2]})" for row in results))
         except Exception as e:
-            print(f"⚠️  Не удалось получить статистику БД: {e}")
+            logger.warning("⚠️  Не удалось получить статистику БД: %s", e)
     else:
-        print("⚠️  Не удалось подключиться к БД")
-        print("   Проверьте настройки подключения в файле .env")
+        logger.warning("⚠️  Не удалось подключиться к БД. Проверьте настройки подключения в файле .env")
     
-    print("\n" + "="*80)
-    print("🌐 Веб-сервер готов к работе!")
-    print("👉 Откройте браузер и перейдите по адресу: http://localhost:5000")
-    print("="*80 + "\n")
+    logger.info("🌐 Веб-сервер готов к работе: http://localhost:5000")
     
     # Запускаем Flask
-    app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
+    app.run(debug=True, port=5000, host='0.0.0.0')
@@ -0,0 +1,693 @@
+# asgi_app.py - асинхронный вариант API (те же маршруты, что в app.py)
+#
+# Запуск: uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+#
+# Запросы к PostgreSQL идут через asyncpg со своим пулом соединений,
+# генерация LLM выполняется в отдельном пуле потоков, поэтому цикл событий
+# никогда не блокируется. Таймаут запроса распространяется и на SQL
+# (statement_timeout + отмена запроса asyncpg), и на генерацию (флаг отмены
+# в батче LLM).
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+from datetime import datetime
+
+import asyncpg
+from quart import Quart, render_template, request, jsonify, Response, session, g
+
+from config import config
+from llm_sql_converter import LLMSQLConverter
+from sql_validator import SQLValidator, SQLValidationError
+from schema_catalog import SchemaCatalog
+from query_planner import QueryPlanner, QueryCostError, parameterize, summarize_plan
+from history_store import HistoryStore
+from db_info import DB_INFO_QUERY, DbInfoSnapshot, etag_matches
+from result_cache import DataVersionProbe, ResultCache, canonical_sql
+from index_advisor import WorkloadLog
+from single_flight import AsyncSingleFlight
+from translation_cache import normalize_query
+from logging_setup import configure_logging
+from metrics import (
+    registry, register_service_gauges, CONTENT_TYPE, DB_QUERY_SECONDS,
+    HTTP_REQUESTS, HTTP_SECONDS, QUERY_OUTCOMES, ROWS_RETURNED
+)
+from query_service import (
+    result_body, rows_line, humanize_db_error, ndjson_line, StageTimings,
+    FALLBACK_SQL, SAMPLE_QUERIES
+)
+from wire_format import JSON, negotiate, choose_encoding, encode_body, compress_stream_async
+
+configure_logging(config.LOG_LEVEL, config.LOG_SAMPLE_RATE)
+logger = logging.getLogger(__name__)
+
+app = Quart(__name__)
+app.secret_key = config.SECRET_KEY
+
+logger.info("🚀 Инициализация асинхронного Text2SQL...")
+converter = LLMSQLConverter(lazy=True)
+
+# Отдельный пул потоков под генерацию: потоки в основном ждут общий батч LLM
+inference_executor = ThreadPoolExecutor(
+    max_workers=config.ASYNC_INFERENCE_THREADS,
+    thread_name_prefix="inference"
+)
+
+sql_validator = SQLValidator(
+    max_rows=config.SQL_MAX_ROWS,
+    max_joins=config.SQL_MAX_JOINS,
+    cache_size=config.SQL_VALIDATION_CACHE_SIZE
+)
+
+query_planner = QueryPlanner(
+    max_cost=config.MAX_PLAN_COST,
+    max_rows=config.MAX_PLAN_ROWS,
+    cache_size=config.PLAN_CACHE_SIZE,
+    ttl=config.PLAN_CACHE_TTL
+)
+
+pool = None
+data_version = None
+# Кэш результатов SELECT (сбрасывается при изменении данных); создается при старте
+result_cache = None
+db_info_snapshot = DbInfoSnapshot()
+
+# Журнал выполненных запросов (для index_advisor.py)
+workload_log = None
+if config.WORKLOAD_LOG_PATH:
+    workload_log = WorkloadLog(config.WORKLOAD_LOG_PATH, flush_interval=config.WORKLOAD_LOG_FLUSH_INTERVAL)
+
+schema_catalog = None
+# История: обновление в памяти без ожидания диска, запись - фоновым потоком
+history_store = HistoryStore(
+    config.HISTORY_PATH,
+    limit=config.HISTORY_LIMIT,
+    flush_interval=config.HISTORY_FLUSH_INTERVAL,
+    users_path=config.HISTORY_USERS_PATH or None
+)
+
+
+@app.before_serving
+async def startup():
+    """Создание пула asyncpg и фоновая загрузка модели при старте сервера"""
+    global pool, schema_catalog, data_version, result_cache
+    converter.start_loading()
+    pool = await asyncpg.create_pool(
+        host=config.DB_HOST,
+        port=int(config.DB_PORT),
+        database=config.DB_NAME,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+        min_size=config.DB_POOL_MIN_SIZE,
+        max_size=config.DB_POOL_MAX_SIZE
+    )
+    logger.info("✅ Пул asyncpg создан (%s..%s)", config.DB_POOL_MIN_SIZE, config.DB_POOL_MAX_SIZE)
+
+    # Каталог схемы работает в своем потоке, запросы выполняет через пул asyncpg
+    loop = asyncio.get_running_loop()
+
+    def catalog_fetch(query):
+        future = asyncio.run_coroutine_threadsafe(pool.fetch(query), loop)
+        return future.result(config.ASYNC_REQUEST_TIMEOUT)
+
+    schema_catalog = SchemaCatalog(
+        catalog_fetch,
+        db_name=config.DB_NAME,
+        refresh_interval=config.SCHEMA_REFRESH_INTERVAL,
+        max_distinct=config.SCHEMA_MAX_DISTINCT,
+        values_ttl=config.SCHEMA_VALUES_TTL
+    )
+    schema_catalog.subscribe(apply_schema)
+    schema_catalog.start()
+
+    # Версия данных для снимка /api/db_info и кэша результатов (синхронная
+    # проверка - в пуле потоков)
+    data_version = DataVersionProbe(
+        _LoopQueries(loop),
+        source=config.DATA_VERSION_SOURCE,
+        min_interval_ms=config.DATA_VERSION_CHECK_MS
+    )
+    if config.RESULT_CACHE_ENABLED:
+        result_cache = ResultCache(data_version, max_bytes=config.RESULT_CACHE_MAX_BYTES)
+    register_service_gauges(converter, _pool_stats, result_cache)
+
+
+@app.after_serving
+async def shutdown():
+    if schema_catalog is not None:
+        schema_catalog.stop()
+    if pool is not None:
+        await pool.close()
+    await asyncio.get_running_loop().run_in_executor(None, history_store.stop)
+    if workload_log is not None:
+        workload_log.stop()
+    inference_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ===== АСИНХРОННЫЕ ШАГИ ОБРАБОТКИ =====
+class _LoopQueries:
+    """execute_query для синхронных компонентов (DataVersionProbe) поверх пула asyncpg"""
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    def execute_query(self, query):
+        rows = asyncio.run_coroutine_threadsafe(pool.fetch(query), self.loop).result(config.ASYNC_REQUEST_TIMEOUT)
+        return [tuple(row) for row in rows], list(rows[0].keys()) if rows else []
+
+
+def apply_schema(catalog):
+    """Новая схема: текст для промпта LLM и белый список для проверки SQL"""
+    converter.set_schema(catalog.prompt_text(), catalog.whitelist())
+    sql_validator.set_whitelist(catalog.whitelist())
+    query_planner.clear()
+
+
+def statement_timeout_ms(timeout):
+    """statement_timeout: не больше остатка бюджета запроса и SQL_STATEMENT_TIMEOUT_MS"""
+    return max(1, min(int(timeout * 1000), config.SQL_STATEMENT_TIMEOUT_MS))
+
+
+class Deadline:
+    """Общий бюджет времени на запрос"""
+
+    def __init__(self, seconds):
+        self.expires_at = asyncio.get_running_loop().time() + seconds
+
+    def remaining(self):
+        remaining = self.expires_at - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return remaining
+
+
+# Одинаковые одновременные запросы ждут один перевод и одно выполнение SQL;
+# каждый ждет не дольше своего дедлайна
+translate_flight = AsyncSingleFlight('translate')
+execute_flight = AsyncSingleFlight('execute')
+
+
+async def convert_query(user_query, deadline):
+    """NL -> SQL: (результат, shared), shared=True - результат чужого одинакового запроса"""
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return await _convert_query(user_query, deadline), False
+    return await translate_flight.do(
+        normalize_query(user_query), lambda: _convert_query(user_query, deadline), deadline.remaining()
+    )
+
+
+async def _convert_query(user_query, deadline):
+    """NL -> SQL в пуле потоков; при таймауте или отмене генерация прерывается"""
+    cancel_event = threading.Event()
+    future = asyncio.get_running_loop().run_in_executor(
+        inference_executor, converter.convert, user_query, cancel_event
+    )
+    try:
+        return await asyncio.wait_for(future, deadline.remaining())
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        cancel_event.set()
+        raise
+
+
+async def fetch_query(sql_query, deadline, *args):
+    """
+    Выполнение SELECT в read-only транзакции с statement_timeout.
+    conn.fetch берет подготовленный оператор из кэша соединения asyncpg,
+    поэтому запрос одной формы планируется один раз на соединение.
+    """
+    timeout = deadline.remaining()
+    async with pool.acquire(timeout=timeout) as conn:
+        async with conn.transaction(readonly=True):
+            await conn.execute(f"SET LOCAL statement_timeout = {statement_timeout_ms(timeout)}")
+            # При отмене задачи asyncpg сам отправляет серверу cancel request
+            started = time.perf_counter()
+            rows = await conn.fetch(sql_query, *args, timeout=deadline.remaining())
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started, kind='query')
+            if rows:
+                columns = list(rows[0].keys())
+            else:
+                statement = await conn.prepare(sql_query)
+                columns = [attr.name for attr in statement.get_attributes()]
+    return rows, columns
+
+
+async def check_plan(sql_query, deadline):
+    """Оценка плана (EXPLAIN кэшируется по тексту запроса с литералами) и проверка порогов"""
+    key = query_planner.plan_key(sql_query)
+    estimate = query_planner.lookup(key)
+    cached = estimate is not None
+    if estimate is None:
+        rows, _ = await fetch_query(f"EXPLAIN (FORMAT JSON) {sql_query}", deadline)
+        estimate = summarize_plan(rows[0][0])
+        query_planner.remember(key, estimate)
+    sql_query, estimate = query_planner.gate(sql_query, estimate)
+    estimate['cached'] = cached
+    return sql_query, estimate
+
+
+async def fetch_parameterized(sql_query, deadline):
+    """Выполнение SQL, общее для одинаковых одновременных запросов"""
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return await _fetch_parameterized(sql_query, deadline)
+    result, _ = await execute_flight.do(
+        canonical_sql(sql_query), lambda: _fetch_parameterized(sql_query, deadline), deadline.remaining()
+    )
+    return result
+
+
+async def cached_result(sql_query):
+    """(rows, columns) из кэша результатов или None (проверка версии данных - в пуле потоков)"""
+    if result_cache is None:
+        return None
+    return await asyncio.get_running_loop().run_in_executor(None, result_cache.get, sql_query)
+
+
+async def fetch_results(sql_query, deadline):
+    """Результат из кэша или выполнение: (rows, columns, из кэша)"""
+    cached = await cached_result(sql_query)
+    if cached is not None:
+        return cached[0], cached[1], True
+    version = result_cache.version if result_cache is not None else None
+    rows, columns = await fetch_parameterized(sql_query, deadline)
+    if result_cache is not None:
+        result_cache.put(sql_query, None, rows, columns, version)
+    return rows, columns, False
+
+
+async def _fetch_parameterized(sql_query, deadline):
+    """Выполнение по форме запроса с параметрами $1..$n"""
+    started = time.perf_counter()
+    if not config.DB_PREPARED_STATEMENTS:
+        rows, columns = await fetch_query(sql_query, deadline)
+    else:
+        shape, params = parameterize(sql_query)
+        try:
+            rows, columns = await fetch_query(shape, deadline, *params)
+        except asyncpg.exceptions.DataError:
+            # Тип параметра не выводится из литерала (например, дата строкой) - выполняем как есть
+            rows, columns = await fetch_query(sql_query, deadline)
+    if workload_log is not None:
+        workload_log.record(sql_query, (time.perf_counter() - started) * 1000, len(rows))
+    return rows, columns
+
+
+def current_user_id():
+    """Пользователь для личной истории (cookie сессии); None - общая история"""
+    if not config.HISTORY_USERS_PATH:
+        return None
+    if 'uid' not in session:
+        session['uid'] = uuid.uuid4().hex
+    return session['uid']
+
+
+def recent_history(n=10):
+    return history_store.recent(n, current_user_id())
+
+
+def response_type(data):
+    """Тип ответа по Accept: строчный JSON или столбцовая кодировка (wire_format.py)"""
+    return negotiate(request.headers.get('Accept', ''), data.get('layout'))
+
+
+def response_encoding():
+    """Сжатие ответа по Accept-Encoding (None - без сжатия)"""
+    if not config.RESPONSE_COMPRESSION_ENABLED:
+        return None
+    return choose_encoding(request.headers.get('Accept-Encoding', ''))
+
+
+def encoded_response(payload, media_type):
+    """Ответ в выбранной кодировке; длинный - сжатый"""
+    min_bytes = config.RESPONSE_COMPRESS_MIN_BYTES if config.RESPONSE_COMPRESSION_ENABLED else None
+    body, headers = encode_body(payload, media_type, request.headers.get('Accept-Encoding'), min_bytes)
+    return Response(body, content_type=media_type, headers=headers)
+
+
+async def stream_rows(user_query, sql_query, result, deadline, estimate=None, columnar_layout=False,
+                      cached=None):
+    """
+    Потоковый ответ NDJSON через курсор asyncpg (columnar_layout - порции по
+    столбцам). cached - готовый результат из кэша (rows, columns). Запрос
+    подготавливается и первая порция читается до начала ответа, поэтому
+    ошибки SQL и прав доступа возвращаются обычным JSON.
+    """
+    stack = AsyncExitStack()
+    started = time.perf_counter()
+    if cached is not None:
+        rows, columns = cached
+        first_chunk, cursor = rows, None
+    else:
+        try:
+            timeout = deadline.remaining()
+            conn = await stack.enter_async_context(pool.acquire(timeout=timeout))
+            await stack.enter_async_context(conn.transaction(readonly=True))
+            await conn.execute(f"SET LOCAL statement_timeout = {statement_timeout_ms(timeout)}")
+            statement = await conn.prepare(sql_query)
+            columns = [attr.name for attr in statement.get_attributes()]
+            cursor = await statement.cursor()
+            first_chunk = await cursor.fetch(config.STREAM_CHUNK_ROWS, timeout=deadline.remaining())
+        except BaseException:
+            await stack.aclose()
+            raise
+    history = recent_history()
+
+    async def generate():
+        async with stack:
+            yield ndjson_line({
+                'type': 'meta',
+                'success': True,
+                'user_query': user_query,
+                'sql_query': sql_query,
+                'columns': columns,
+                'layout': 'columnar' if columnar_layout else 'rows',
+                'entities': result.get('entities', {}),
+                'cached': cached is not None,
+                'estimate': estimate,
+                'translation': result.get('translation'),
+                'history': history
+            })
+            row_count = 0
+            try:
+                if cursor is None:
+                    for start in range(0, len(first_chunk), config.STREAM_CHUNK_ROWS):
+                        chunk = first_chunk[start:start + config.STREAM_CHUNK_ROWS]
+                        row_count += len(chunk)
+                        yield rows_line(columns, chunk, columnar_layout)
+                else:
+                    chunk = first_chunk
+                    while chunk:
+                        row_count += len(chunk)
+                        yield rows_line(columns, chunk, columnar_layout)
+                        if len(chunk) < config.STREAM_CHUNK_ROWS:
+                            break
+                        chunk = await cursor.fetch(config.STREAM_CHUNK_ROWS, timeout=deadline.remaining())
+            except asyncio.TimeoutError:
+                QUERY_OUTCOMES.inc(outcome='timeout')
+                yield ndjson_line({'type': 'error', 'error': 'Превышено время выполнения запроса'})
+                return
+            except Exception as e:
+                logger.warning("❌ Ошибка потоковой выдачи: %s", e)
+                QUERY_OUTCOMES.inc(outcome='db_error')
+                yield ndjson_line({'type': 'error', 'error': f'Ошибка БД: {humanize_db_error(str(e))}'})
+                return
+            if workload_log is not None and cursor is not None:
+                workload_log.record(sql_query, (time.perf_counter() - started) * 1000, row_count)
+            QUERY_OUTCOMES.inc(outcome='ok')
+            ROWS_RETURNED.observe(row_count)
+            yield ndjson_line({'type': 'end', 'row_count': row_count})
+
+    encoding = response_encoding()
+    body = generate() if encoding is None else compress_stream_async(generate(), encoding)
+    response = Response(body, mimetype='application/x-ndjson', headers={'Vary': 'Accept, Accept-Encoding'})
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# ===== МЕТРИКИ =====
+def _pool_stats():
+    if pool is None:
+        return None
+    idle = pool.get_idle_size()
+    return {'idle': idle, 'in_use': pool.get_size() - idle}
+
+
+
+
+@app.before_request
+async def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+async def record_request_metrics(response):
+    """Счетчик и время ответа по шаблону маршрута (для потока - до начала тела)"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    return response
+
+
+if config.METRICS_ENABLED:
+    @app.route('/metrics', methods=['GET'])
+    async def metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+# ===== МАРШРУТЫ =====
+@app.route('/')
+async def index():
+    """Главная страница"""
+    return await render_template('index.html',
+                                 query_history=recent_history(),
+                                 title="Text2SQL")
+
+
+@app.route('/api/query', methods=['POST'])
+async def process_query():
+    """Обработка запроса от пользователя с LLM"""
+    timings = StageTimings()
+    try:
+        data = await request.get_json()
+        user_query = data.get('query', '').strip()
+
+        if not user_query:
+            return jsonify({
+                'success': False,
+                'error': 'Пустой запрос'
+            })
+
+        deadline = Deadline(config.ASYNC_REQUEST_TIMEOUT)
+
+        # 1. ОБНОВЛЯЕМ ИСТОРИЮ
+        history_store.add(user_query, current_user_id())
+        timings.mark('history')
+
+        # 2. КОНВЕРТИРУЕМ NL -> SQL
+        result, shared = await convert_query(user_query, deadline)
+        timings.mark('translate')
+        if not result['success']:
+            logger.warning("❌ Ошибка LLM: %s, использую fallback запрос", result.get('error'))
+            result = {
+                'success': True,
+                'sql_query': FALLBACK_SQL,
+                'entities': {},
+                'lemmas': []
+            }
+        sql_query = result['sql_query']
+
+        # 3. ПРОВЕРКА SQL: один SELECT по разрешенным таблицам, LIMIT
+        try:
+            sql_query = sql_validator.validate(sql_query)['sql']
+            timings.mark('validate')
+        except SQLValidationError as e:
+            logger.info("⚠️  SQL отклонен: %s", e)
+            QUERY_OUTCOMES.inc(outcome='rejected')
+            return jsonify({
+                'success': False,
+                'error': f'Запрос отклонен: {e}',
+                'sql_query': sql_query,
+                'user_query': user_query,
+                'history': recent_history()
+            })
+
+        # 4. ВЫПОЛНЯЕМ SQL-ЗАПРОС В БД
+        estimate = None
+        try:
+            sql_query, estimate = await check_plan(sql_query, deadline)
+            timings.mark('plan')
+            if data.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', ''):
+                # Готовый результат берем из кэша, иначе читаем курсором
+                # (такие результаты в кэш не попадают)
+                return await stream_rows(user_query, sql_query, result, deadline, estimate,
+                                         columnar_layout=response_type(data) != JSON,
+                                         cached=await cached_result(sql_query))
+            rows, columns, from_cache = await fetch_results(sql_query, deadline)
+            timings.mark('execute')
+        except asyncio.TimeoutError:
+            raise
+        except QueryCostError as e:
+            logger.info("⚠️  SQL отклонен по оценке плана: %s", e)
+            QUERY_OUTCOMES.inc(outcome='too_expensive')
+            return jsonify({
+                'success': False,
+                'error': f'Запрос отклонен: {e}',
+                'sql_query': sql_query,
+                'estimate': e.estimate,
+                'user_query': user_query,
+                'history': recent_history()
+            })
+        except Exception as db_error:
+            error_msg = humanize_db_error(str(db_error))
+            logger.warning("❌ Ошибка выполнения SQL: %s", db_error)
+            QUERY_OUTCOMES.inc(outcome='db_error')
+            return jsonify({
+                'success': False,
+                'error': f'Ошибка БД: {error_msg}',
+                'sql_query': sql_query,
+                'user_query': user_query,
+                'history': recent_history()
+            })
+
+        # Выполнившийся перевод LLM пополняет библиотеку примеров для промпта
+        # (один раз на общий перевод)
+        if result.get('source') == 'llm' and not shared:
+            await asyncio.get_running_loop().run_in_executor(
+                None, converter.remember_example, user_query, sql_query
+            )
+
+        # 5. ФОРМАТИРУЕМ РЕЗУЛЬТАТЫ (строками или по столбцам - по Accept)
+        media_type = response_type(data)
+        body = result_body(columns, rows, columnar_layout=media_type != JSON)
+        timings.mark('format')
+
+        logger.info("🔍 '%s' -> %s: %s строк%s", user_query, sql_query, len(rows),
+                    ' (из кэша)' if from_cache else '')
+        QUERY_OUTCOMES.inc(outcome='ok')
+        ROWS_RETURNED.observe(len(rows))
+
+        payload = {
+            'success': True,
+            'user_query': user_query,
+            'sql_query': sql_query,
+            'columns': columns,
+            'row_count': len(rows),
+            'entities': result.get('entities', {}),
+            'cached': from_cache,
+            'estimate': estimate,
+            'translation': result.get('translation'),
+            'timings': timings.as_dict(),
+            'history': recent_history()
+        }
+        payload.update(body)
+        response = encoded_response(payload, media_type)
+        timings.mark('serialize')
+        return response
+
+    except asyncio.TimeoutError:
+        QUERY_OUTCOMES.inc(outcome='timeout')
+        return jsonify({
+            'success': False,
+            'error': f'Превышено время обработки запроса ({config.ASYNC_REQUEST_TIMEOUT:g} с)',
+            'history': recent_history()
+        })
+    except Exception as e:
+        logger.exception("💥 Критическая ошибка в process_query: %s", e)
+        QUERY_OUTCOMES.inc(outcome='error')
+        return jsonify({
+            'success': False,
+            'error': f'Внутренняя ошибка сервера: {str(e)}',
+            'history': recent_history()
+        })
+
+
+@app.route('/api/history', methods=['GET'])
+async def get_history():
+    """Получение истории запросов"""
+    return jsonify({
+        'success': True,
+        'history': recent_history(15)
+    })
+
+
+@app.route('/api/history/clear', methods=['POST'])
+async def clear_history():
+    """Очистка истории запросов"""
+    history_store.clear(current_user_id())
+    return jsonify({
+        'success': True,
+        'message': 'История очищена',
+        'history': recent_history()
+    })
+
+
+@app.route('/api/sample_queries', methods=['GET'])
+async def get_sample_queries():
+    """Примеры запросов для быстрого выбора"""
+    return jsonify({'success': True, 'samples': SAMPLE_QUERIES})
+
+
+@app.route('/api/db_info', methods=['GET'])
+async def get_db_info():
+    """
+    Информация о базе данных из снимка (один запрос на версию данных).
+    ETag позволяет браузеру не скачивать неизменившийся ответ.
+    """
+    try:
+        deadline = Deadline(config.ASYNC_REQUEST_TIMEOUT)
+        try:
+            version = await asyncio.get_running_loop().run_in_executor(None, data_version.current)
+        except Exception as e:
+            logger.warning("⚠️  Версия данных недоступна, снимок пересчитывается: %s", e)
+            version = None
+
+        snapshot = db_info_snapshot.current(version)
+        if snapshot is None:
+            rows, _ = await fetch_query(DB_INFO_QUERY, deadline)
+            snapshot = db_info_snapshot.update(version, rows)
+        body, etag = snapshot
+
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag_matches(request.headers.get('If-None-Match'), etag):
+            return Response(b'', status=304, headers=headers)
+        return Response(body, mimetype='application/json', headers=headers)
+    except Exception as e:
+        logger.error("Ошибка получения информации о БД: %s", e)
+        return jsonify({
+            'success': False,
+            'error': f'Не удалось получить информацию о БД: {str(e)}'
+        })
+
+
+@app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Проверка работоспособности системы"""
+    try:
+        db_ok = False
+        try:
+            await fetch_query("SELECT 1;", Deadline(config.ASYNC_HEALTH_TIMEOUT))
+            db_ok = True
+        except Exception:
+            db_ok = False
+
+        return jsonify({
+            'success': True,
+            'status': {
+                'database': 'connected' if db_ok else 'disconnected',
+                'llm': converter.state,
+                'llm_status': converter.status(),
+                'history_count': len(history_store),
+                'history': history_store.stats(),
+                'db_pool': {
+                    'size': pool.get_size(),
+                    'idle': pool.get_idle_size(),
+                    'min_size': pool.get_min_size(),
+                    'max_size': pool.get_max_size(),
+                } if pool is not None else None,
+                'llm_batching': converter.inference_stats(),
+                'translation_cache': converter.cache_stats(),
+                'few_shot': converter.few_shot_stats(),
+                'sql_validator': sql_validator.stats(),
+                'query_planner': query_planner.stats(),
+                'result_cache': result_cache.stats() if result_cache else None,
+                'schema': schema_catalog.stats() if schema_catalog is not None else None,
+                'db_info': db_info_snapshot.stats(),
+                'single_flight': {
+                    'translate': translate_flight.stats(),
+                    'execute': execute_flight.stats(),
+                },
+                'workload_log': workload_log.stats() if workload_log else None,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
@@ -0,0 +1 @@
+# Бенчмарки Text2SQL. Запуск из корня проекта: python -m benchmarks.<имя_модуля>
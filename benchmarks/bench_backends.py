@@ -0,0 +1,132 @@
+# bench_backends.py - сравнение бэкендов LLM: скорость, задержка, память, совпадение ответов
+#
+# Каждый бэкенд запускается в отдельном процессе, чтобы пиковая резидентная
+# память не смешивалась между вариантами.
+import argparse
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+
+from config import config
+
+QUERIES = [
+    "Показать всех сотрудников",
+    "Сотрудники IT отдела",
+    "Найти менеджеров",
+    "Зарплата больше 150000",
+    "Средняя зарплата по отделам",
+    "Сколько сотрудников в отделе продаж",
+    "Сотрудники с зарплатой от 100000 до 200000",
+    "Отсортировать сотрудников по фамилии",
+]
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _peak_rss_mb():
+    # ru_maxrss в Linux - килобайты, в macOS - байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_backend(backend, model_name, repeats, max_new_tokens):
+    """Замер одного бэкенда (выполняется в дочернем процессе)"""
+    from llm_sql_converter import LLMSQLConverter
+
+    config.LLM_MAX_NEW_TOKENS = max_new_tokens
+    started = time.perf_counter()
+    converter = LLMSQLConverter(model_name, backend=backend)
+    load_s = time.perf_counter() - started
+    if not converter.model_loaded:
+        return {'backend': backend, 'error': converter.load_error}
+    converter.engine.shutdown()
+
+    tokenizer = converter.tokenizer
+    latencies = []
+    new_tokens = 0
+    outputs = {}
+
+    # Прогрев
+    converter._generate_batch([converter._prompt_suffix(QUERIES[0])])
+
+    for query in QUERIES:
+        suffix = converter._prompt_suffix(query)
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            text = converter._generate_batch([suffix])[0]
+            latencies.append((time.perf_counter() - t0) * 1000)
+        # Генерация возвращает только новые токены
+        new_tokens += len(tokenizer(text).input_ids) * repeats
+        outputs[query] = text
+
+    total_s = sum(latencies) / 1000
+    return {
+        'backend': converter.backend_name,
+        'requested': backend,
+        'load_s': round(load_s, 2),
+        'tokens_per_s': round(new_tokens / total_s, 1) if total_s else 0.0,
+        'p50_ms': round(statistics.median(latencies), 1),
+        'p95_ms': round(_percentile(latencies, 0.95), 1),
+        'peak_rss_mb': _peak_rss_mb(),
+        'outputs': outputs,
+    }
+
+
+def _worker(args, queue):
+    queue.put(run_backend(*args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк бэкендов LLM на CPU")
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--backends", default="fp32,bf16,int8,onnx")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--strict", action="store_true",
+                        help="код возврата 1, если ответы бэкенда отличаются от fp32")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in args.backends.split(','):
+        queue = ctx.Queue()
+        process = ctx.Process(target=_worker,
+                              args=((backend.strip(), args.model, args.repeats, args.max_new_tokens), queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    baseline = next((r for r in results if r.get('backend') == 'fp32' and 'outputs' in r), None)
+    mismatched = False
+
+    print(f"{'бэкенд':<8} {'токен/с':>9} {'p50, мс':>9} {'p95, мс':>9} {'RSS, МБ':>9} {'совпадение':>11}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['backend']:<8} ошибка загрузки: {r['error']}")
+            continue
+        same = '-'
+        if baseline is not None:
+            matches = sum(r['outputs'][q] == baseline['outputs'][q] for q in QUERIES)
+            same = f"{matches}/{len(QUERIES)}"
+            r['matches_fp32'] = matches
+            mismatched |= matches != len(QUERIES)
+        print(f"{r['backend']:<8} {r['tokens_per_s']:>9} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+              f"{r['peak_rss_mb']:>9} {same:>11}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.strict and mismatched:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
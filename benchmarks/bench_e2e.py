@@ -0,0 +1,325 @@
+# bench_e2e.py - сквозной бенчмарк: /api/query и /api/db_info под фиксированной конкурентностью
+#
+# По умолчанию сам поднимает заглушку модели (benchmarks/stub_worker.py) и
+# веб-сервер (app.py или asgi_app.py) с LLM_WORKER_SOCKET на нее; база - из
+# .env (заполняется через python -m benchmarks.workload load). С --url
+# нагружает уже запущенный сервер.
+#
+#   python -m benchmarks.bench_e2e --server asgi --concurrency 1,8,32 --output run.json
+#   python -m benchmarks.bench_e2e --server asgi --compare baseline.json --output run.json
+#
+# Результат: пропускная способность, p50/p95/p99 полного ответа и каждого
+# этапа (поле timings ответа /api/query), пиковая RSS сервера и заглушки.
+# --compare сравнивает с прошлым прогоном и завершается с кодом 1 при регрессии.
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.workload import build_queries
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _summary(values):
+    if not values:
+        return None
+    return {
+        'count': len(values),
+        'p50_ms': round(_percentile(values, 0.50), 2),
+        'p95_ms': round(_percentile(values, 0.95), 2),
+        'p99_ms': round(_percentile(values, 0.99), 2),
+        'max_ms': round(max(values), 2),
+    }
+
+
+def _peak_rss_mb(pid):
+    """Пиковая резидентная память процесса (VmHWM), МБ"""
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _own_peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# ===== HTTP =====
+def _request(url, payload=None, timeout=60):
+    """(время ответа в мс, разобранный JSON или None, код ответа)"""
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    headers = {'Content-Type': 'application/json'} if data is not None else {}
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers),
+                                    timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        body, status = e.read(), e.code
+    elapsed = (time.perf_counter() - started) * 1000
+    try:
+        return elapsed, json.loads(body), status
+    except ValueError:
+        return elapsed, None, status
+
+
+def wait_ready(base_url, timeout):
+    """Ожидание ответа /api/health с подключенной моделью"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, body, _ = _request(base_url + '/api/health', timeout=2)
+            status = (body or {}).get('status') or {}
+            if status.get('llm') in ('ready', 'failed'):
+                return status
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Сервер {base_url} не ответил за {timeout:g} с")
+
+
+# ===== ПРОЦЕССЫ =====
+class Stand:
+    """Заглушка модели и веб-сервер в дочерних процессах"""
+
+    def __init__(self, server, port, token_ms, prefill_ms, force_llm=False, no_cache=False, log_path=None):
+        self.workdir = tempfile.mkdtemp(prefix='text2sql-bench-')
+        self.socket = os.path.join(self.workdir, 'llm.sock')
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.log = open(log_path or os.path.join(self.workdir, 'server.log'), 'w')
+
+        env = dict(os.environ)
+        env.update({
+            'LLM_WORKER_SOCKET': self.socket,
+            'LLM_WORKER_AUTHKEY': os.environ.get('LLM_WORKER_AUTHKEY') or secrets.token_hex(16),
+            'HISTORY_PATH': os.path.join(self.workdir, 'history.json'),
+            'WORKLOAD_LOG_PATH': '',
+            'TRANSLATION_CACHE_PATH': '',
+            'PYTHONUNBUFFERED': '1',
+        })
+        if force_llm:
+            # Правила никогда не "уверены" - каждый промах кэша идет в заглушку
+            env['RULE_CONFIDENCE_THRESHOLD'] = '2'
+        if no_cache:
+            env['TRANSLATION_CACHE_SIZE'] = '0'
+            env['RESULT_CACHE_ENABLED'] = 'false'
+
+        self.stub = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.stub_worker', '--socket', self.socket,
+             '--token-ms', str(token_ms), '--prefill-ms', str(prefill_ms)],
+            env=env, stdout=self.log, stderr=subprocess.STDOUT
+        )
+        if server == 'asgi':
+            command = [sys.executable, '-m', 'uvicorn', 'asgi_app:app',
+                       '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+        else:
+            command = [sys.executable, '-m', 'flask', '--app', 'app', 'run',
+                       '--host', '127.0.0.1', '--port', str(port), '--with-threads']
+        self.server = subprocess.Popen(command, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def peak_rss(self):
+        return {
+            'server_mb': _peak_rss_mb(self.server.pid),
+            'stub_mb': _peak_rss_mb(self.stub.pid),
+        }
+
+    def stop(self):
+        for process in (self.server, self.stub):
+            process.terminate()
+        for process in (self.server, self.stub):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.log.close()
+
+
+# ===== НАГРУЗКА =====
+def run_level(base_url, queries, concurrency, requests, db_info_share, seed, timeout):
+    """Один уровень конкурентности: requests запросов в concurrency потоков"""
+    rng = random.Random(seed)
+    plan = [('db_info', None) if rng.random() < db_info_share else ('query', rng.choice(queries))
+            for _ in range(requests)]
+
+    lock = threading.Lock()
+    latencies = {'query': [], 'db_info': []}
+    stages = {}
+    winners = Counter()
+    errors = Counter()
+
+    def one(item):
+        kind, query = item
+        try:
+            if kind == 'query':
+                elapsed, body, status = _request(base_url + '/api/query', {'query': query}, timeout)
+            else:
+                elapsed, body, status = _request(base_url + '/api/db_info', timeout=timeout)
+        except OSError as e:
+            with lock:
+                errors[type(e).__name__] += 1
+            return
+        with lock:
+            latencies[kind].append(elapsed)
+            if status != 200 or not body or not body.get('success'):
+                errors[f'{kind}:{(body or {}).get("error") or status}'[:120]] += 1
+                return
+            for stage, value in (body.get('timings') or {}).items():
+                stages.setdefault(stage, []).append(value)
+            winner = (body.get('translation') or {}).get('winner')
+            if kind == 'query':
+                winners[winner or 'unknown'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, plan))
+    wall = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'seconds': round(wall, 3),
+        'throughput_rps': round(requests / wall, 2) if wall else None,
+        'errors': dict(errors),
+        'query': _summary(latencies['query']),
+        'db_info': _summary(latencies['db_info']),
+        'stages': {stage: _summary(values) for stage, values in sorted(stages.items())},
+        'translation_winners': dict(winners),
+    }
+
+
+# ===== СРАВНЕНИЕ =====
+def compare(baseline, current, tolerance):
+    """Регрессии относительно прошлого прогона: список строк (пусто - все в норме)"""
+    regressions = []
+    before = {level['concurrency']: level for level in baseline.get('levels', [])}
+    for level in current.get('levels', []):
+        old = before.get(level['concurrency'])
+        if old is None:
+            continue
+        prefix = f"c={level['concurrency']}"
+        if old.get('throughput_rps') and level.get('throughput_rps') is not None:
+            if level['throughput_rps'] < old['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"{prefix} throughput {old['throughput_rps']} -> {level['throughput_rps']} rps")
+
+        pairs = [('query', old.get('query'), level.get('query')),
+                 ('db_info', old.get('db_info'), level.get('db_info'))]
+        pairs += [(f'stage {stage}', (old.get('stages') or {}).get(stage), summary)
+                  for stage, summary in (level.get('stages') or {}).items()]
+        for name, old_summary, new_summary in pairs:
+            if not old_summary or not new_summary:
+                continue
+            # Доли миллисекунды - шум, такие этапы не сравниваем
+            if old_summary['p95_ms'] >= 1 and new_summary['p95_ms'] > old_summary['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{prefix} {name} p95 {old_summary['p95_ms']} -> {new_summary['p95_ms']} ms")
+
+    for name, old_rss in (baseline.get('peak_rss') or {}).items():
+        new_rss = (current.get('peak_rss') or {}).get(name)
+        if old_rss and new_rss and new_rss > old_rss * (1 + tolerance):
+            regressions.append(f"peak RSS {name} {old_rss} -> {new_rss} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк /api/query и /api/db_info")
+    parser.add_argument('--url', default=None, help="уже запущенный сервер (без заглушки и запуска)")
+    parser.add_argument('--server', choices=['flask', 'asgi'], default='asgi')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--concurrency', default='1,4,16', help="уровни через запятую")
+    parser.add_argument('--requests', type=int, default=200, help="запросов на уровень")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500, help="размер набора вопросов")
+    parser.add_argument('--db-info-share', type=float, default=0.2, help="доля запросов к /api/db_info")
+    parser.add_argument('--token-ms', type=float, default=20.0)
+    parser.add_argument('--prefill-ms', type=float, default=30.0)
+    parser.add_argument('--force-llm', action='store_true', help="каждый промах кэша - в модель")
+    parser.add_argument('--no-cache', action='store_true', help="без кэша переводов и результатов")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="JSON с результатами")
+    parser.add_argument('--compare', default=None, help="JSON прошлого прогона")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="допустимое ухудшение (доля)")
+    args = parser.parse_args()
+
+    stand = None
+    base_url = args.url.rstrip('/') if args.url else None
+    if base_url is None:
+        stand = Stand(args.server, args.port, args.token_ms, args.prefill_ms,
+                      force_llm=args.force_llm, no_cache=args.no_cache)
+        base_url = stand.base_url
+        print(f"Логи стенда: {stand.log.name}", file=sys.stderr)
+
+    try:
+        health = wait_ready(base_url, timeout=120)
+        queries = build_queries(args.queries, args.seed)
+        if args.warmup:
+            run_level(base_url, queries, 1, args.warmup, args.db_info_share, args.seed - 1, args.timeout)
+
+        levels = []
+        for concurrency in [int(c) for c in args.concurrency.split(',') if c.strip()]:
+            level = run_level(base_url, queries, concurrency, args.requests,
+                              args.db_info_share, args.seed + concurrency, args.timeout)
+            levels.append(level)
+            query = level['query'] or {}
+            print(f"c={concurrency:<4} {level['throughput_rps']:>8} rps  "
+                  f"p50 {query.get('p50_ms')} / p95 {query.get('p95_ms')} / p99 {query.get('p99_ms')} ms  "
+                  f"ошибок: {sum(level['errors'].values())}", file=sys.stderr)
+
+        result = {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'database': health.get('database'),
+            'llm': health.get('llm'),
+            'levels': levels,
+            'peak_rss': dict(stand.peak_rss() if stand else {}, driver_mb=_own_peak_rss_mb()),
+        }
+        if stand is not None:
+            _, final, _ = _request(base_url + '/api/health', timeout=5)
+            status = (final or {}).get('status') or {}
+            result['server_stats'] = {key: status.get(key) for key in
+                                      ('llm_batching', 'translation_cache', 'result_cache', 'db_pool', 'db_info')}
+    finally:
+        if stand is not None:
+            stand.stop()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(json.load(f), result, args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("✅ Регрессий нет", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
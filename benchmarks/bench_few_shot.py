@@ -0,0 +1,104 @@
+# bench_few_shot.py - задержка поиска примеров (flat/IVF) и время загрузки индекса
+import argparse
+import json
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from few_shot import FewShotIndex
+
+DEPARTMENTS = ['IT', 'Маркетинг', 'Финансы', 'Продажи', 'HR', 'Логистика', 'Закупки', 'Руководство']
+POSITIONS = ['менеджеры', 'разработчики', 'аналитики', 'бухгалтеры', 'инженеры', 'дизайнеры']
+TEMPLATES = [
+    ("Сотрудники отдела {dept} с зарплатой больше {n}",
+     "SELECT * FROM employees WHERE department = '{dept}' AND salary > {n};"),
+    ("Сколько {pos} в отделе {dept}",
+     "SELECT COUNT(*) FROM employees WHERE department = '{dept}' AND position ILIKE '%{pos}%';"),
+    ("Средняя зарплата {pos} принятых после {year} года",
+     "SELECT AVG(salary) FROM employees WHERE position ILIKE '%{pos}%' AND hire_date > DATE '{year}-12-31';"),
+    ("Топ {k} {pos} по зарплате в {dept}",
+     "SELECT * FROM employees WHERE department = '{dept}' ORDER BY salary DESC LIMIT {k};"),
+]
+QUERIES = [
+    "Сотрудники IT отдела с зарплатой выше 150000",
+    "Сколько аналитиков работает в финансах",
+    "Средняя зарплата инженеров",
+    "Топ 10 менеджеров по зарплате",
+]
+
+
+def synthetic_examples(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        question, sql = rng.choice(TEMPLATES)
+        values = {
+            'dept': rng.choice(DEPARTMENTS),
+            'pos': rng.choice(POSITIONS),
+            'n': rng.randrange(50, 400) * 1000,
+            'year': rng.randrange(2010, 2024),
+            'k': rng.randrange(3, 20),
+        }
+        # Номер делает вопросы уникальными, как в реальной библиотеке
+        yield question.format(**values) + f" #{i}", sql.format(**values)
+
+
+def bench_search(index, repeats):
+    timings = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query, 3)
+            timings.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(timings)
+    return round(statistics.median(ordered), 3), round(ordered[int(len(ordered) * 0.95)], 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк индекса few-shot примеров")
+    parser.add_argument("--examples", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="few_shot_bench_")
+    try:
+        seed_path = f"{workdir}/seed.jsonl"
+        with open(seed_path, 'w', encoding='utf-8') as f:
+            for question, sql in synthetic_examples(args.examples):
+                f.write(json.dumps({'question': question, 'sql': sql}, ensure_ascii=False) + '\n')
+
+        results = {}
+        for mode in ('flat', 'ivf'):
+            index_dir = f"{workdir}/{mode}"
+            started = time.perf_counter()
+            FewShotIndex(index_dir, seed_path=seed_path, mode=mode)
+            build_s = time.perf_counter() - started
+
+            # Повторное открытие: эмбеддинги берутся с диска через mmap
+            started = time.perf_counter()
+            index = FewShotIndex(index_dir, mode=mode)
+            load_s = time.perf_counter() - started
+
+            p50, p95 = bench_search(index, args.repeats)
+            results[mode] = index
+            print(f"{mode:<5} сборка {build_s:6.2f} с, загрузка {load_s * 1000:7.1f} мс, "
+                  f"поиск p50 {p50} мс, p95 {p95} мс")
+
+        # Полнота IVF относительно полного перебора
+        hits = total = 0
+        for query in QUERIES:
+            exact = {e['question'] for _, e in results['flat'].search(query, 10)}
+            approx = {e['question'] for _, e in results['ivf'].search(query, 10)}
+            hits += len(exact & approx)
+            total += len(exact)
+        print(f"recall@10 IVF: {hits / total:.2f} (nprobe={results['ivf'].nprobe}, "
+              f"списков {int(np.sqrt(args.examples))})")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# bench_prefix_cache.py - сравнение задержки с кэшем префикса промпта и без него
+import argparse
+import statistics
+import time
+
+import torch
+
+from config import config
+from llm_sql_converter import LLMSQLConverter
+
+QUERIES = [
+    "Показать всех сотрудников",
+    "Сотрудники IT отдела",
+    "Найти менеджеров",
+    "Зарплата больше 150000",
+    "Средняя зарплата в отделе продаж",
+]
+
+
+def _timed(fn, repeats):
+    """Время выполнения fn (мс) на каждом повторе"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def _summary(timings):
+    ordered = sorted(timings)
+    return {
+        'p50_ms': round(statistics.median(ordered), 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        'mean_ms': round(statistics.fmean(ordered), 2),
+    }
+
+
+def bench_prefill(converter, repeats):
+    """Только прямой проход по промпту (prefill), без генерации"""
+    tokenizer, model, device = converter.tokenizer, converter.model, converter.device
+    prefix_ids, prefix_past = converter._prefix_ids, converter._prefix_past
+    cold, cached = [], []
+
+    for query in QUERIES:
+        full_ids = tokenizer(converter._build_prompt(query), return_tensors="pt").input_ids.to(device)
+        suffix_ids = tokenizer(
+            converter._prompt_suffix(query), return_tensors="pt", add_special_tokens=False
+        ).input_ids.to(device)
+        mask = torch.ones((1, prefix_ids.shape[1] + suffix_ids.shape[1]), dtype=torch.long, device=device)
+
+        with torch.no_grad():
+            cold += _timed(lambda: model(input_ids=full_ids, use_cache=True), repeats)
+            cached += _timed(
+                lambda: model(input_ids=suffix_ids, past_key_values=prefix_past,
+                              attention_mask=mask, use_cache=True),
+                repeats
+            )
+    return cold, cached
+
+
+def bench_generate(converter, repeats):
+    """Полная генерация одного запроса"""
+    cold, cached = [], []
+    prefix = converter._prompt_prefix()
+    for query in QUERIES:
+        suffix = converter._prompt_suffix(query)
+        cold += _timed(lambda: converter._generate_full([prefix + suffix]), repeats)
+        cached += _timed(
+            lambda: converter._generate_from_prefix([suffix], converter._prefix_ids, converter._prefix_past),
+            repeats
+        )
+    return cold, cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк кэша префикса промпта")
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-new-tokens", type=int, default=16,
+                        help="длина генерации для сквозного замера")
+    args = parser.parse_args()
+
+    config.LLM_MAX_NEW_TOKENS = args.max_new_tokens
+    config.LLM_PREFIX_CACHE = True
+    converter = LLMSQLConverter(args.model)
+    if not converter.model_loaded:
+        raise SystemExit("Модель не загружена - бенчмарк невозможен")
+    converter.engine.shutdown()
+
+    print(f"Длина префикса: {converter._prefix_ids.shape[1]} токенов")
+
+    # Прогрев
+    bench_prefill(converter, 1)
+
+    for name, bench in (("prefill", bench_prefill), ("generate", bench_generate)):
+        cold, cached = bench(converter, args.repeats)
+        cold_s, cached_s = _summary(cold), _summary(cached)
+        speedup = cold_s['p50_ms'] / cached_s['p50_ms'] if cached_s['p50_ms'] else float('inf')
+        print(f"\n{name}:")
+        print(f"   без кэша:  {cold_s}")
+        print(f"   с кэшем:   {cached_s}")
+        print(f"   ускорение (p50): x{speedup:.2f}")
+
+
+if __name__ == '__main__':
+    main()
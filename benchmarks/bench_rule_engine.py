@@ -0,0 +1,130 @@
+# bench_rule_engine.py - сравнение табличного движка правил с прежней цепочкой if/elif
+import argparse
+import re
+import time
+
+from rule_engine import RuleEngine
+
+QUERIES = [
+    "Показать всех сотрудников",
+    "Сотрудники IT отдела",
+    "Найти менеджеров",
+    "Зарплата больше 150000",
+    "всех сотрудников с зарплатой меньше 150000",
+    "зарплата от 100000 до 200000",
+    "Средняя зарплата",
+    "Сколько сотрудников в ИТ",
+    "сколько менеджеров в продажах с зарплатой выше 120000",
+    "отсортировать по зарплате по убыванию",
+    "упорядочить по фамилии",
+    "средняя зарплата по отделам",
+    "что-то совсем непонятное",
+]
+
+
+def legacy_fallback_sql(query):
+    """Прежняя цепочка if/elif из LLMSQLConverter._fallback_sql (для сравнения)"""
+    query_lower = query.lower()
+
+    # Извлекаем число
+    numbers = re.findall(r'\d+', query)
+    amount = numbers[0] if numbers else None
+
+    # Определяем оператор
+    operator = None
+    if "больше" in query_lower or "выше" in query_lower or "свыше" in query_lower:
+        operator = ">"
+    elif "меньше" in query_lower or "ниже" in query_lower or "менее" in query_lower:
+        operator = "<"
+    elif "равно" in query_lower or "равен" in query_lower:
+        operator = "="
+    elif "от" in query_lower and "до" in query_lower:
+        # Обработка диапазона "от X до Y"
+        if numbers and len(numbers) >= 2:
+            return f"SELECT first_name, last_name, position, department, salary FROM employees WHERE salary BETWEEN {numbers[0]} AND {numbers[1]};"
+
+    # Основная логика
+    base_select = "SELECT first_name, last_name, position, department, salary"
+
+    if "все" in query_lower and "сотрудник" in query_lower:
+        if amount and operator:
+            # "всех сотрудников с зарплатой меньше 150000"
+            return f"{base_select} FROM employees WHERE salary {operator} {amount};"
+        else:
+            return "SELECT * FROM employees;"
+
+    elif "зарплат" in query_lower or "оклад" in query_lower or "доход" in query_lower:
+        if amount and operator:
+            return f"{base_select} FROM employees WHERE salary {operator} {amount};"
+        elif "средн" in query_lower:
+            return "SELECT AVG(salary) as avg_salary FROM employees;"
+        else:
+            return f"{base_select} FROM employees ORDER BY salary DESC LIMIT 10;"
+
+    elif "ит" in query_lower or "it" in query_lower:
+        if amount and operator and "зарплат" in query_lower:
+            # "ит с зарплатой больше X"
+            return f"{base_select} FROM employees WHERE department = 'IT' AND salary {operator} {amount};"
+        else:
+            return f"{base_select} FROM employees WHERE department = 'IT';"
+
+    elif "менеджер" in query_lower:
+        if amount and operator and "зарплат" in query_lower:
+            return f"{base_select} FROM employees WHERE position ILIKE '%менеджер%' AND salary {operator} {amount};"
+        else:
+            return f"{base_select} FROM employees WHERE position ILIKE '%менеджер%';"
+
+    elif "сортир" in query_lower or "упорядоч" in query_lower:
+        if "зарплат" in query_lower:
+            direction = "DESC" if "убыван" in query_lower else "ASC"
+            return f"{base_select} FROM employees ORDER BY salary {direction};"
+        elif "фамили" in query_lower:
+            return f"{base_select} FROM employees ORDER BY last_name ASC;"
+
+    elif "сколько" in query_lower or "количеств" in query_lower:
+        if "ит" in query_lower:
+            return "SELECT COUNT(*) as count FROM employees WHERE department = 'IT';"
+        elif "менеджер" in query_lower:
+            return "SELECT COUNT(*) as count FROM employees WHERE position ILIKE '%менеджер%';"
+        else:
+            return "SELECT COUNT(*) as count FROM employees;"
+
+    # Если ничего не подошло - возвращаем ограниченный набор
+    return "SELECT first_name, last_name, position, department, salary FROM employees LIMIT 10;"
+
+
+def _bench(fn, iterations):
+    """Среднее время одного вызова fn на наборе запросов (мкс)"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for query in QUERIES:
+            fn(query)
+    elapsed = time.perf_counter() - started
+    return elapsed / (iterations * len(QUERIES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк fallback-правил")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--show", action="store_true", help="показать SQL обеих реализаций")
+    args = parser.parse_args()
+
+    engine = RuleEngine()
+
+    legacy_us = _bench(legacy_fallback_sql, args.iterations)
+    engine_us = _bench(lambda q: engine.translate(q)['sql'], args.iterations)
+
+    same = sum(legacy_fallback_sql(q) == engine.translate(q)['sql'] for q in QUERIES)
+    print(f"if/elif:        {legacy_us:8.2f} мкс/запрос")
+    print(f"RuleEngine:     {engine_us:8.2f} мкс/запрос")
+    print(f"Совпадение SQL: {same}/{len(QUERIES)}")
+
+    if args.show:
+        for query in QUERIES:
+            print(f"\n{query}")
+            print(f"   if/elif:    {legacy_fallback_sql(query)}")
+            print(f"   RuleEngine: {engine.translate(query)['sql']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# bench_wire_format.py - размер и время сборки ответа /api/query по форматам
+#
+# Прежний ответ (строки-словари, зарплата строкой, jsonify: ensure_ascii и
+# sort_keys) против столбцового в JSON / msgpack / Arrow IPC, без сжатия
+# и со сжатием. Строки - синтетические employees в типах psycopg2 (Decimal, date).
+#
+#   python -m benchmarks.bench_wire_format --rows 10000
+import argparse
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import wire_format
+from benchmarks.workload import COLUMNS, synthetic_employees
+from query_service import result_body
+
+
+def legacy_format_row(columns, row):
+    """Прежний format_row из query_service.py (для сравнения)"""
+    row_dict = {}
+    for i, col in enumerate(columns):
+        value = row[i]
+        if isinstance(value, datetime):
+            row_dict[col] = value.strftime('%Y-%m-%d')
+        elif value is None:
+            row_dict[col] = None
+        elif isinstance(value, (int, float)):
+            if col == 'salary':
+                row_dict[col] = f"{value:,.2f}".replace(',', ' ').replace('.', ',')
+            else:
+                row_dict[col] = value
+        else:
+            row_dict[col] = str(value)
+    return row_dict
+
+
+def legacy_body(columns, rows):
+    # Настройки JSON-провайдера Flask по умолчанию
+    payload = {'results': [legacy_format_row(columns, row) for row in rows], 'columns': columns}
+    return json.dumps(payload, ensure_ascii=True, sort_keys=True).encode('utf-8')
+
+
+def columnar_body(media_type):
+    def build(columns, rows):
+        payload = {'columns': columns, 'row_count': len(rows)}
+        payload.update(result_body(columns, rows, columnar_layout=True))
+        return wire_format.encode(payload, media_type)
+    return build
+
+
+def _bench(build, columns, rows, iterations):
+    """(среднее время сборки тела, мс; тело)"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = build(columns, rows)
+    return (time.perf_counter() - started) / iterations * 1000, body
+
+
+def _compressed(body, encoding, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        compressed = wire_format.compress(body, encoding)
+    return (time.perf_counter() - started) / iterations * 1000, len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Размер и время сборки ответа по форматам")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    columns = list(COLUMNS)
+    # Как из psycopg2: NUMERIC -> Decimal
+    rows = [
+        row[:5] + (None if row[5] is None else Decimal(f'{row[5]:.2f}'),) + row[6:]
+        for row in synthetic_employees(args.rows, seed=args.seed)
+    ]
+
+    formats = [('строки, jsonify (прежний)', legacy_body),
+               ('столбцы, JSON', columnar_body(wire_format.COLUMNAR_JSON))]
+    if wire_format.msgpack is not None:
+        formats.append(('столбцы, msgpack', columnar_body(wire_format.MSGPACK)))
+    if wire_format.pyarrow is not None:
+        formats.append(('столбцы, Arrow IPC', columnar_body(wire_format.ARROW)))
+    encodings = ['gzip'] + (['br'] if wire_format.brotli is not None else [])
+
+    print(f"{args.rows} строк, {len(columns)} столбцов")
+    header = f"{'формат':28} {'сборка, мс':>11} {'размер, КБ':>11}"
+    for encoding in encodings:
+        header += f" {encoding + ', КБ':>10} {encoding + ', мс':>10}"
+    print(header)
+    baseline = None
+    for name, build in formats:
+        elapsed, body = _bench(build, columns, rows, args.iterations)
+        line = f"{name:28} {elapsed:11.1f} {len(body) / 1024:11.1f}"
+        for encoding in encodings:
+            compress_ms, size = _compressed(body, encoding, args.iterations)
+            line += f" {size / 1024:10.1f} {compress_ms:10.1f}"
+        if baseline is None:
+            baseline = (elapsed, len(body))
+        else:
+            line += f"   x{baseline[0] / elapsed:.1f} быстрее, x{baseline[1] / len(body):.1f} меньше"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# stub_worker.py - заглушка процесса генерации для сквозного бенчмарка
+#
+# Говорит по протоколу inference_worker.py, поэтому веб-воркер подключается
+# к ней как к настоящей модели (LLM_WORKER_SOCKET). Вместо модели - правила
+# (RuleEngine) и задержка: prefill_ms на запрос плюс token_ms на каждый
+# "сгенерированный" токен. Запросы собираются в батчи, как в
+# BatchingInferenceEngine: один батч генерируется за время самого длинного ответа.
+#
+#   python -m benchmarks.stub_worker --socket /tmp/text2sql-stub.sock --token-ms 20
+import argparse
+import os
+import queue
+import signal
+import threading
+import time
+from multiprocessing.connection import Listener, AuthenticationError
+
+from config import config
+from inference_batcher import InferenceRequest
+from inference_worker import _WorkerServer, _authkey, _private_socket_dir, _unlink
+from logging_setup import configure_logging
+from metrics import LLM_TOKENS
+from rule_engine import RuleEngine
+
+# Символов на токен в ответе (грубо, для SQL на BPE-токенизаторе)
+CHARS_PER_TOKEN = 4
+
+
+def question_from_prompt(prompt):
+    """Вопрос пользователя из суффикса промпта (после последнего 'Запрос:')"""
+    text = prompt.split('SQL (только запрос', 1)[0]
+    return text.rsplit('Запрос:', 1)[-1].strip()
+
+
+class StubEngine:
+    """Очередь батчей с задержкой вместо модели"""
+
+    def __init__(self, token_ms=20.0, prefill_ms=30.0, max_batch_size=8, max_new_tokens=200):
+        self.token_ms = token_ms
+        self.prefill_ms = prefill_ms
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.rules = RuleEngine(config.SUPPORTED_DEPARTMENTS)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.cancelled = 0
+        threading.Thread(target=self._run, name="stub-batcher", daemon=True).start()
+
+    def submit(self, prompt):
+        request = InferenceRequest(prompt)
+        self._queue.put(request)
+        return request
+
+    def _answer(self, prompt):
+        translated = self.rules.translate(question_from_prompt(prompt))
+        sql = translated['sql'] if translated else None
+        return sql or "SELECT first_name, last_name, department FROM employees;"
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [request for request in batch if not request.cancelled]
+            if not batch:
+                continue
+
+            answers = [self._answer(request.prompt) for request in batch]
+            counts = [min(self.max_new_tokens, len(sql) // CHARS_PER_TOKEN + 1) for sql in answers]
+            time.sleep((self.prefill_ms + max(counts) * self.token_ms) / 1000)
+            for count in counts:
+                LLM_TOKENS.observe(count)
+
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+            for request, sql in zip(batch, answers):
+                if request.cancelled:
+                    with self._lock:
+                        self.cancelled += 1
+                    continue
+                request.set_result(sql)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stub': True,
+                'token_ms': self.token_ms,
+                'prefill_ms': self.prefill_ms,
+                'requests': self.requests,
+                'batches': self.batches,
+                'cancelled': self.cancelled,
+                'avg_batch_size': round(self.requests / self.batches, 2) if self.batches else None,
+                'queue_depth': self._queue.qsize(),
+            }
+
+
+class StubConverter:
+    """То немногое от LLMSQLConverter, что нужно _WorkerServer"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.db_schema = None
+        self.schema_identifiers = None
+        self._grammar = None
+
+    def set_schema(self, db_schema, identifiers=None):
+        self.db_schema = db_schema
+        self.schema_identifiers = identifiers
+
+
+def serve(address, token_ms, prefill_ms, max_batch_size, authkey=None):
+    """Заглушка в одном процессе: справочный сокет и сокет генерации"""
+    authkey = _authkey(authkey)
+    _private_socket_dir(address)
+    converter = StubConverter(StubEngine(token_ms, prefill_ms, max_batch_size, config.LLM_MAX_NEW_TOKENS))
+    worker_address = f"{address}.0"
+
+    def stop(signum, frame):
+        for path in (address, worker_address):
+            _unlink(path)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    server = _WorkerServer(converter, worker_address, authkey)
+    threading.Thread(target=server.serve_forever, name="stub-worker", daemon=True).start()
+
+    _unlink(address)
+    listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    print(f"✅ Заглушка генерации готова: {address} (token_ms={token_ms}, prefill_ms={prefill_ms})")
+    while True:
+        try:
+            with listener.accept() as conn:
+                message = conn.recv()
+                if message[0] == 'workers':
+                    conn.send([worker_address])
+                elif message[0] == 'set_schema':
+                    converter.set_schema(message[1], message[2])
+                    conn.send(True)
+        except (OSError, EOFError, AuthenticationError) as e:
+            print(f"⚠️  Ошибка справочного сокета: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка процесса генерации для бенчмарка")
+    parser.add_argument('--socket', default='/tmp/text2sql-stub.sock')
+    parser.add_argument('--token-ms', type=float, default=20.0, help="задержка на токен ответа")
+    parser.add_argument('--prefill-ms', type=float, default=30.0, help="задержка на батч до первого токена")
+    parser.add_argument('--batch-size', type=int, default=config.LLM_BATCH_MAX_SIZE)
+    parser.add_argument('--authkey', default=None)
+    args = parser.parse_args()
+    configure_logging(config.LOG_LEVEL, config.LOG_SAMPLE_RATE)
+    serve(args.socket, args.token_ms, args.prefill_ms, args.batch_size, args.authkey)
+
+
+if __name__ == '__main__':
+    main()
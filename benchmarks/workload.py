@@ -0,0 +1,191 @@
+# workload.py - нагрузка для сквозного бенчмарка: вопросы и синтетическая таблица employees
+#
+# Вопросы: история (query_history.json), примеры /api/sample_queries и шаблоны
+# с подстановкой отделов, должностей и порогов из тестовых данных.
+# Данные: строки data/insert_test_data.sql, размноженные до нужного числа
+# (имена, отделы и должности - из исходных строк, зарплата и дата приема - со
+# случайным сдвигом). Загрузка - через COPY, пачками.
+#
+#   python -m benchmarks.workload load --rows 1000000 --reset
+#   python -m benchmarks.workload queries --count 200
+import argparse
+import io
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import date, timedelta
+
+from query_service import SAMPLE_QUERIES
+
+SEED_DATA_PATH = os.path.join('data', 'insert_test_data.sql')
+HISTORY_PATH = 'query_history.json'
+
+COLUMNS = ('first_name', 'last_name', 'patronymic', 'department', 'position', 'salary', 'hire_date', 'email')
+
+# Шаблоны вопросов: часть переводится правилами, часть уходит в LLM
+TEMPLATES = [
+    "Сотрудники отдела {dept}",
+    "Сотрудники {dept} с зарплатой больше {n}",
+    "Зарплата больше {n}",
+    "Зарплата меньше {n}",
+    "Найти {pos}",
+    "Сколько сотрудников в отделе {dept}",
+    "Средняя зарплата в отделе {dept}",
+    "Сотрудники, принятые после {year} года",
+    "Топ {k} сотрудников по зарплате в {dept}",
+    "Сотрудники с зарплатой от {n} до {m}",
+]
+POSITION_WORDS = ['менеджеров', 'разработчиков', 'аналитиков', 'бухгалтеров', 'инженеров', 'дизайнеров']
+
+_ROW = re.compile(r"\(('(?:[^']|'')*'(?:\s*,\s*(?:'(?:[^']|'')*'|[\d.]+|NULL))*)\)")
+_VALUE = re.compile(r"'((?:[^']|'')*)'|([\d.]+)|NULL")
+
+
+def seed_rows(path=SEED_DATA_PATH):
+    """Строки INSERT из тестовых данных как кортежи в порядке COLUMNS"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    rows = []
+    for match in _ROW.finditer(text):
+        values = []
+        for value in _VALUE.finditer(match.group(1)):
+            if value.group(1) is not None:
+                values.append(value.group(1).replace("''", "'"))
+            elif value.group(2) is not None:
+                values.append(value.group(2))
+            else:
+                values.append(None)
+        if len(values) == len(COLUMNS):
+            rows.append(tuple(values))
+    return rows
+
+
+def synthetic_employees(count, seed=0, rows=None):
+    """count строк employees на основе тестовых данных (детерминированно по seed)"""
+    rng = random.Random(seed)
+    rows = rows or seed_rows()
+    first_names = sorted({row[0] for row in rows})
+    last_names = sorted({row[1] for row in rows})
+    patronymics = sorted({row[2] for row in rows if row[2]})
+    roles = sorted({(row[3], row[4]) for row in rows})
+    salaries = {}
+    for row in rows:
+        if row[5] is not None:
+            salaries.setdefault(row[3], []).append(float(row[5]))
+
+    start = date(2010, 1, 1)
+    for i in range(count):
+        department, position = rng.choice(roles)
+        base = rng.choice(salaries.get(department) or [100000.0])
+        last_name = rng.choice(last_names)
+        yield (
+            rng.choice(first_names),
+            last_name,
+            rng.choice(patronymics) if rng.random() < 0.9 else None,
+            department,
+            position,
+            # Около 2% без зарплаты - как NULL в реальных данных
+            round(base * rng.uniform(0.7, 1.3), -2) if rng.random() > 0.02 else None,
+            start + timedelta(days=rng.randrange(5000)),
+            f"user{i}@company.com",
+        )
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def load_employees(db, count, seed=0, batch=50000, reset=False, analyze=True):
+    """
+    Загрузка count синтетических строк в employees через COPY.
+    reset - очистить таблицу перед загрузкой (TRUNCATE ... RESTART IDENTITY).
+    """
+    started = time.perf_counter()
+    loaded = 0
+    with db.connection() as conn:
+        with conn.cursor() as cursor:
+            if reset:
+                cursor.execute("TRUNCATE employees RESTART IDENTITY")
+            buffer = io.StringIO()
+            for row in synthetic_employees(count, seed):
+                buffer.write('\t'.join(_copy_value(value) for value in row))
+                buffer.write('\n')
+                loaded += 1
+                if loaded % batch == 0 or loaded == count:
+                    buffer.seek(0)
+                    cursor.copy_expert(f"COPY employees ({', '.join(COLUMNS)}) FROM STDIN", buffer)
+                    buffer = io.StringIO()
+                    print(f"   загружено {loaded}/{count}", file=sys.stderr)
+            conn.commit()
+            if analyze:
+                cursor.execute("ANALYZE employees")
+                conn.commit()
+    return {'rows': loaded, 'seconds': round(time.perf_counter() - started, 2)}
+
+
+def history_queries(path=HISTORY_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        return [q for q in history if isinstance(q, str)]
+    except (OSError, ValueError):
+        return []
+
+
+def build_queries(count, seed=0, rows=None):
+    """
+    Вопросы для нагрузки: сначала история и примеры, затем шаблоны.
+    Повторы в выдаче намеренные - так проверяется работа кэшей.
+    """
+    rng = random.Random(seed)
+    rows = rows or seed_rows()
+    departments = sorted({row[3] for row in rows})
+    base = list(dict.fromkeys(history_queries() + SAMPLE_QUERIES))
+
+    queries = []
+    for i in range(count):
+        if base and rng.random() < 0.3:
+            queries.append(rng.choice(base))
+            continue
+        n = rng.randrange(5, 30) * 10000
+        queries.append(rng.choice(TEMPLATES).format(
+            dept=rng.choice(departments),
+            pos=rng.choice(POSITION_WORDS),
+            n=n,
+            m=n + rng.randrange(5, 20) * 10000,
+            year=rng.randrange(2010, 2024),
+            k=rng.randrange(3, 20),
+        ))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка для бенчмарка: данные и вопросы")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('load', help="загрузить синтетических сотрудников в БД из .env")
+    load.add_argument('--rows', type=int, default=100000)
+    load.add_argument('--seed', type=int, default=0)
+    load.add_argument('--batch', type=int, default=50000)
+    load.add_argument('--reset', action='store_true', help="очистить employees перед загрузкой")
+
+    queries = commands.add_parser('queries', help="вывести вопросы (JSON-список)")
+    queries.add_argument('--count', type=int, default=200)
+    queries.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'load':
+        from database import db
+
+        print(json.dumps(load_employees(db, args.rows, args.seed, args.batch, args.reset)))
+    else:
+        print(json.dumps(build_queries(args.count, args.seed), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
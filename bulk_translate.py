@@ -0,0 +1,412 @@
+# bulk_translate.py - пакетный перевод и выполнение сохраненных вопросов
+#
+# Вопросы читаются из файла потоком (JSONL: {"id", "question", "gold_sql"}
+# или просто текст - вопрос на строку) и порциями раздаются пулу процессов.
+# Каждый процесс один раз загружает модель; вопросы порции переводятся
+# параллельными потоками, поэтому генерация идет общими батчами
+# (BatchingInferenceEngine), а SQL выполняется через пул соединений БД.
+#
+# Результаты дописываются в JSONL по мере готовности порций; повторный запуск
+# с тем же --output пропускает уже обработанные вопросы. Если задан gold_sql,
+# результаты сравниваются (execution accuracy: совпадение наборов строк,
+# с учетом порядка, если в эталоне есть ORDER BY). Эталон выполняется как
+# есть, без белого списка и LIMIT, но, как и перевод, в транзакции только
+# для чтения со statement_timeout. Если результат
+# перевода обрезан LIMIT из --max-rows, сравнение не проводится
+# (match = null, truncated = true).
+#
+# С TRANSLATION_CACHE_PATH переводы LLM попадают в общий с сервисом кэш
+# переводов (предварительное заполнение); --no-cache - перевод без кэша.
+#
+# Запуск:  python bulk_translate.py questions.jsonl --output results.jsonl --workers 2
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+
+from config import config
+from sql_validator import SQLValidator, SQLValidationError
+
+logger = logging.getLogger(__name__)
+
+_ORDER_BY = re.compile(r'\border\s+by\b', re.IGNORECASE)
+
+# Поля вопроса и эталона во входном JSONL (первое найденное)
+QUESTION_FIELDS = ('question', 'query', 'nl')
+GOLD_FIELDS = ('gold_sql', 'sql')
+
+
+# ===== ВХОД И ВЫХОД =====
+def read_questions(path):
+    """Вопросы из файла потоком: {'id', 'question', 'gold_sql'}"""
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                question = next((item[k] for k in QUESTION_FIELDS if item.get(k)), None)
+                if not question:
+                    logger.warning("⚠️  Строка %s без вопроса пропущена", line_no)
+                    continue
+                yield {
+                    'id': str(item.get('id', line_no)),
+                    'question': question,
+                    'gold_sql': next((item[k] for k in GOLD_FIELDS if item.get(k)), None),
+                }
+            else:
+                yield {'id': str(line_no), 'question': line, 'gold_sql': None}
+
+
+def read_results(path):
+    """Записи уже обработанных вопросов (недописанная последняя строка пропускается)"""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def open_output(path, restart=False):
+    """
+    Файл результатов для дозаписи. Недописанная последняя строка (прерванный
+    запуск) отрезается, чтобы новые записи начинались с новой строки.
+    """
+    if restart or not os.path.exists(path):
+        return open(path, 'w', encoding='utf-8')
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+    return open(path, 'a', encoding='utf-8')
+
+
+# ===== СРАВНЕНИЕ С ЭТАЛОНОМ =====
+def _comparable(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        # 5, 5.0 и Decimal('5.00') - одно значение
+        return round(float(value), 6)
+    if isinstance(value, (str, date, datetime, dtime)):
+        return value
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def results_match(rows, gold_rows, ordered=False):
+    """Совпадение результатов без учета имен столбцов (и порядка строк, если не ordered)"""
+    rows = [tuple(_comparable(v) for v in row) for row in rows]
+    gold_rows = [tuple(_comparable(v) for v in row) for row in gold_rows]
+    if ordered:
+        return rows == gold_rows
+    return Counter(rows) == Counter(gold_rows)
+
+
+# ===== ПРОЦЕСС ПУЛА =====
+class _BulkWorker:
+    """Конвертер, проверка SQL и пул соединений одного процесса пула"""
+
+    def __init__(self, schema, options):
+        from database import db
+        from llm_sql_converter import LLMSQLConverter
+        from translation_cache import TranslationCache
+
+        self.db = db
+        self.execute = options['execute']
+        self.validator = SQLValidator(max_rows=options['max_rows'], max_joins=config.SQL_MAX_JOINS)
+
+        # Модель грузится после схемы, чтобы кэш префикса считался один раз
+        self.converter = LLMSQLConverter(lazy=True)
+        if schema is not None:
+            prompt_text, whitelist = schema
+            self.converter.set_schema(prompt_text, whitelist)
+            self.validator.set_whitelist(whitelist)
+        if not options['use_cache']:
+            # Пустой кэш в памяти: каждый вопрос переводится заново
+            self.converter.cache = TranslationCache(max_entries=0)
+        # Офлайн ответа модели ждем до LLM_REQUEST_TIMEOUT, а не бюджета задержки сервиса
+        self.converter.latency_budget_ms = 0
+        if options['always_llm']:
+            self.converter.rule_confidence_threshold = float('inf')
+        self.converter.load_model()
+        if not self.converter.model_loaded:
+            logger.warning("⚠️  Процесс %s: модель не загружена, переводят правила", os.getpid())
+
+        # Потоки одного процесса: их запросы к модели собираются в батчи
+        self.threads = ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='bulk')
+        self._gold = {}    # эталонный SQL -> (строки, ошибка)
+
+    def _gold_rows(self, gold_sql):
+        """
+        Строки эталона: SQL из входного файла выполняется без валидатора, но в
+        транзакции только для чтения - ошибочная строка файла не изменит данные
+        """
+        cached = self._gold.get(gold_sql)
+        if cached is None:
+            try:
+                rows, _ = self.db.execute_query(gold_sql, timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS,
+                                                read_only=True)
+                cached = (rows or [], None)
+            except Exception as e:
+                cached = (None, str(e))
+            self._gold[gold_sql] = cached
+        return cached
+
+    def process(self, item):
+        """Перевод, проверка и выполнение одного вопроса -> запись результата"""
+        record = dict(item, sql=None, source=None, winner=None, reason=None, translate_ms=None,
+                      valid=None, error=None, row_count=None, execute_ms=None, match=None)
+        started = time.perf_counter()
+        result = self.converter.convert(item['question'])
+        record['translate_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        if not result['success']:
+            record['error'] = result.get('error')
+            return record
+        translation = result.get('translation') or {}
+        record.update(sql=result['sql_query'], source=result.get('source'),
+                      winner=translation.get('winner'), reason=translation.get('reason'))
+
+        try:
+            checked = self.validator.validate(record['sql'])
+            sql = checked['sql']
+            record['valid'] = True
+        except SQLValidationError as e:
+            record.update(valid=False, error=f'Запрос отклонен: {e}')
+            return record
+        if not self.execute:
+            return record
+        started = time.perf_counter()
+        try:
+            rows, _ = self.db.execute_query(sql, timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS, read_only=True)
+        except Exception as e:
+            record['error'] = f'Ошибка БД: {e}'
+            return record
+        record['execute_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        record['row_count'] = len(rows or [])
+
+        if item.get('gold_sql'):
+            gold_rows, gold_error = self._gold_rows(item['gold_sql'])
+            if gold_error is not None:
+                record['gold_error'] = gold_error
+            elif checked['limit_applied'] and record['row_count'] >= self.validator.max_rows:
+                # Видна только часть результата: ни совпадение, ни расхождение не доказано
+                record['truncated'] = True
+            else:
+                ordered = bool(_ORDER_BY.search(item['gold_sql']))
+                record['match'] = results_match(rows or [], gold_rows, ordered)
+        return record
+
+    def process_chunk(self, items):
+        return list(self.threads.map(self.process, items))
+
+
+_worker = None
+
+
+def _init_worker(schema, options):
+    global _worker
+    from logging_setup import configure_logging
+    configure_logging(config.LOG_LEVEL, config.LOG_SAMPLE_RATE)
+    _worker = _BulkWorker(schema, options)
+
+
+def _process_chunk(items):
+    return _worker.process_chunk(items)
+
+
+# ===== ЗАПУСК =====
+def load_schema():
+    """(текст схемы для промпта, белый список) из каталога или None без БД"""
+    from database import db
+    from schema_catalog import SchemaCatalog
+
+    def fetch(query):
+        results, _ = db.execute_query(query, timeout_ms=config.SQL_STATEMENT_TIMEOUT_MS)
+        return results or []
+
+    try:
+        catalog = SchemaCatalog(fetch, db_name=config.DB_NAME, max_distinct=config.SCHEMA_MAX_DISTINCT)
+        catalog.refresh(force=True)
+        return catalog.prompt_text(), catalog.whitelist()
+    except Exception as e:
+        logger.warning("⚠️  Каталог схемы недоступен, используется описание по умолчанию: %s", e)
+        return None
+    finally:
+        db.disconnect()
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run(questions, out, workers, chunk_size, schema, options, progress_interval=10.0):
+    """
+    Порции вопросов в пул процессов; в работе не больше двух порций на процесс,
+    поэтому входной файл читается по мере обработки. Возвращает число вопросов.
+    """
+    context = multiprocessing.get_context('spawn')
+    processed = 0
+    started = last_report = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(schema, options)) as pool:
+        pending = set()
+        chunks = chunked(questions, chunk_size)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < workers * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    pending.add(pool.submit(_process_chunk, chunk))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for record in future.result():
+                    out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                    processed += 1
+            # Порция записана целиком - точка возобновления
+            out.flush()
+
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                print(f"⏳ Обработано {processed} вопросов, {processed / (now - started):.1f} в секунду")
+                last_report = now
+    return processed
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summarize(records):
+    """Итоги по записям результатов: переводы, выполнение, execution accuracy"""
+    total = translated = valid = executed = with_gold = correct = truncated = 0
+    sources = Counter()
+    translate_ms, execute_ms = [], []
+    for record in records:
+        total += 1
+        if record.get('sql'):
+            translated += 1
+            sources[record.get('source') or 'unknown'] += 1
+        if record.get('translate_ms') is not None:
+            translate_ms.append(record['translate_ms'])
+        if record.get('valid'):
+            valid += 1
+        if record.get('row_count') is not None:
+            executed += 1
+            execute_ms.append(record['execute_ms'])
+        if record.get('match') is not None:
+            with_gold += 1
+            correct += bool(record['match'])
+        if record.get('truncated'):
+            truncated += 1
+    return {
+        'total': total,
+        'translated': translated,
+        'valid': valid,
+        'executed': executed,
+        'sources': dict(sources),
+        'with_gold': with_gold,
+        'correct': correct,
+        'truncated': truncated,
+        'execution_accuracy': round(correct / with_gold, 4) if with_gold else None,
+        'translate_ms_p50': _percentile(translate_ms, 0.5),
+        'translate_ms_p95': _percentile(translate_ms, 0.95),
+        'execute_ms_p50': _percentile(execute_ms, 0.5),
+        'execute_ms_p95': _percentile(execute_ms, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетный перевод NL -> SQL с выполнением и проверкой по эталону")
+    parser.add_argument("input", help="вопросы: JSONL (question, gold_sql, id) или текст по строке")
+    parser.add_argument("--output", help="JSONL с результатами (по умолчанию <input>.results.jsonl)")
+    parser.add_argument("--workers", type=int, default=1, help="процессов, в каждом своя копия модели")
+    parser.add_argument("--threads", type=int, default=config.LLM_BATCH_MAX_SIZE,
+                        help="одновременных вопросов в процессе (наполняют батч генерации)")
+    parser.add_argument("--chunk-size", type=int, default=config.LLM_BATCH_MAX_SIZE * 4,
+                        help="вопросов в порции; порция - единица записи и возобновления")
+    parser.add_argument("--max-rows", type=int, default=config.SQL_MAX_ROWS, help="LIMIT для выполнения")
+    parser.add_argument("--limit", type=int, help="обработать не больше N новых вопросов")
+    parser.add_argument("--no-execute", action="store_true", help="только перевод, без выполнения SQL")
+    parser.add_argument("--no-cache", action="store_true", help="не брать переводы из кэша")
+    parser.add_argument("--always-llm", action="store_true", help="LLM даже при уверенных правилах")
+    parser.add_argument("--restart", action="store_true", help="начать заново, перезаписав --output")
+    parser.add_argument("--json", action="store_true", help="итоги в JSON")
+    args = parser.parse_args()
+
+    from logging_setup import configure_logging
+    configure_logging(config.LOG_LEVEL, config.LOG_SAMPLE_RATE)
+
+    output = args.output or os.path.splitext(args.input)[0] + '.results.jsonl'
+    done = set() if args.restart else {str(r.get('id')) for r in read_results(output)}
+    if done:
+        print(f"↩️  Уже обработано {len(done)} вопросов, продолжаю {output}")
+
+    questions = (item for item in read_questions(args.input) if item['id'] not in done)
+    if args.limit:
+        questions = (item for _, item in zip(range(args.limit), questions))
+
+    options = {
+        'execute': not args.no_execute,
+        'use_cache': not args.no_cache,
+        'always_llm': args.always_llm,
+        'max_rows': args.max_rows,
+        'threads': max(1, args.threads),
+    }
+    schema = load_schema()
+
+    started = time.perf_counter()
+    with open_output(output, restart=args.restart) as out:
+        processed = run(questions, out, max(1, args.workers), max(1, args.chunk_size), schema, options)
+    elapsed = time.perf_counter() - started
+
+    summary = summarize(read_results(output))
+    summary.update(
+        processed=processed,
+        elapsed_s=round(elapsed, 3),
+        questions_per_s=round(processed / elapsed, 3) if elapsed > 0 else None,
+        output=output,
+    )
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    print(f"\n✅ Обработано за запуск: {processed} за {elapsed:.1f} с ({summary['questions_per_s']} в секунду)")
+    print(f"   всего в {output}: {summary['total']}, переведено {summary['translated']} "
+          f"{summary['sources']}, выполнено {summary['executed']}")
+    print(f"   перевод p50/p95: {summary['translate_ms_p50']} / {summary['translate_ms_p95']} мс, "
+          f"выполнение p50/p95: {summary['execute_ms_p50']} / {summary['execute_ms_p95']} мс")
+    if summary['with_gold']:
+        print(f"   execution accuracy: {summary['correct']}/{summary['with_gold']} "
+              f"= {summary['execution_accuracy']:.1%}")
+    if summary['truncated']:
+        print(f"   не сравнивались (результат обрезан --max-rows): {summary['truncated']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,13 +14,112 @@ class Config:
     # Формируем строку подключения
     SQLALCHEMY_DATABASE_URI = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
     
+    # Настройки пула соединений
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+    DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '5'))  # секунды
+    DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', '30'))  # секунды простоя до проверки
+    
+    # Потоковая выдача результатов
+    DB_STREAM_ITERSIZE = int(os.getenv('DB_STREAM_ITERSIZE', '1000'))  # строк за одну выборку из серверного курсора
+    STREAM_CHUNK_ROWS = int(os.getenv('STREAM_CHUNK_ROWS', '200'))  # строк в одной строке NDJSON-ответа
+    
+    # Сжатие ответов /api/query по Accept-Encoding (brotli, если установлен, иначе gzip)
+    RESPONSE_COMPRESSION_ENABLED = os.getenv('RESPONSE_COMPRESSION_ENABLED', 'true').lower() == 'true'
+    RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))  # короткие ответы не сжимаем
+    
+    # Асинхронный сервер (asgi_app.py)
+    ASYNC_INFERENCE_THREADS = int(os.getenv('ASYNC_INFERENCE_THREADS', '16'))  # потоки, ожидающие батч LLM
+    ASYNC_REQUEST_TIMEOUT = float(os.getenv('ASYNC_REQUEST_TIMEOUT', '30'))  # секунды на весь запрос
+    ASYNC_HEALTH_TIMEOUT = float(os.getenv('ASYNC_HEALTH_TIMEOUT', '2'))
+    
     # Секретный ключ для Flask (сгенерировать можно так: import secrets; secrets.token_hex(16))
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-123')
     
+    # История запросов (history_store.py): запись на диск в фоне
+    HISTORY_PATH = os.getenv('HISTORY_PATH', 'query_history.json')
+    HISTORY_LIMIT = int(os.getenv('HISTORY_LIMIT', '20'))
+    HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', '1'))  # секунды
+    HISTORY_USERS_PATH = os.getenv('HISTORY_USERS_PATH', '')  # SQLite с личными историями; пусто - только общая
+    
+    # Логи и метрики
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))  # доля записей INFO/DEBUG; WARNING и выше - всегда
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'  # маршрут /metrics
+    
+    # Одинаковые одновременные запросы: один перевод и одно выполнение SQL на всех (single_flight.py)
+    SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+    
+    # Журнал выполненных запросов для index_advisor.py (пусто - не вести)
+    WORKLOAD_LOG_PATH = os.getenv('WORKLOAD_LOG_PATH', 'workload_log.jsonl')
+    WORKLOAD_LOG_FLUSH_INTERVAL = float(os.getenv('WORKLOAD_LOG_FLUSH_INTERVAL', '5'))  # секунды
+    
     # Настройки NLP
     SUPPORTED_DEPARTMENTS = ['IT', 'Маркетинг', 'Финансы', 'Продажи', 'HR', 'Логистика', 'Закупки', 'Руководство']
     MIN_SALARY = 50000
     MAX_SALARY = 500000
+    
+    # Настройки генерации LLM
+    LLM_BACKEND = os.getenv('LLM_BACKEND', 'auto')  # auto, fp32, fp16, bf16, int8, onnx (см. llm_backends.py)
+    LLM_ONNX_DIR = os.getenv('LLM_ONNX_DIR', 'onnx_models')  # куда сохранять экспортированные ONNX-модели
+    LLM_MAX_NEW_TOKENS = int(os.getenv('LLM_MAX_NEW_TOKENS', '200'))
+    LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', '8'))
+    LLM_BATCH_MAX_WAIT_MS = float(os.getenv('LLM_BATCH_MAX_WAIT_MS', '15'))
+    LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '60'))  # секунды
+    LLM_PREFIX_CACHE = os.getenv('LLM_PREFIX_CACHE', 'true').lower() == 'true'  # кэш KV для схемы в промпте
+    LLM_CONSTRAINED_DECODING = os.getenv('LLM_CONSTRAINED_DECODING', 'true').lower() == 'true'  # грамматика SQL (sql_grammar.py)
+    LLM_GRAMMAR_CACHE_STATES = int(os.getenv('LLM_GRAMMAR_CACHE_STATES', '1024'))
+    # Гонка правил и LLM: ответ LLM ждем не дольше бюджета (0 - до LLM_REQUEST_TIMEOUT),
+    # при уверенности правил не ниже порога LLM не запускается
+    LLM_LATENCY_BUDGET_MS = float(os.getenv('LLM_LATENCY_BUDGET_MS', '2000'))
+    RULE_CONFIDENCE_THRESHOLD = float(os.getenv('RULE_CONFIDENCE_THRESHOLD', '0.8'))
+    
+    # Отдельный процесс генерации (inference_worker.py): веб-воркеры не загружают модель сами
+    LLM_WORKER_SOCKET = os.getenv('LLM_WORKER_SOCKET', '')  # путь Unix-сокета; пусто - модель в процессе
+    LLM_WORKER_PROCESSES = int(os.getenv('LLM_WORKER_PROCESSES', '1'))  # дочерних процессов с общими весами
+    LLM_WORKER_AUTHKEY = os.getenv('LLM_WORKER_AUTHKEY', '')  # обязателен при LLM_WORKER_SOCKET
+    LLM_WORKER_CONNECT_TIMEOUT = float(os.getenv('LLM_WORKER_CONNECT_TIMEOUT', '60'))  # ожидание запуска воркера
+    
+    # Кэш переводов NL -> SQL
+    TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', '1000'))
+    TRANSLATION_CACHE_TTL = float(os.getenv('TRANSLATION_CACHE_TTL', '3600'))  # секунды, 0 - без ограничения
+    TRANSLATION_CACHE_PATH = os.getenv('TRANSLATION_CACHE_PATH', '')  # SQLite-файл; пусто - только память
+    
+    # Кэш результатов SQL
+    RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+    RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    DATA_VERSION_SOURCE = os.getenv('DATA_VERSION_SOURCE', 'trigger')  # 'trigger' или 'pg_stat'
+    DATA_VERSION_CHECK_MS = float(os.getenv('DATA_VERSION_CHECK_MS', '500'))
+    
+    # Проверка сгенерированного SQL (sql_validator.py)
+    SQL_MAX_ROWS = int(os.getenv('SQL_MAX_ROWS', '1000'))  # LIMIT, добавляемый к запросу
+    SQL_MAX_JOINS = int(os.getenv('SQL_MAX_JOINS', '3'))
+    SQL_STATEMENT_TIMEOUT_MS = int(os.getenv('SQL_STATEMENT_TIMEOUT_MS', '5000'))
+    SQL_VALIDATION_CACHE_SIZE = int(os.getenv('SQL_VALIDATION_CACHE_SIZE', '1024'))
+    
+    # Оценка плана перед выполнением (query_planner.py)
+    MAX_PLAN_COST = float(os.getenv('MAX_PLAN_COST', '100000'))  # в единицах стоимости PostgreSQL, 0 - без проверки
+    MAX_PLAN_ROWS = int(os.getenv('MAX_PLAN_ROWS', '1000'))  # больше - LIMIT ужесточается
+    PLAN_CACHE_SIZE = int(os.getenv('PLAN_CACHE_SIZE', '512'))
+    PLAN_CACHE_TTL = float(os.getenv('PLAN_CACHE_TTL', '300'))  # секунды
+    DB_PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() == 'true'
+    DB_PREPARED_PER_CONNECTION = int(os.getenv('DB_PREPARED_PER_CONNECTION', '64'))
+    
+    # Каталог схемы (schema_catalog.py)
+    SCHEMA_REFRESH_INTERVAL = float(os.getenv('SCHEMA_REFRESH_INTERVAL', '30'))  # секунды между проверками DDL
+    SCHEMA_MAX_DISTINCT = int(os.getenv('SCHEMA_MAX_DISTINCT', '20'))  # значения столбца попадают в промпт, если их не больше
+    SCHEMA_VALUES_TTL = float(os.getenv('SCHEMA_VALUES_TTL', '600'))  # секунды до перечитывания значений
+    
+    # Примеры для промпта (few_shot.py)
+    FEW_SHOT_ENABLED = os.getenv('FEW_SHOT_ENABLED', 'true').lower() == 'true'
+    FEW_SHOT_DIR = os.getenv('FEW_SHOT_DIR', 'few_shot_index')
+    FEW_SHOT_SEED_PATH = os.getenv('FEW_SHOT_SEED_PATH', 'data/few_shot_examples.jsonl')
+    FEW_SHOT_K = int(os.getenv('FEW_SHOT_K', '3'))
+    FEW_SHOT_TOKEN_BUDGET = int(os.getenv('FEW_SHOT_TOKEN_BUDGET', '256'))  # токенов на все примеры
+    FEW_SHOT_MIN_SCORE = float(os.getenv('FEW_SHOT_MIN_SCORE', '0.3'))  # косинусное сходство
+    FEW_SHOT_INDEX = os.getenv('FEW_SHOT_INDEX', 'auto')  # auto, flat, ivf
+    FEW_SHOT_IVF_MIN_SIZE = int(os.getenv('FEW_SHOT_IVF_MIN_SIZE', '20000'))
+    FEW_SHOT_NPROBE = int(os.getenv('FEW_SHOT_NPROBE', '8'))
 
 # Создаем экземпляр конфигурации
 config = Config()
\ No newline at end of file
@@ -0,0 +1,23 @@
+-- Счетчик версии данных для кэша результатов (result_cache.py)
+-- Запуск: psql -U postgres -d company_db -f data/data_version.sql
+
+CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO data_version (id, version) VALUES (1, 0)
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_data_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE data_version SET version = version + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Один инкремент на оператор, а не на каждую строку
+DROP TRIGGER IF EXISTS employees_data_version ON employees;
+CREATE TRIGGER employees_data_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON employees
+FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
@@ -1,66 +1,359 @@
+import logging
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
 import psycopg2
-from psycopg2 import sql, DatabaseError
+from psycopg2 import sql, DatabaseError, OperationalError, InterfaceError
 from config import config
-import pandas as pd
+from metrics import DB_QUERY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений с PostgreSQL.
+
+    Соединения выдаются на время одного запроса и возвращаются обратно.
+    Если свободных соединений нет и лимит исчерпан, вызывающий поток ждет
+    (не дольше acquire_timeout). Перед выдачей давно простаивающее
+    соединение проверяется через SELECT 1 и при необходимости пересоздается.
+    """
+
+    def __init__(self, minconn, maxconn, acquire_timeout=5.0,
+                 healthcheck_interval=30.0, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Некорректные размеры пула: min={minconn}, max={maxconn}")
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()          # (connection, время возврата в пул)
+        self._size = 0                # всего открытых соединений (свободных + выданных)
+        self._closed = False
+
+        # Метрики ожидания соединения
+        self._acquired = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(minconn):
+            self._idle.append((self._new_connection(), time.monotonic()))
+            self._size += 1
+
+    def _new_connection(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def _is_healthy(self, conn, idle_since):
+        """Проверка соединения перед выдачей"""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except (OperationalError, InterfaceError):
+            return False
+
+    def getconn(self):
+        """Получение соединения из пула (с ожиданием, если пул исчерпан)"""
+        started = time.monotonic()
+        deadline = started + self.acquire_timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Пул соединений закрыт")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Резервируем место, само соединение открываем вне блокировки
+                    self._size += 1
+                    conn, idle_since = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений (max={self.maxconn}) за {self.acquire_timeout} с"
+                    )
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._new_connection()
+            elif not self._is_healthy(conn, idle_since):
+                self._close_quietly(conn)
+                conn = self._new_connection()
+                with self._cond:
+                    self._reconnects += 1
+        except Exception:
+            # Не удалось открыть соединение - освобождаем зарезервированное место
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Возврат соединения в пул (discard=True - закрыть и не возвращать)"""
+        if not discard and not conn.closed:
+            try:
+                # Не оставляем в пуле незавершенных транзакций
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except (OperationalError, InterfaceError):
+                discard = True
+
+        with self._cond:
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: соединение на время одного запроса"""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (OperationalError, InterfaceError):
+            # Соединение, скорее всего, разорвано - в пул его не возвращаем
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close_quietly(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """Метрики пула для /api/health"""
+        with self._cond:
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'acquired': self._acquired,
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects,
+                'avg_wait_ms': round(self._wait_total / self._acquired * 1000, 3) if self._acquired else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3),
+            }
+
 
 class Database:
     def __init__(self):
-        self.connection = None
-        self.cursor = None
-        
+        self.pool = None
+        # Подготовленные операторы каждого соединения: имя -> None (порядок LRU)
+        self._prepared = weakref.WeakKeyDictionary()
+        self._prepared_lock = threading.Lock()
+
     def connect(self):
-        #Установка соединения с БД
+        #Создание пула соединений с БД
         try:
-            self.connection = psycopg2.connect(
+            self.pool = ConnectionPool(
+                minconn=config.DB_POOL_MIN_SIZE,
+                maxconn=config.DB_POOL_MAX_SIZE,
+                acquire_timeout=config.DB_POOL_ACQUIRE_TIMEOUT,
+                healthcheck_interval=config.DB_POOL_HEALTHCHECK_INTERVAL,
                 host=config.DB_HOST,
                 port=config.DB_PORT,
                 database=config.DB_NAME,
                 user=config.DB_USER,
                 password=config.DB_PASSWORD
             )
-            self.cursor = self.connection.cursor()
-            print("Подключение к БД установлено успешно!")
+            logger.info("Пул соединений с БД создан (%s..%s)", config.DB_POOL_MIN_SIZE, config.DB_POOL_MAX_SIZE)
             return True
         except Exception as e:
-            print(f"Ошибка подключения к БД: {e}")
+            logger.error("Ошибка подключения к БД: %s", e)
             return False
-    
+
     def disconnect(self):
-        #Закрытие соединения с БД
-        if self.cursor:
-            self.cursor.close()
-        if self.connection:
-            self.connection.close()
-        print("Соединение с БД закрыто.")
-    
-    def execute_query(self, query, params=None, fetch=True):
-        #Выполнение SQL-запроса с параметрами
-        try:
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            
-            if fetch:
-                if query.strip().upper().startswith('SELECT'):
-                    # Для SELECT возвращаем результат
-                    columns = [desc[0] for desc in self.cursor.description]
-                    results = self.cursor.fetchall()
-                    self.connection.commit()
+        #Закрытие всех соединений пула
+        if self.pool:
+            self.pool.closeall()
+        logger.info("Соединение с БД закрыто.")
+
+    @contextmanager
+    def connection(self):
+        #Соединение из пула на время одного запроса
+        if self.pool is None and not self.connect():
+            raise OperationalError("Нет подключения к БД")
+        with self.pool.connection() as conn:
+            yield conn
+
+    @staticmethod
+    def _begin(cursor, timeout_ms=None, read_only=False):
+        #Настройки транзакции до первого запроса в ней
+        if read_only:
+            cursor.execute("SET TRANSACTION READ ONLY")
+        if timeout_ms:
+            cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout_ms),))
+
+    def execute_query(self, query, params=None, fetch=True, timeout_ms=None, read_only=False):
+        #Выполнение SQL-запроса с параметрами на отдельном соединении из пула.
+        #timeout_ms - statement_timeout только для этой транзакции;
+        #read_only=True - транзакция только для чтения (SQL не из кода сервиса)
+        with self.connection() as conn:
+            started = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    self._begin(cursor, timeout_ms, read_only)
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+
+                    if fetch and cursor.description is not None:
+                        # Для SELECT возвращаем результат
+                        columns = [desc[0] for desc in cursor.description]
+                        results = cursor.fetchall()
+                        conn.commit()
+                        DB_QUERY_SECONDS.observe(time.perf_counter() - started, kind='query')
+                        return results, columns
+                    elif fetch:
+                        # Для INSERT/UPDATE/DELETE
+                        conn.commit()
+                        return cursor.rowcount, None
+                    else:
+                        conn.commit()
+                        return None, None
+
+            except DatabaseError as e:
+                if not conn.closed:
+                    conn.rollback()
+                logger.warning("Ошибка выполнения запроса: %s", e)
+                raise e
+
+    def execute_prepared(self, name, query, params=None, timeout_ms=None, read_only=False):
+        #Выполнение SELECT через PREPARE/EXECUTE: план строится один раз на форму
+        #запроса в каждом соединении. query - форма с параметрами $1..$n
+        with self.connection() as conn:
+            with self._prepared_lock:
+                statements = self._prepared.setdefault(conn, OrderedDict())
+            started = time.perf_counter()
+            try:
+                with conn.cursor() as cursor:
+                    self._begin(cursor, timeout_ms, read_only)
+                    if name in statements:
+                        statements.move_to_end(name)
+                    else:
+                        cursor.execute(f"PREPARE {name} AS {query}")
+                        statements[name] = None
+                        if len(statements) > config.DB_PREPARED_PER_CONNECTION:
+                            oldest, _ = statements.popitem(last=False)
+                            cursor.execute(f"DEALLOCATE {oldest}")
+
+                    if params:
+                        placeholders = ', '.join(['%s'] * len(params))
+                        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+                    else:
+                        cursor.execute(f"EXECUTE {name}")
+                    columns = [desc[0] for desc in cursor.description]
+                    results = cursor.fetchall()
+                    conn.commit()
+                    DB_QUERY_SECONDS.observe(time.perf_counter() - started, kind='prepared')
                     return results, columns
-                else:
-                    # Для INSERT/UPDATE/DELETE
-                    self.connection.commit()
-                    return self.cursor.rowcount, None
-            else:
-                self.connection.commit()
-                return None, None
-                
-        except DatabaseError as e:
-            self.connection.rollback()
-            print(f"Ошибка выполнения запроса: {e}")
-            raise e
-    
+
+            except DatabaseError as e:
+                if not conn.closed:
+                    conn.rollback()
+                    # Оператор мог устареть (например, после изменения таблицы) - пересоздадим
+                    if statements.pop(name, False) is None:
+                        try:
+                            with conn.cursor() as cursor:
+                                cursor.execute(f"DEALLOCATE {name}")
+                            conn.commit()
+                        except DatabaseError:
+                            conn.rollback()
+                logger.warning("Ошибка выполнения запроса: %s", e)
+                raise e
+
+    @contextmanager
+    def stream_query(self, query, params=None, itersize=None, timeout_ms=None, read_only=False):
+        #Потоковое чтение результата через именованный (серверный) курсор.
+        #Возвращает (columns, rows), где rows - ленивый итератор строк;
+        #в памяти одновременно находится не больше itersize строк.
+        itersize = itersize or config.DB_STREAM_ITERSIZE
+        with self.connection() as conn:
+            cursor = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+            cursor.itersize = itersize
+            started = time.perf_counter()
+            try:
+                with conn.cursor() as setup:
+                    self._begin(setup, timeout_ms, read_only)
+                cursor.execute(query, params)
+                # Описание столбцов у серверного курсора появляется после первой выборки
+                first_chunk = cursor.fetchmany(itersize)
+                columns = [desc[0] for desc in cursor.description]
+                # Для потока - время до первой порции строк
+                DB_QUERY_SECONDS.observe(time.perf_counter() - started, kind='stream')
+
+                def rows():
+                    chunk = first_chunk
+                    while chunk:
+                        yield from chunk
+                        if len(chunk) < itersize:
+                            return
+                        chunk = cursor.fetchmany(itersize)
+
+                yield columns, rows()
+                conn.commit()
+            except DatabaseError as e:
+                if not conn.closed:
+                    conn.rollback()
+                logger.warning("Ошибка выполнения запроса: %s", e)
+                raise e
+            finally:
+                if not cursor.closed:
+                    try:
+                        cursor.close()
+                    except DatabaseError:
+                        pass
+
     def get_table_structure(self, table_name='employees'):
         #Получение структуры таблицы (метаданные)
         query = """
@@ -69,14 +362,18 @@ class Database:
         WHERE table_name = %s
         ORDER BY ordinal_position;
         """
-        self.cursor.execute(query, (table_name,))
-        return self.cursor.fetchall()
-    
+        results, _ = self.execute_query(query, (table_name,))
+        return results
+
     def get_sample_data(self, table_name='employees', limit=5):
         #Получение примеров данных из таблицы
         query = sql.SQL("SELECT * FROM {} LIMIT %s").format(sql.Identifier(table_name))
         return self.execute_query(query, (limit,))
 
+    def pool_stats(self):
+        #Метрики пула соединений
+        return self.pool.stats() if self.pool else None
+
 # Создаем глобальный экземпляр для использования во всем приложении
 db = Database()
 
@@ -85,8 +382,8 @@ def init_db():
     if db.connect():
         # Получаем структуру таблицы для NLP-модуля
         structure = db.get_table_structure()
-        print("Структура таблицы employees:")
-        for col in structure:
-            print(f"  - {col[0]}: {col[1]} ({'NULL' if col[2] == 'YES' else 'NOT NULL'})")
+        logger.info("Структура таблицы employees: %s", ', '.join(
+            f"{col[0]}: {col[1]} ({'NULL' if col[2] == 'YES' else 'NOT NULL'})" for col in structure
+        ))
         return True
-    return False
\ No newline at end of file
+    return False
@@ -0,0 +1,108 @@
+# db_info.py - снимок статистики для /api/db_info, пересчитываемый при изменении данных
+import hashlib
+import json
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+
+# Один проход по employees: агрегаты по отделам, общие итоги считаются из них
+DB_INFO_QUERY = """
+    SELECT department,
+           COUNT(*) AS employee_count,
+           COUNT(salary) AS salary_count,
+           MIN(salary) AS min_salary,
+           MAX(salary) AS max_salary,
+           SUM(salary) AS total_salary,
+           ROUND(AVG(salary), 2) AS avg_salary
+    FROM employees
+    GROUP BY department
+    ORDER BY department;
+"""
+
+_CENTS = Decimal('0.01')
+
+
+def _round(value):
+    """ROUND(x, 2) как в PostgreSQL (половина - от нуля)"""
+    return Decimal(value).quantize(_CENTS, rounding=ROUND_HALF_UP)
+
+
+def build_stats(rows):
+    """Строки DB_INFO_QUERY -> словарь stats в прежнем формате ответа"""
+    count = sum(row[1] for row in rows)
+    salary_count = sum(row[2] for row in rows)
+    salaries = [row for row in rows if row[2]]
+    total = sum((Decimal(row[5]) for row in salaries), Decimal(0))
+
+    # Отделы - в порядке запроса (по имени), статистика - по средней зарплате
+    # по убыванию, NULL первыми, как ORDER BY avg_salary DESC в PostgreSQL
+    by_salary = sorted(rows, key=lambda row: (row[6] is not None, -(row[6] or 0)))
+
+    return {
+        'total_employees': count,
+        'departments': [row[0] for row in rows],
+        'min_salary': min(row[3] for row in salaries) if salaries else None,
+        'max_salary': max(row[4] for row in salaries) if salaries else None,
+        'avg_salary': _round(total / salary_count) if salary_count else None,
+        'total_salary': _round(total) if salaries else None,
+        'department_stats': [
+            {'department': row[0], 'count': row[1], 'avg_salary': row[6]}
+            for row in by_salary
+        ]
+    }
+
+
+def etag_matches(if_none_match, etag):
+    """Совпадает ли заголовок If-None-Match с ETag (слабые теги тоже подходят)"""
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+class DbInfoSnapshot:
+    """
+    Готовый ответ /api/db_info (JSON в байтах и ETag) для одной версии
+    данных (DataVersionProbe). Пока версия не изменилась, запрос к
+    employees не выполняется и ответ не сериализуется заново.
+    Без версии (None) снимок пересчитывается при каждом обращении.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.body = None
+        self.etag = None
+        self.hits = 0
+        self.rebuilds = 0
+
+    def current(self, version):
+        """(body, etag) для версии данных или None, если снимок устарел"""
+        with self._lock:
+            if self.body is None or version is None or version != self.version:
+                return None
+            self.hits += 1
+            return self.body, self.etag
+
+    def update(self, version, rows):
+        """Новый снимок по строкам DB_INFO_QUERY"""
+        payload = {'success': True, 'stats': build_stats(rows)}
+        body = json.dumps(payload, ensure_ascii=False, default=str, sort_keys=True).encode('utf-8')
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        with self._lock:
+            self.version = version
+            self.body = body
+            self.etag = etag
+            self.rebuilds += 1
+        return body, etag
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'etag': self.etag,
+                'hits': self.hits,
+                'rebuilds': self.rebuilds,
+            }
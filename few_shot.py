@@ -0,0 +1,298 @@
+# few_shot.py - индекс проверенных примеров NL -> SQL для промпта (few-shot)
+import json
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from translation_cache import normalize_query
+
+EMBEDDING_DIM = 256
+EMBED_BATCH = 1024
+# Хвост (добавленные после сборки примеры) сливается с основной матрицей при загрузке,
+# если он длиннее этого числа строк или 10% основной части
+TAIL_COMPACT_ROWS = 1000
+KMEANS_ITERATIONS = 8
+
+
+def _ngrams(text):
+    padded = f" {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def embed_texts(texts, dim=EMBEDDING_DIM):
+    """
+    Эмбеддинги пачки текстов: хэшированные символьные 3-граммы
+    нормализованного запроса (со знаком), нормированные по L2.
+    Устойчивы к падежным окончаниям и не требуют модели.
+    """
+    rows, cols, signs = [], [], []
+    for row, text in enumerate(texts):
+        for gram in _ngrams(normalize_query(text)):
+            h = zlib.crc32(gram.encode('utf-8'))
+            rows.append(row)
+            cols.append(h % dim)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    np.add.at(matrix, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)),
+              np.asarray(signs, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _embed_in_batches(texts, dim):
+    if not texts:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.vstack([embed_texts(texts[i:i + EMBED_BATCH], dim)
+                      for i in range(0, len(texts), EMBED_BATCH)])
+
+
+def _save_npy(path, array):
+    """Атомарная запись .npy (временный файл + переименование)"""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _top_n(scores, n):
+    """Индексы n наибольших значений по убыванию"""
+    if len(scores) > n:
+        candidates = np.argpartition(-scores, n)[:n]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates])]
+
+
+def build_ivf(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Инвертированный индекс: сферический k-means по выборке, затем векторы
+    переставляются так, чтобы каждый список лежал непрерывным куском.
+    Возвращает (centroids, offsets, order).
+    """
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), nlist * 64)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        sums[~empty] /= norms[~empty]
+        sums[empty] = centroids[empty]
+        centroids = sums
+
+    assign = np.concatenate([
+        np.argmax(np.asarray(vectors[i:i + 16384]) @ centroids.T, axis=1)
+        for i in range(0, len(vectors), 16384)
+    ])
+    order = np.argsort(assign, kind='stable')
+    offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+    return centroids.astype(np.float32), offsets.astype(np.int64), order.astype(np.int64)
+
+
+class FewShotIndex:
+    """
+    Библиотека пар "вопрос -> SQL" с поиском ближайших по эмбеддингу.
+
+    Файлы в каталоге index_dir:
+      examples.jsonl     - примеры (только дописывается)
+      embeddings.npy     - эмбеддинги основной части, открываются через mmap
+      embeddings.tail    - эмбеддинги добавленных позже примеров (сырые float32)
+      ivf.npz, ivf_vectors.npy - инвертированный индекс (mode='ivf')
+
+    При запуске заново считаются только эмбеддинги, которых нет на диске.
+    mode: 'flat' - полный перебор, 'ivf' - перебор nprobe ближайших списков,
+    'auto' - ivf, начиная с ivf_min_size примеров.
+    """
+
+    def __init__(self, index_dir, seed_path=None, mode='auto', ivf_min_size=20000,
+                 nprobe=8, dim=EMBEDDING_DIM):
+        if mode not in ('auto', 'flat', 'ivf'):
+            raise ValueError(f"Неизвестный режим индекса примеров: {mode}")
+        self.index_dir = index_dir
+        self.seed_path = seed_path
+        self.mode = mode
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self.dim = dim
+
+        self.examples = []
+        self._keys = set()
+        self._base = np.zeros((0, dim), dtype=np.float32)
+        self._tail = np.zeros((0, dim), dtype=np.float32)
+        self._ivf = None               # (centroids, offsets, order, vectors)
+        self._lock = threading.Lock()
+        self.searches = 0
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    # ===== ЗАГРУЗКА =====
+    def _load(self):
+        examples_path = self._path('examples.jsonl')
+        if not os.path.exists(examples_path) and self.seed_path and os.path.exists(self.seed_path):
+            with open(self.seed_path, 'r', encoding='utf-8') as src, \
+                    open(examples_path, 'w', encoding='utf-8') as dst:
+                for line in src:
+                    if line.strip():
+                        example = json.loads(line)
+                        example.setdefault('source', 'seed')
+                        dst.write(json.dumps(example, ensure_ascii=False) + '\n')
+
+        if os.path.exists(examples_path):
+            with open(examples_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self.examples.append(json.loads(line))
+        self._keys = {normalize_query(e['question']) for e in self.examples}
+
+        meta = self._read_meta()
+        if meta.get('dim') == self.dim and os.path.exists(self._path('embeddings.npy')):
+            base = np.load(self._path('embeddings.npy'), mmap_mode='r')
+            self._base = base[:len(self.examples)]
+        tail_path = self._path('embeddings.tail')
+        if meta.get('dim') == self.dim and os.path.exists(tail_path):
+            tail = np.fromfile(tail_path, dtype=np.float32)
+            rows = len(tail) // self.dim
+            self._tail = tail[:rows * self.dim].reshape(rows, self.dim)[:len(self.examples) - len(self._base)]
+
+        # Эмбеддинги, которых нет на диске (новый индекс или оборванная запись)
+        known = len(self._base) + len(self._tail)
+        if known < len(self.examples):
+            missing = _embed_in_batches([e['question'] for e in self.examples[known:]], self.dim)
+            self._tail = np.vstack([self._tail, missing])
+
+        if len(self._tail) > max(TAIL_COMPACT_ROWS, len(self._base) // 10) or not os.path.exists(tail_path) \
+                or meta.get('dim') != self.dim:
+            self._compact()
+        self._load_ivf()
+
+    def _read_meta(self):
+        try:
+            with open(self._path('meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, **values):
+        meta = dict(self._read_meta(), dim=self.dim, **values)
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path('meta.json'))
+
+    def _compact(self):
+        """Слияние хвоста с основной матрицей и (при необходимости) пересборка IVF"""
+        vectors = np.vstack([np.asarray(self._base), self._tail]).astype(np.float32)
+        _save_npy(self._path('embeddings.npy'), vectors)
+        open(self._path('embeddings.tail'), 'wb').close()
+        self._write_meta(count=len(vectors))
+        self._base = np.load(self._path('embeddings.npy'), mmap_mode='r')
+        self._tail = np.zeros((0, self.dim), dtype=np.float32)
+
+        if self._use_ivf(len(vectors)):
+            nlist = max(1, int(np.sqrt(len(vectors))))
+            centroids, offsets, order = build_ivf(self._base, nlist)
+            _save_npy(self._path('ivf_vectors.npy'), np.asarray(self._base)[order])
+            np.savez(self._path('ivf.npz'), centroids=centroids, offsets=offsets, order=order)
+            self._write_meta(ivf_count=len(vectors))
+
+    def _use_ivf(self, size):
+        return self.mode == 'ivf' or (self.mode == 'auto' and size >= self.ivf_min_size)
+
+    def _load_ivf(self):
+        if not self._use_ivf(len(self._base)) or self._read_meta().get('ivf_count') != len(self._base):
+            self._ivf = None
+            return
+        data = np.load(self._path('ivf.npz'))
+        vectors = np.load(self._path('ivf_vectors.npy'), mmap_mode='r')
+        self._ivf = (data['centroids'], data['offsets'], data['order'], vectors)
+
+    # ===== ДОБАВЛЕНИЕ =====
+    def add(self, question, sql, source='verified'):
+        """Новый пример (повторы по нормализованному вопросу пропускаются)"""
+        key = normalize_query(question)
+        with self._lock:
+            if not key or key in self._keys:
+                return False
+            vector = embed_texts([question], self.dim)
+            example = {'question': question, 'sql': sql, 'source': source}
+            with open(self._path('examples.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(example, ensure_ascii=False) + '\n')
+            with open(self._path('embeddings.tail'), 'ab') as f:
+                f.write(vector.tobytes())
+            self._tail = np.vstack([self._tail, vector])
+            self.examples.append(example)
+            self._keys.add(key)
+            return True
+
+    # ===== ПОИСК =====
+    def search(self, question, k=3):
+        """k ближайших примеров: список (оценка сходства, пример)"""
+        query = embed_texts([question], self.dim)[0]
+        with self._lock:
+            base, tail, ivf = self._base, self._tail, self._ivf
+            self.searches += 1
+
+        if ivf is not None:
+            centroids, offsets, order, vectors = ivf
+            probe = _top_n(centroids @ query, self.nprobe)
+            ids, scores = [], []
+            for c in probe:
+                start, end = offsets[c], offsets[c + 1]
+                if start < end:
+                    scores.append(vectors[start:end] @ query)
+                    ids.append(order[start:end])
+            ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+            scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+        else:
+            scores = base @ query
+            ids = np.arange(len(base))
+
+        if len(tail):
+            scores = np.concatenate([scores, tail @ query])
+            ids = np.concatenate([ids, np.arange(len(base), len(base) + len(tail))])
+
+        best = _top_n(scores, k)
+        return [(float(scores[i]), self.examples[ids[i]]) for i in best]
+
+    def select(self, question, k=3, token_budget=256, min_score=0.0, count_tokens=None):
+        """
+        Примеры для промпта: до k наиболее похожих с оценкой не ниже min_score,
+        суммарно не длиннее token_budget токенов (count_tokens(text) -> int).
+        Точное совпадение вопроса не берем - это и есть ответ кэша.
+        """
+        count_tokens = count_tokens or (lambda text: len(text) // 3 + 1)
+        key = normalize_query(question)
+        selected = []
+        for score, example in self.search(question, k * 2):
+            if len(selected) >= k or score < min_score:
+                break
+            if normalize_query(example['question']) == key:
+                continue
+            cost = count_tokens(f"{example['question']}\nSQL: {example['sql']}\n")
+            if cost > token_budget:
+                continue
+            token_budget -= cost
+            selected.append(example)
+        return selected
+
+    def stats(self):
+        with self._lock:
+            return {
+                'examples': len(self.examples),
+                'indexed': len(self._base),
+                'tail': len(self._tail),
+                'mode': 'ivf' if self._ivf is not None else 'flat',
+                'searches': self.searches,
+            }
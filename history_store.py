@@ -0,0 +1,240 @@
+# history_store.py - история запросов: O(1) обновление в памяти, запись на диск в фоне
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryStore:
+    """
+    История запросов пользователей.
+
+    Общая история - OrderedDict (свежий запрос в конце, повтор переносится
+    в конец за O(1)) под одной блокировкой. Запросы к API диск не трогают:
+    фоновый поток раз в flush_interval секунд записывает накопившиеся
+    изменения одним файлом (временный файл + os.replace). Формат файла
+    прежний - JSON-список, свежие запросы первыми.
+
+    Если задан users_path, у каждого пользователя есть своя история в SQLite
+    (та же фоновая запись пачкой; раз в compact_every записей лишние строки
+    сверх limit удаляются). В памяти держатся истории не более user_cache
+    последних пользователей.
+    """
+
+    def __init__(self, path, limit=20, flush_interval=1.0, users_path=None,
+                 user_cache=1000, compact_every=50):
+        self.path = path
+        self.limit = limit
+        self.flush_interval = flush_interval
+        self.user_cache = user_cache
+        self.compact_every = compact_every
+
+        self._items = OrderedDict()
+        self._users = OrderedDict()       # пользователь -> OrderedDict запросов
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._pending_users = {}          # (пользователь, запрос) -> время
+        self._cleared_users = set()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+        self.flushes = 0
+        self.writes_coalesced = 0
+        self.last_error = None
+
+        for query in reversed(self._load_file()):
+            self._items[query] = None
+        self._trim(self._items)
+
+        self._db = None
+        if users_path:
+            self._db = sqlite3.connect(users_path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS user_history (
+                    user_id TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, query)
+                )
+            """)
+            self._db.commit()
+        self._db_lock = threading.Lock()
+        self._since_compaction = 0
+
+    def _load_file(self):
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+            return [q for q in history if isinstance(q, str)] if isinstance(history, list) else []
+        except Exception as e:
+            logger.warning("Ошибка загрузки истории: %s", e)
+            return []
+
+    def _trim(self, items):
+        while len(items) > self.limit:
+            items.popitem(last=False)
+
+    # ===== ЗАПРОСЫ API =====
+    def add(self, query, user_id=None):
+        """Запрос в начало истории (общей и, если задан user_id, пользовательской)"""
+        with self._lock:
+            self._items[query] = None
+            self._items.move_to_end(query)
+            self._trim(self._items)
+            if self._dirty:
+                self.writes_coalesced += 1
+            self._dirty = True
+
+            if user_id is not None and self._db is not None:
+                items = self._user_items(user_id)
+                items[query] = None
+                items.move_to_end(query)
+                self._trim(items)
+                self._pending_users[(user_id, query)] = time.time()
+        self._ensure_writer()
+
+    def recent(self, n=10, user_id=None):
+        """Последние n запросов, свежие первыми"""
+        with self._lock:
+            if user_id is not None and self._db is not None:
+                items = self._user_items(user_id)
+            else:
+                items = self._items
+            result = []
+            for query in reversed(items):
+                if len(result) >= n:
+                    break
+                result.append(query)
+            return result
+
+    def clear(self, user_id=None):
+        with self._lock:
+            if user_id is not None and self._db is not None:
+                self._user_items(user_id).clear()
+                self._pending_users = {k: v for k, v in self._pending_users.items() if k[0] != user_id}
+                self._cleared_users.add(user_id)
+            else:
+                self._items.clear()
+                self._dirty = True
+        self._ensure_writer()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def _user_items(self, user_id):
+        """История пользователя в памяти (при первом обращении - из SQLite); под self._lock"""
+        items = self._users.get(user_id)
+        if items is None:
+            items = OrderedDict()
+            if user_id not in self._cleared_users:
+                with self._db_lock:
+                    rows = self._db.execute(
+                        "SELECT query FROM user_history WHERE user_id = ? ORDER BY used_at DESC LIMIT ?",
+                        (user_id, self.limit)
+                    ).fetchall()
+                for (query,) in reversed(rows):
+                    items[query] = None
+            self._users[user_id] = items
+            while len(self._users) > self.user_cache:
+                self._users.popitem(last=False)
+        self._users.move_to_end(user_id)
+        return items
+
+    # ===== ФОНОВАЯ ЗАПИСЬ =====
+    def _ensure_writer(self):
+        if self._thread is None and not self._stopped:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Запись накопившихся изменений (вызывается фоновым потоком и при остановке)"""
+        with self._lock:
+            snapshot = list(reversed(self._items)) if self._dirty else None
+            self._dirty = False
+            pending, self._pending_users = self._pending_users, {}
+            cleared, self._cleared_users = self._cleared_users, set()
+
+        try:
+            if snapshot is not None:
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            if self._db is not None and (pending or cleared):
+                self._flush_users(pending, cleared)
+            if snapshot is not None or pending or cleared:
+                self.flushes += 1
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error("Ошибка сохранения истории: %s", e)
+            with self._lock:
+                # Повторим при следующей записи
+                self._dirty = self._dirty or snapshot is not None
+                for key, used_at in pending.items():
+                    self._pending_users.setdefault(key, used_at)
+                self._cleared_users |= cleared
+
+    def _flush_users(self, pending, cleared):
+        with self._db_lock:
+            db = self._db
+            for user_id in cleared:
+                db.execute("DELETE FROM user_history WHERE user_id = ?", (user_id,))
+            db.executemany(
+                "INSERT INTO user_history (user_id, query, used_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, query) DO UPDATE SET used_at = excluded.used_at",
+                [(user_id, query, used_at) for (user_id, query), used_at in pending.items()]
+            )
+            self._since_compaction += len(pending)
+            if self._since_compaction >= self.compact_every:
+                self._compact()
+            db.commit()
+
+    def _compact(self):
+        """Удаление записей сверх limit у каждого пользователя"""
+        self._db.execute("""
+            DELETE FROM user_history WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY used_at DESC) AS rn
+                    FROM user_history
+                ) WHERE rn > ?
+            )
+        """, (self.limit,))
+        self._since_compaction = 0
+
+    def stop(self):
+        """Остановка фоновой записи с финальным сбросом на диск"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._items),
+                'users_cached': len(self._users),
+                'per_user': self._db is not None,
+                'pending': self._dirty or bool(self._pending_users),
+                'flushes': self.flushes,
+                'writes_coalesced': self.writes_coalesced,
+                'last_error': self.last_error,
+            }
@@ -0,0 +1,440 @@
+# index_advisor.py - рекомендации индексов по журналу выполненных запросов
+#
+# Журнал пишет WorkloadLog (app.py, asgi_app.py): каждая строка JSONL -
+# выполненный SQL, время выполнения и число строк. Советчик группирует
+# запросы по форме (query_planner.parameterize), разбирает условия WHERE/ON
+# и ORDER BY и предлагает индексы:
+#   равенство (=, IN)               -> B-tree, несколько столбцов - составной
+#   равенство + диапазон/сортировка -> составной B-tree (равенства первыми)
+#   диапазон (<, >, BETWEEN)        -> B-tree
+#   ORDER BY без фильтра            -> B-tree по ключам сортировки
+#   LIKE/ILIKE                      -> GIN с gin_trgm_ops (расширение pg_trgm)
+# Для каждой рекомендации сравниваются оценки EXPLAIN до и после: индекс
+# создается внутри транзакции, которая затем откатывается. На время
+# построения такого индекса запись в таблицу блокируется - запускайте
+# оценку вне пиковой нагрузки или с --no-evaluate. --apply создает только
+# индексы, с которыми оценка стоимости снижается.
+#
+# Запуск:  python index_advisor.py [--log workload_log.jsonl] [--top 10] [--apply]
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import config
+from query_planner import parameterize, summarize_plan
+from sql_validator import tokenize, KEYWORDS, DEFAULT_WHITELIST, SQLValidationError
+
+logger = logging.getLogger(__name__)
+
+# Сколько примеров каждой формы запроса оценивать через EXPLAIN
+EXPLAIN_SAMPLES = 3
+
+EXISTING_INDEXES_QUERY = """
+    SELECT t.relname, i.relname, am.amname, array_agg(a.attname ORDER BY k.n)
+    FROM pg_index x
+    JOIN pg_class t ON t.oid = x.indrelid
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_am am ON am.oid = i.relam
+    JOIN pg_namespace ns ON ns.oid = t.relnamespace
+    CROSS JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, n)
+    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+    WHERE ns.nspname = 'public'
+    GROUP BY t.relname, i.relname, am.amname;
+"""
+
+_EQUALITY = {'=', 'IN'}
+_RANGE = {'<', '>', '<=', '>=', 'BETWEEN'}
+_PATTERN = {'LIKE', 'ILIKE'}
+_MIRROR = {'<': '>', '>': '<', '<=': '>=', '>=': '<=', '=': '='}
+
+
+# ===== ЖУРНАЛ ЗАПРОСОВ =====
+class WorkloadLog:
+    """
+    Журнал выполненных запросов (JSONL). record() только добавляет строку
+    в буфер; фоновый поток раз в flush_interval секунд дописывает буфер в
+    файл одним вызовом write (O_APPEND, поэтому несколько процессов могут
+    писать в один файл). При превышении max_bytes файл переименовывается
+    в <path>.1 и журнал начинается заново.
+    """
+
+    def __init__(self, path, flush_interval=5.0, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="workload-log", daemon=True)
+        self._thread.start()
+        self.recorded = 0
+
+    def record(self, sql, elapsed_ms, rows=None):
+        line = json.dumps({'ts': round(time.time(), 3), 'sql': sql, 'ms': round(elapsed_ms, 3),
+                           'rows': rows}, ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line)
+            self.recorded += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + '.1')
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, ('\n'.join(lines) + '\n').encode('utf-8'))
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.error("⚠️  Не удалось записать журнал запросов: %s", e)
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {'path': self.path, 'recorded': self.recorded, 'buffered': len(self._buffer)}
+
+
+def read_workload(paths):
+    """Записи журнала, сгруппированные по форме запроса"""
+    shapes = OrderedDict()
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    shape = parameterize(entry['sql'])[0]
+                except (ValueError, KeyError, SQLValidationError):
+                    continue
+                stats = shapes.get(shape)
+                if stats is None:
+                    stats = shapes[shape] = {'shape': shape, 'count': 0, 'total_ms': 0.0,
+                                             'max_ms': 0.0, 'samples': []}
+                stats['count'] += 1
+                stats['total_ms'] += entry.get('ms') or 0.0
+                stats['max_ms'] = max(stats['max_ms'], entry.get('ms') or 0.0)
+                if entry['sql'] not in stats['samples'] and len(stats['samples']) < EXPLAIN_SAMPLES:
+                    stats['samples'].append(entry['sql'])
+    return list(shapes.values())
+
+
+# ===== РАЗБОР УСЛОВИЙ =====
+def analyze_sql(sql, whitelist=None):
+    """
+    Использование столбцов в запросе: {таблица: {'eq', 'range', 'pattern': [...],
+    'order': [...], 'limit': bool}}. Столбцы внутри функций (LOWER(x) = ...)
+    не учитываются - обычный индекс по столбцу им не поможет.
+    """
+    whitelist = whitelist or DEFAULT_WHITELIST
+    tokens = [t for t in tokenize(sql) if t[0] not in ('ws', 'comment')]
+    words = [value.upper() if kind == 'ident' else value for kind, value in tokens]
+
+    aliases = {}
+    clause = None
+    depth_in_function = []
+    usage = {}
+    order_keys = []
+    has_limit = False
+
+    def table_usage(table):
+        return usage.setdefault(table, {'eq': [], 'range': [], 'pattern': [], 'order': [], 'limit': False})
+
+    def resolve(qualifier, column):
+        if qualifier is not None:
+            table = aliases.get(qualifier.lower(), qualifier.lower())
+            return table if column in whitelist.get(table, ()) else None
+        for table in set(aliases.values()):
+            if column in whitelist.get(table, ()):
+                return table
+        return None
+
+    def add(kind, table, column):
+        columns = table_usage(table)[kind]
+        if column not in columns:
+            columns.append(column)
+
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        word = words[i]
+        nxt = words[i + 1] if i + 1 < len(tokens) else None
+
+        if word in ('SELECT', 'WHERE', 'HAVING', 'ON'):
+            clause = word
+        elif word in ('FROM', 'JOIN') and not any(depth_in_function):
+            clause = 'FROM'
+        elif word == 'BY' and i and words[i - 1] in ('ORDER', 'GROUP'):
+            clause = words[i - 1]
+        elif word in ('LIMIT', 'FETCH'):
+            clause = 'LIMIT'
+            has_limit = True
+        elif value == '(':
+            # Скобка сразу после имени функции (COUNT(, LOWER(), а не IN ( или AND (
+            depth_in_function.append(
+                i > 0 and tokens[i - 1][0] == 'ident' and words[i - 1] not in KEYWORDS
+            )
+        elif value == ')' and depth_in_function:
+            depth_in_function.pop()
+
+        if clause == 'FROM' and kind == 'ident' and word not in KEYWORDS:
+            table = value.lower()
+            if table in whitelist:
+                aliases.setdefault(table, table)
+                alias_at = i + 2 if nxt == 'AS' else i + 1
+                if alias_at < len(tokens) and tokens[alias_at][0] == 'ident' and words[alias_at] not in KEYWORDS:
+                    aliases[tokens[alias_at][1].lower()] = table
+                    i = alias_at
+        elif kind == 'ident' and word not in KEYWORDS and nxt != '(' and nxt != '.':
+            qualifier = tokens[i - 2][1] if i >= 2 and tokens[i - 1][1] == '.' else None
+            column = value.lower()
+            in_function = any(depth_in_function)
+            table = resolve(qualifier, column)
+            if table is not None and not in_function:
+                if clause in ('WHERE', 'ON'):
+                    after = nxt             # NOT IN / NOT LIKE индексом не ускоряются
+                    before = words[i - 1] if qualifier is None else words[i - 3]
+                    if after in _EQUALITY:
+                        add('eq', table, column)
+                    elif after in _RANGE:
+                        add('range', table, column)
+                    elif after in _PATTERN:
+                        add('pattern', table, column)
+                    elif before in _MIRROR:
+                        add('eq' if before == '=' else 'range', table, column)
+                elif clause == 'ORDER':
+                    order_keys.append((table, column))
+        i += 1
+
+    for table, column in order_keys:
+        if column not in table_usage(table)['order']:
+            table_usage(table)['order'].append(column)
+    for table in usage:
+        usage[table]['limit'] = has_limit
+    return usage
+
+
+# ===== РЕКОМЕНДАЦИИ =====
+class IndexCandidate:
+    """Предлагаемый индекс и формы запросов, которым он поможет"""
+
+    def __init__(self, table, columns, method='btree'):
+        self.table = table
+        self.columns = tuple(columns)
+        self.method = method
+        self.shapes = []
+        self.score = 0.0
+        self.estimates = []
+
+    @property
+    def key(self):
+        return (self.table, self.method, self.columns)
+
+    @property
+    def name(self):
+        suffix = '_trgm' if self.method == 'gin' else ''
+        return f"idx_{self.table}_{'_'.join(self.columns)}{suffix}"[:63]
+
+    def ddl(self, concurrently=False):
+        how = 'CONCURRENTLY IF NOT EXISTS ' if concurrently else ''
+        if self.method == 'gin':
+            columns = ', '.join(f"{c} gin_trgm_ops" for c in self.columns)
+            return f"CREATE INDEX {how}{self.name} ON {self.table} USING gin ({columns});"
+        return f"CREATE INDEX {how}{self.name} ON {self.table} ({', '.join(self.columns)});"
+
+    @property
+    def improves(self):
+        """EXPLAIN с индексом дешевле, чем без него (нужна оценка evaluate)"""
+        if not self.estimates:
+            return False
+        before = sum(e['cost_before'] for e in self.estimates)
+        after = sum(e['cost_after'] for e in self.estimates)
+        return after < before
+
+    def covered_by(self, method, columns):
+        """Индекс (method, columns) уже обслуживает те же запросы"""
+        return method == self.method and tuple(columns[:len(self.columns)]) == self.columns
+
+    def to_dict(self):
+        return {
+            'table': self.table,
+            'columns': list(self.columns),
+            'method': self.method,
+            'ddl': self.ddl(),
+            'score_ms': round(self.score, 1),
+            'queries': len(self.shapes),
+            'estimates': self.estimates,
+            'improves': self.improves,
+        }
+
+
+def candidates_for(usage):
+    """Индексы, полезные одному запросу: список (таблица, столбцы, метод)"""
+    result = []
+    for table, use in usage.items():
+        eq, ranges, order = use['eq'], use['range'], use['order']
+        if eq:
+            tail = ranges[:1] or order[:1]
+            result.append((table, tuple(eq[:3]) + tuple(c for c in tail if c not in eq), 'btree'))
+        else:
+            for column in ranges:
+                result.append((table, (column,), 'btree'))
+            if order and not ranges and use['limit']:
+                result.append((table, tuple(order[:2]), 'btree'))
+        for column in use['pattern']:
+            result.append((table, (column,), 'gin'))
+    return result
+
+
+def recommend(workload, existing=(), whitelist=None, top=10):
+    """
+    Кандидаты, упорядоченные по суммарному времени запросов, которым они
+    помогут. existing - [(таблица, метод, [столбцы])] уже созданных индексов.
+    """
+    candidates = {}
+    for stats in workload:
+        try:
+            usage = analyze_sql(stats['samples'][0], whitelist)
+        except SQLValidationError:
+            continue
+        for table, columns, method in candidates_for(usage):
+            candidate = candidates.get((table, method, columns))
+            if candidate is None:
+                candidate = candidates[(table, method, columns)] = IndexCandidate(table, columns, method)
+            candidate.shapes.append(stats)
+            candidate.score += stats['total_ms']
+
+    # Более длинный составной индекс забирает запросы своих префиксов
+    ordered = sorted(candidates.values(), key=lambda c: (-len(c.columns), -c.score))
+    chosen = []
+    for candidate in ordered:
+        if any(candidate.covered_by(method, columns) for t, method, columns in existing if t == candidate.table):
+            continue
+        wider = next((c for c in chosen if c.table == candidate.table
+                      and candidate.covered_by(c.method, c.columns)), None)
+        if wider is not None:
+            wider.shapes.extend(s for s in candidate.shapes if s not in wider.shapes)
+            wider.score = sum(s['total_ms'] for s in wider.shapes)
+            continue
+        chosen.append(candidate)
+
+    chosen.sort(key=lambda c: -c.score)
+    return chosen[:top]
+
+
+# ===== ОЦЕНКА И ПРИМЕНЕНИЕ =====
+def existing_indexes(db):
+    results, _ = db.execute_query(EXISTING_INDEXES_QUERY)
+    return [(table, method, list(columns)) for table, _, method, columns in results or []]
+
+
+def _explain(cursor, sql):
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql.rstrip().rstrip(';')}")
+    return summarize_plan(cursor.fetchone()[0])
+
+
+def evaluate(db, candidate, lock_timeout_ms=2000):
+    """
+    Оценки EXPLAIN до и после для примеров запросов кандидата. Индекс
+    создается в транзакции, которая откатывается.
+    """
+    samples = [sql for stats in candidate.shapes for sql in stats['samples']]
+    with db.connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                before = [_explain(cursor, sql) for sql in samples]
+                cursor.execute("SET LOCAL lock_timeout = %s", (int(lock_timeout_ms),))
+                if candidate.method == 'gin':
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                cursor.execute(candidate.ddl())
+                after = [_explain(cursor, sql) for sql in samples]
+        finally:
+            conn.rollback()
+
+    candidate.estimates = [
+        {'sql': sql, 'cost_before': b['cost'], 'cost_after': a['cost'],
+         'node_before': b['node'], 'node_after': a['node']}
+        for sql, b, a in zip(samples, before, after)
+    ]
+    return candidate.estimates
+
+
+def apply(db, candidate):
+    """CREATE INDEX CONCURRENTLY (без блокировки записи; вне транзакции)"""
+    with db.connection() as conn:
+        conn.rollback()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cursor:
+                if candidate.method == 'gin':
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                cursor.execute(candidate.ddl(concurrently=True))
+        finally:
+            conn.autocommit = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Рекомендации индексов по журналу запросов")
+    parser.add_argument("--log", default=config.WORKLOAD_LOG_PATH or "workload_log.jsonl")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--min-count", type=int, default=1, help="не рассматривать более редкие формы")
+    parser.add_argument("--no-evaluate", action="store_true", help="без EXPLAIN до/после")
+    parser.add_argument("--apply", action="store_true",
+                        help="создать рекомендованные индексы, снижающие оценку стоимости")
+    parser.add_argument("--json", action="store_true", help="отчет в JSON")
+    args = parser.parse_args()
+    if args.apply and args.no_evaluate:
+        parser.error("--apply создает только индексы с выигрышем по EXPLAIN; уберите --no-evaluate")
+
+    from database import db
+
+    workload = [s for s in read_workload([args.log + '.1', args.log]) if s['count'] >= args.min_count]
+    print(f"📒 Форм запросов в журнале: {len(workload)}")
+    candidates = recommend(workload, existing_indexes(db), top=args.top)
+
+    for candidate in candidates:
+        if not args.no_evaluate:
+            try:
+                evaluate(db, candidate)
+            except Exception as e:
+                print(f"⚠️  Не удалось оценить {candidate.name}: {e}")
+        if not args.apply:
+            continue
+        if candidate.improves:
+            print(f"🔧 {candidate.ddl(concurrently=True)}")
+            apply(db, candidate)
+        elif candidate.estimates:
+            print(f"⏭️  Пропущен {candidate.name}: оценка стоимости не снижается")
+        else:
+            print(f"⏭️  Пропущен {candidate.name}: нет оценки EXPLAIN")
+
+    if args.json:
+        print(json.dumps([c.to_dict() for c in candidates], ensure_ascii=False, indent=2, default=str))
+        return
+    if not candidates:
+        print("✅ Рекомендаций нет")
+    for candidate in candidates:
+        print(f"\n{candidate.ddl()}")
+        print(f"   запросов: {len(candidate.shapes)}, суммарное время: {candidate.score:.1f} мс")
+        for estimate in candidate.estimates:
+            print(f"   {estimate['cost_before']:>10.1f} -> {estimate['cost_after']:>10.1f}  "
+                  f"({estimate['node_before']} -> {estimate['node_after']})  {estimate['sql'][:80]}")
+
+
+if __name__ == '__main__':
+    main()
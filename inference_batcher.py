@@ -0,0 +1,210 @@
+# inference_batcher.py - микробатчинг запросов к LLM
+import threading
+import time
+from collections import deque
+
+# Как часто ожидающий поток проверяет внешний флаг отмены (секунды)
+CANCEL_POLL_INTERVAL = 0.05
+
+
+class InferenceRequest:
+    """Один запрос на генерацию, ожидающий своей очереди в батче"""
+
+    def __init__(self, prompt):
+        self.prompt = prompt
+        self.enqueued_at = time.monotonic()
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+        self._cancelled = False
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_error(self, error):
+        self._error = error
+        self._done.set()
+
+    def cancel(self):
+        """Отмена запроса: вызывающему результат больше не нужен"""
+        self._cancelled = True
+        self._done.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Ожидание завершения без получения результата"""
+        return self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """Ожидание результата генерации"""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Превышено время ожидания генерации")
+        if self._cancelled:
+            raise RuntimeError("Запрос на генерацию отменен")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+def wait_result(request, timeout=None, cancel_event=None):
+    """
+    Ожидание результата InferenceRequest. По таймауту или cancel_event
+    (threading.Event) запрос отменяется и больше не занимает место в батче.
+    """
+    try:
+        if cancel_event is None:
+            return request.result(timeout)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not request.done():
+            if cancel_event.is_set():
+                request.cancel()
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("Превышено время ожидания генерации")
+            request.wait(CANCEL_POLL_INTERVAL)
+        return request.result(0)
+    except TimeoutError:
+        request.cancel()
+        raise
+
+
+class BatchingInferenceEngine:
+    """
+    Планировщик микробатчей для генерации.
+
+    Запросы из разных потоков попадают в общую очередь. Фоновый поток
+    забирает первый запрос, ждет не дольше max_wait_ms, пока наберется
+    до max_batch_size запросов, и прогоняет весь батч одним вызовом
+    generate_fn(prompts, should_stop) -> list[str]. should_stop() становится
+    True, когда все запросы батча отменены, - генерацию можно прервать.
+    Результаты раздаются обратно по InferenceRequest.
+    """
+
+    def __init__(self, generate_fn, max_batch_size=8, max_wait_ms=15):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size должен быть >= 1")
+
+        self.generate_fn = generate_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+
+        # Метрики
+        self._batch_sizes = {}        # размер батча -> сколько раз встречался
+        self._max_queue_depth = 0
+        self._requests_total = 0
+        self._batches_total = 0
+        self._queue_wait_total = 0.0
+        self._generate_time_total = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt):
+        """Постановка промпта в очередь, возвращает InferenceRequest"""
+        request = InferenceRequest(prompt)
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("Движок генерации остановлен")
+            self._queue.append(request)
+            self._requests_total += 1
+            self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+            self._cond.notify()
+        return request
+
+    def generate(self, prompt, timeout=None, cancel_event=None):
+        """
+        Синхронная генерация для одного промпта (через общий батч).
+        cancel_event (threading.Event) позволяет отменить ожидание извне.
+        """
+        return wait_result(self.submit(prompt), timeout, cancel_event)
+
+    def _collect_batch(self):
+        """Ожидание первого запроса и добор батча в пределах окна ожидания"""
+        with self._cond:
+            while not self._queue and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return None
+
+            deadline = time.monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            while self._queue and len(batch) < self.max_batch_size:
+                request = self._queue.popleft()
+                if not request.cancelled:
+                    batch.append(request)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            try:
+                outputs = self.generate_fn(
+                    [r.prompt for r in batch],
+                    lambda: all(r.cancelled for r in batch)
+                )
+                if len(outputs) != len(batch):
+                    raise RuntimeError(
+                        f"generate_fn вернул {len(outputs)} результатов на батч из {len(batch)}"
+                    )
+                for request, output in zip(batch, outputs):
+                    request.set_result(output)
+            except Exception as e:
+                for request in batch:
+                    request.set_error(e)
+            finished = time.monotonic()
+
+            with self._cond:
+                self._batches_total += 1
+                self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+                self._queue_wait_total += sum(started - r.enqueued_at for r in batch)
+                self._generate_time_total += finished - started
+
+    def shutdown(self):
+        """Остановка фонового потока; ожидающие запросы получают ошибку"""
+        with self._cond:
+            self._stopped = True
+            pending = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        for request in pending:
+            request.set_error(RuntimeError("Движок генерации остановлен"))
+        self._worker.join(timeout=5)
+
+    def stats(self):
+        """Глубина очереди и гистограмма размеров батчей"""
+        with self._cond:
+            served = sum(size * count for size, count in self._batch_sizes.items())
+            return {
+                'queue_depth': len(self._queue),
+                'max_queue_depth': self._max_queue_depth,
+                'requests_total': self._requests_total,
+                'batches_total': self._batches_total,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'avg_batch_size': round(served / self._batches_total, 2) if self._batches_total else 0.0,
+                'avg_queue_wait_ms': round(self._queue_wait_total / served * 1000, 3) if served else 0.0,
+                'avg_batch_time_ms': round(self._generate_time_total / self._batches_total * 1000, 3) if self._batches_total else 0.0,
+            }
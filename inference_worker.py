@@ -0,0 +1,557 @@
+# inference_worker.py - отдельный процесс генерации с общими весами модели
+#
+# Запуск:  LLM_WORKER_AUTHKEY=... python inference_worker.py --socket /tmp/text2sql-llm/worker.sock --processes 2
+# Веб-воркеры (app.py, asgi_app.py) подключаются к нему, если задан LLM_WORKER_SOCKET.
+#
+# Процесс-шаблон (запущен через spawn - чистый интерпретатор) загружает веса
+# один раз и делает fork дочерних процессов: страницы с весами остаются общими
+# (copy-on-write), так как при генерации они только читаются. Шаблон остается
+# однопоточным (torch в нем - с одним потоком), поэтому fork безопасен и при
+# перезапуске упавших процессов. Каждый дочерний процесс держит свой
+# BatchingInferenceEngine и слушает Unix-сокет "<socket>.<номер>"; главный
+# процесс слушает "<socket>" и сообщает клиентам адреса дочерних процессов.
+#
+# Сообщения - pickle (multiprocessing.connection), поэтому ключ
+# LLM_WORKER_AUTHKEY обязателен, а сокеты создаются в каталоге с правами 0700.
+#
+# Протокол (multiprocessing.connection, кортежи):
+#   клиент -> процесс:  ('generate', id, суффикс промпта, таймаут), ('cancel', id),
+#                       ('set_schema', текст схемы, {таблица: [столбцы]}), ('stats', id)
+#   процесс -> клиент:  ('result', id, текст), ('error', id, сообщение), ('stats', id, словарь)
+#   клиент -> родитель: ('workers',) -> [адреса], ('set_schema', ...) -> True
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+from config import config
+from inference_batcher import InferenceRequest, wait_result
+from logging_setup import configure_logging
+from metrics import LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед перезапуском упавшего дочернего процесса (секунды)
+RESPAWN_DELAY = 1.0
+STATS_TIMEOUT = 2.0
+# Период обновления снимка метрик дочерних процессов в InferenceClient:
+# /metrics и /api/health читают снимок и не ждут ответа по сокету
+STATS_INTERVAL = 5.0
+
+
+def _memory_stats():
+    """RSS и PSS процесса (PSS делит общие страницы между процессами), МБ"""
+    stats = {}
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty'):
+                    stats[name.lower() + '_mb'] = round(int(value.split()[0]) / 1024, 1)
+    except OSError:
+        pass
+    return stats
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _authkey(authkey=None):
+    """Ключ сокетов генерации: без него любой локальный пользователь может прислать pickle"""
+    key = authkey or config.LLM_WORKER_AUTHKEY
+    if not key:
+        raise RuntimeError("Не задан LLM_WORKER_AUTHKEY: сокеты генерации без ключа не запускаются")
+    return key.encode('utf-8')
+
+
+def _private_socket_dir(address):
+    """Каталог сокетов: создается с правами 0700; чужой или доступный другим - ошибка"""
+    directory = os.path.dirname(os.path.abspath(address))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"Каталог сокетов {directory} должен принадлежать пользователю "
+                           f"сервиса и иметь права 0700")
+    return directory
+
+
+# ===== ДОЧЕРНИЙ ПРОЦЕСС =====
+class _WorkerServer:
+    """Обслуживание клиентов в дочернем процессе: очередь батчей общая на всех"""
+
+    def __init__(self, converter, address, authkey):
+        self.converter = converter
+        self.address = address
+        self.authkey = authkey
+        self._schema_lock = threading.Lock()
+
+    def serve_forever(self):
+        _unlink(self.address)
+        listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        logger.info("🧩 Процесс генерации %s слушает %s", os.getpid(), self.address)
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError) as e:
+                logger.warning("⚠️  Отклонено подключение к процессу генерации: %s", e)
+                continue
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _apply_schema(self, db_schema, identifiers):
+        """Новая схема (каждый веб-воркер присылает свою копию - повторы пропускаем)"""
+        with self._schema_lock:
+            converter = self.converter
+            if db_schema == converter.db_schema and identifiers == converter.schema_identifiers:
+                return
+            converter.set_schema(db_schema, identifiers)
+
+    def stats(self):
+        converter = self.converter
+        tokens, tokens_sum = LLM_TOKENS.snapshot()
+        return dict(
+            converter.engine.stats(),
+            pid=os.getpid(),
+            generations=tokens,
+            generated_tokens=int(tokens_sum),
+            grammar=converter._grammar.stats() if converter._grammar is not None else None,
+            **_memory_stats()
+        )
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+        pending = {}
+
+        def send(message):
+            with send_lock:
+                conn.send(message)
+
+        def reply(request_id, request, timeout):
+            try:
+                message = ('result', request_id, request.result(timeout))
+            except Exception as e:
+                request.cancel()
+                message = ('error', request_id, str(e))
+            pending.pop(request_id, None)
+            try:
+                send(message)
+            except OSError:
+                pass
+
+        try:
+            while True:
+                message = conn.recv()
+                op = message[0]
+                if op == 'generate':
+                    _, request_id, prompt, timeout = message
+                    request = self.converter.engine.submit(prompt)
+                    pending[request_id] = request
+                    threading.Thread(target=reply, args=(request_id, request, timeout), daemon=True).start()
+                elif op == 'cancel':
+                    request = pending.pop(message[1], None)
+                    if request is not None:
+                        request.cancel()
+                elif op == 'set_schema':
+                    self._apply_schema(message[1], message[2])
+                elif op == 'stats':
+                    send(('stats', message[1], self.stats()))
+        except (EOFError, OSError):
+            pass
+        finally:
+            # Клиент ушел - его запросы в батче больше никому не нужны
+            for request in list(pending.values()):
+                request.cancel()
+            conn.close()
+
+
+def _run_child(converter, address, authkey, threads):
+    import torch
+
+    torch.set_num_threads(threads)
+    # Кэш префикса и поток батчей создаются уже после fork
+    converter._start_engine()
+    _WorkerServer(converter, address, authkey).serve_forever()
+
+
+# ===== ПРОЦЕСС-ШАБЛОН =====
+def _template(addresses, authkey, model_name, backend, threads, control):
+    """
+    Веса в памяти и fork дочерних процессов (в том числе при перезапуске).
+    Запускается через spawn и не создает потоков: fork из многопоточного
+    процесса (поток сокета, пул потоков torch) небезопасен. control - канал
+    от главного процесса: ('set_schema', ...) для будущих дочерних процессов.
+    """
+    import torch
+    from llm_sql_converter import LLMSQLConverter
+
+    configure_logging(config.LOG_LEVEL, config.LOG_SAMPLE_RATE)
+    # Один поток: пул потоков torch не создается до fork (дочерние процессы
+    # задают свое число потоков в _run_child)
+    torch.set_num_threads(1)
+    processes = len(addresses)
+    converter = LLMSQLConverter(model_name, lazy=True, backend=backend, serving=True)
+    converter._load_weights()
+    if converter.backend_name == 'onnx' and processes > 1:
+        # Сессия ONNX Runtime не переносит fork: каждый процесс загрузит модель сам
+        logger.warning("⚠️  Бэкенд onnx: веса не разделяются между процессами генерации")
+    children = {}
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            control.close()
+            try:
+                if converter.backend_name == 'onnx' and processes > 1:
+                    converter._load_weights()
+                _run_child(converter, addresses[index], authkey, threads)
+            except BaseException as e:
+                logger.error("❌ Процесс генерации %s завершился: %s", index, e)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def stop(signum=None, frame=None):
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for path in addresses:
+            _unlink(path)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for index in range(processes):
+        spawn(index)
+    logger.info("🧩 Процессов генерации: %s, потоков torch на процесс: %s", processes, threads)
+
+    while True:
+        if control.poll(RESPAWN_DELAY):
+            try:
+                message = control.recv()
+            except (EOFError, OSError):
+                stop()      # главный процесс завершился
+            if message[0] == 'set_schema':
+                # Модель в шаблоне не "готова", поэтому кэш префикса здесь не считается
+                converter.set_schema(message[1], message[2])
+        while children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+            index = children.pop(pid, None)
+            if index is None:
+                continue
+            logger.warning("⚠️  Процесс генерации %s (pid %s) завершился со статусом %s, перезапуск",
+                           index, pid, status)
+            time.sleep(RESPAWN_DELAY)
+            spawn(index)
+
+
+# ===== ГЛАВНЫЙ ПРОЦЕСС =====
+def serve(address, processes=1, authkey=None, model_name="distilgpt2", backend=None):
+    """Процесс-шаблон с весами (он делает fork дочерних) и справочный сокет для клиентов"""
+    authkey = _authkey(authkey)
+    _private_socket_dir(address)
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    addresses = [f"{address}.{i}" for i in range(processes)]
+    context = multiprocessing.get_context('spawn')
+    state = {'template': None, 'control': None, 'schema': None, 'stopping': False}
+    lock = threading.Lock()
+
+    def start_template():
+        control, template_end = context.Pipe()
+        template = context.Process(
+            target=_template, name="llm-template",
+            args=(addresses, authkey, model_name, backend, threads, template_end)
+        )
+        template.start()
+        template_end.close()
+        with lock:
+            state.update(template=template, control=control)
+            if state['schema'] is not None:
+                control.send(('set_schema',) + state['schema'])
+        return template
+
+    def stop(signum, frame):
+        state['stopping'] = True
+        template = state['template']
+        if template is not None and template.is_alive():
+            template.terminate()
+            template.join(5)
+        for path in [address] + addresses:
+            _unlink(path)
+        os._exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    template = start_template()
+
+    # Справочник: адреса дочерних процессов; схему передаем шаблону (для перезапусков)
+    def directory():
+        _unlink(address)
+        listener = Listener(address, family='AF_UNIX', authkey=authkey)
+        while True:
+            try:
+                with listener.accept() as conn:
+                    message = conn.recv()
+                    if message[0] == 'workers':
+                        conn.send(addresses)
+                    elif message[0] == 'set_schema':
+                        with lock:
+                            state['schema'] = (message[1], message[2])
+                            try:
+                                state['control'].send(('set_schema', message[1], message[2]))
+                            except OSError:
+                                pass    # шаблон перезапускается и получит схему при старте
+                        conn.send(True)
+            except (OSError, EOFError, AuthenticationError) as e:
+                logger.warning("⚠️  Ошибка справочного сокета: %s", e)
+
+    threading.Thread(target=directory, name="worker-directory", daemon=True).start()
+    logger.info("✅ Сервер генерации готов: %s", address)
+
+    while True:
+        template.join()
+        if state['stopping']:
+            return
+        logger.warning("⚠️  Процесс-шаблон генерации завершился со статусом %s, перезапуск", template.exitcode)
+        time.sleep(RESPAWN_DELAY)
+        template = start_template()
+
+
+# ===== КЛИЕНТ (в веб-воркере) =====
+class _RemoteRequest(InferenceRequest):
+    """Запрос, исполняемый в процессе генерации; отмена передается туда же"""
+
+    def __init__(self, channel, request_id):
+        super().__init__(None)
+        self.channel = channel
+        self.request_id = request_id
+
+    def cancel(self):
+        if not self.done():
+            self.channel.pending.pop(self.request_id, None)
+            try:
+                self.channel.send(('cancel', self.request_id))
+            except OSError:
+                pass
+        super().cancel()
+
+
+class _WorkerChannel:
+    """Соединение с одним дочерним процессом и поток чтения ответов"""
+
+    def __init__(self, address, authkey):
+        self.address = address
+        self.conn = Client(address, family='AF_UNIX', authkey=authkey)
+        self.pending = {}
+        self.alive = True
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read, name="llm-worker-reader", daemon=True).start()
+
+    def send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _read(self):
+        try:
+            while True:
+                kind, request_id, payload = self.conn.recv()
+                request = self.pending.pop(request_id, None)
+                if request is None:
+                    continue
+                if kind == 'error':
+                    request.set_error(RuntimeError(payload))
+                else:
+                    request.set_result(payload)
+        except (EOFError, OSError):
+            pass
+        self.alive = False
+        for request in list(self.pending.values()):
+            request.set_error(ConnectionError(f"Процесс генерации {self.address} недоступен"))
+        self.pending.clear()
+
+    def close(self):
+        self.alive = False
+        try:
+            self.conn.close()
+        except OSError:
+            pass
+
+
+class InferenceClient:
+    """
+    Клиент inference_worker.py с интерфейсом BatchingInferenceEngine
+    (generate, stats). Запрос уходит в дочерний процесс с наименьшим числом
+    ожидающих ответов; при обрыве соединения адреса запрашиваются заново.
+    stats() возвращает снимок, который фоновый поток обновляет раз в
+    STATS_INTERVAL секунд.
+    """
+
+    def __init__(self, address, authkey=None):
+        self.address = address
+        self.authkey = _authkey(authkey)
+        self._channels = []
+        self._schema = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stats = {'worker': address, 'processes': []}
+        self._stats_updated = None
+        self._stats_thread = None
+
+    def connect(self):
+        """Подключение ко всем дочерним процессам (повторное - только если есть обрывы)"""
+        with self._lock:
+            if self._channels and all(c.alive for c in self._channels):
+                return
+            for channel in self._channels:
+                channel.close()
+            self._channels = []
+
+            with Client(self.address, family='AF_UNIX', authkey=self.authkey) as conn:
+                conn.send(('workers',))
+                addresses = conn.recv()
+            self._channels = [_WorkerChannel(a, self.authkey) for a in addresses]
+            if self._schema is not None:
+                for channel in self._channels:
+                    channel.send(('set_schema',) + self._schema)
+            if self._stats_thread is None:
+                self._stats_thread = threading.Thread(
+                    target=self._refresh_stats_loop, name="llm-worker-stats", daemon=True
+                )
+                self._stats_thread.start()
+
+    def wait_until_connected(self, timeout):
+        """Ожидание запуска сервера генерации"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.connect()
+                return
+            except (OSError, EOFError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+    def set_schema(self, db_schema, identifiers):
+        """Схема для всех дочерних процессов и для родителя (на случай перезапуска)"""
+        self._schema = (db_schema, identifiers)
+        with Client(self.address, family='AF_UNIX', authkey=self.authkey) as conn:
+            conn.send(('set_schema', db_schema, identifiers))
+            conn.recv()
+        for channel in list(self._channels):
+            try:
+                channel.send(('set_schema', db_schema, identifiers))
+            except OSError:
+                channel.close()
+
+    def _pick(self):
+        channels = [c for c in self._channels if c.alive]
+        if not channels:
+            self.connect()
+            channels = [c for c in self._channels if c.alive]
+            if not channels:
+                raise ConnectionError("Нет доступных процессов генерации")
+        return min(channels, key=lambda c: len(c.pending))
+
+    def _submit(self, message_for):
+        channel = self._pick()
+        request = _RemoteRequest(channel, next(self._ids))
+        channel.pending[request.request_id] = request
+        try:
+            channel.send(message_for(request.request_id))
+        except OSError as e:
+            channel.pending.pop(request.request_id, None)
+            channel.close()
+            raise ConnectionError(f"Процесс генерации недоступен: {e}")
+        return request
+
+    def generate(self, prompt, timeout=None, cancel_event=None):
+        request = self._submit(lambda request_id: ('generate', request_id, prompt, timeout))
+        return wait_result(request, timeout, cancel_event)
+
+    def stats(self):
+        """Последний снимок метрик дочерних процессов (без обращения к ним)"""
+        updated = self._stats_updated
+        age = round(time.monotonic() - updated, 1) if updated is not None else None
+        return dict(self._stats, age_s=age)
+
+    def refresh_stats(self):
+        """
+        Опрос дочерних процессов: запросы уходят всем сразу, поэтому опрос
+        занимает не больше STATS_TIMEOUT при любом числе процессов
+        """
+        requests = []
+        for channel in list(self._channels):
+            if not channel.alive:
+                requests.append((channel, None, None))
+                continue
+            request = _RemoteRequest(channel, next(self._ids))
+            channel.pending[request.request_id] = request
+            try:
+                channel.send(('stats', request.request_id))
+                requests.append((channel, request, None))
+            except OSError as e:
+                request.cancel()
+                requests.append((channel, None, e))
+
+        deadline = time.monotonic() + STATS_TIMEOUT
+        workers = []
+        for channel, request, error in requests:
+            if request is not None:
+                try:
+                    workers.append(dict(request.result(max(deadline - time.monotonic(), 0)),
+                                        address=channel.address, alive=True))
+                    continue
+                except Exception as e:
+                    request.cancel()
+                    error = e
+            worker = {'address': channel.address, 'alive': channel.alive}
+            if error is not None:
+                worker['error'] = str(error)
+            workers.append(worker)
+
+        self._stats = {'worker': self.address, 'processes': workers}
+        self._stats_updated = time.monotonic()
+        return self.stats()
+
+    def _refresh_stats_loop(self):
+        while True:
+            try:
+                self.refresh_stats()
+            except Exception as e:
+                logger.debug("Метрики процессов генерации недоступны: %s", e)
+            time.sleep(STATS_INTERVAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процесс генерации SQL с общими весами модели")
+    parser.add_argument("--socket", default=config.LLM_WORKER_SOCKET or "/tmp/text2sql-llm/worker.sock",
+                        help="путь сокета; каталог создается с правами 0700")
+    parser.add_argument("--processes", type=int, default=config.LLM_WORKER_PROCESSES)
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--backend", default=None, help="см. llm_backends.py (по умолчанию LLM_BACKEND)")
+    args = parser.parse_args()
+    configure_logging(config.LOG_LEVEL, config.LOG_SAMPLE_RATE)
+    try:
+        serve(args.socket, args.processes, model_name=args.model, backend=args.backend)
+    except RuntimeError as e:
+        parser.exit(1, f"❌ {e}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# llm_backends.py - варианты загрузки модели (точность, квантование, ONNX)
+#
+# Выбор через Config.LLM_BACKEND:
+#   auto - fp16 на GPU, fp32 на CPU
+#   fp32 - базовый вариант
+#   fp16 - только GPU (на CPU матричные операции в fp16 медленные или недоступны)
+#   bf16 - bfloat16, если процессор/видеокарта его поддерживает (иначе fp32)
+#   int8 - динамическое квантование линейных слоев (CPU)
+#   onnx - экспорт в ONNX и исполнение в ONNX Runtime (CPU)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Fp32Backend:
+    name = 'fp32'
+    dtype_name = 'float32'
+    # Можно ли передавать в generate готовые past_key_values (кэш префикса промпта)
+    supports_prefix_cache = True
+
+    def _dtype(self, torch, device):
+        return getattr(torch, self.dtype_name)
+
+    def load(self, model_name, device):
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            torch_dtype=self._dtype(torch, device),
+            device_map="auto" if device == "cuda" else None,
+            local_files_only=True
+        )
+        if device == "cpu":
+            model = model.to(device)
+        model.eval()
+        return model
+
+
+class Fp16Backend(Fp32Backend):
+    name = 'fp16'
+    dtype_name = 'float16'
+
+    def load(self, model_name, device):
+        if device != "cuda":
+            raise ValueError("Бэкенд fp16 поддерживается только на GPU, для CPU используйте fp32/bf16/int8")
+        return super().load(model_name, device)
+
+
+class Bf16Backend(Fp32Backend):
+    name = 'bf16'
+    dtype_name = 'bfloat16'
+
+    @staticmethod
+    def is_supported(torch, device):
+        """Проверка, что матричное умножение в bfloat16 работает на устройстве"""
+        if device == "cuda":
+            return torch.cuda.is_bf16_supported()
+        try:
+            a = torch.ones((8, 8), dtype=torch.bfloat16)
+            (a @ a).sum().item()
+            return True
+        except RuntimeError:
+            return False
+
+    def _dtype(self, torch, device):
+        if self.is_supported(torch, device):
+            return torch.bfloat16
+        logger.warning("⚠️  bfloat16 не поддерживается на этом устройстве, использую float32")
+        self.name = 'fp32'
+        return torch.float32
+
+
+def _conv1d_to_linear(model):
+    """
+    GPT-2 хранит проекции в transformers Conv1D, которые quantize_dynamic
+    не видит. Заменяем их эквивалентными nn.Linear (веса транспонированы).
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in model.modules():
+        for child_name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data.clone()
+                setattr(parent, child_name, linear)
+    return model
+
+
+class Int8DynamicBackend(Fp32Backend):
+    name = 'int8'
+
+    def load(self, model_name, device):
+        if device != "cpu":
+            raise ValueError("Динамическое квантование int8 поддерживается только на CPU")
+        import torch
+
+        model = _conv1d_to_linear(super().load(model_name, device))
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend:
+    name = 'onnx'
+    # ORTModelForCausalLM сам управляет кэшем ключей/значений
+    supports_prefix_cache = False
+
+    def load(self, model_name, device):
+        import os
+        from config import config
+        from optimum.onnxruntime import ORTModelForCausalLM
+
+        export_dir = os.path.join(config.LLM_ONNX_DIR, model_name.replace('/', '__'))
+        if os.path.isdir(export_dir):
+            return ORTModelForCausalLM.from_pretrained(export_dir, use_cache=True)
+
+        # Первый запуск: экспорт в ONNX и сохранение, дальше грузим готовый файл
+        model = ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True,
+                                                    local_files_only=True)
+        model.save_pretrained(export_dir)
+        return model
+
+
+BACKENDS = {
+    'fp32': Fp32Backend,
+    'fp16': Fp16Backend,
+    'bf16': Bf16Backend,
+    'int8': Int8DynamicBackend,
+    'onnx': OnnxBackend,
+}
+
+
+def get_backend(name, device):
+    """Экземпляр бэкенда по имени из конфигурации"""
+    if name == 'auto':
+        name = 'fp16' if device == "cuda" else 'fp32'
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд LLM: {name} (доступны: auto, {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
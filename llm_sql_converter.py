@@ -1,44 +1,64 @@
 # llm_sql_converter.py - ИСПРАВЛЕННАЯ ВЕРСИЯ
+import logging
 import re
-import torch
+import threading
+import time
+from config import config
+from inference_batcher import BatchingInferenceEngine
+from translation_cache import TranslationCache, schema_fingerprint, KEY_VERSION
+from rule_engine import RuleEngine
+from llm_backends import get_backend
+from few_shot import FewShotIndex
+from sql_grammar import SQLGrammar, token_bytes
+from inference_worker import InferenceClient
+from metrics import LLM_TOKENS, STAGE_SECONDS, TRANSLATIONS
+
+logger = logging.getLogger(__name__)
 
 class LLMSQLConverter:
-    def __init__(self, model_name="distilgpt2"):
+    # Состояния загрузки модели
+    STATE_NOT_LOADED = 'not_loaded'
+    STATE_LOADING = 'loading'
+    STATE_READY = 'ready'
+    STATE_FAILED = 'failed'
+    
+    def __init__(self, model_name="distilgpt2", lazy=False, backend=None, serving=False):
         """
-        Используем модель для Text-to-SQL
+        Используем модель для Text-to-SQL.
+        lazy=True - модель не загружается в конструкторе; загрузку запускает
+        start_loading() в фоне, а пока она идет, работают кэш и fallback.
+        backend - вариант загрузки модели (см. llm_backends.py), по умолчанию Config.LLM_BACKEND.
+        serving=True - экземпляр внутри inference_worker.py: только генерация,
+        без кэша переводов на диске и библиотеки примеров.
+        Если задан Config.LLM_WORKER_SOCKET (и serving=False), модель не
+        загружается в процесс, а генерацию выполняет inference_worker.py.
         """
-        print(f"🔄 Загрузка модели {model_name}...")
-        
+        self.model_name = model_name
+        self.backend_name = backend or config.LLM_BACKEND
+        self.serving = serving
+        self.worker_address = None if serving else (config.LLM_WORKER_SOCKET or None)
         self.model = None
         self.tokenizer = None
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"   Устройство: {self.device}")
+        self.engine = None
+        self.device = None
+        self.state = self.STATE_NOT_LOADED
+        self.load_error = None
+        self._loader = None
+        self._ready = threading.Event()
         
-        # Пробуем загрузить модель
-        try:
-            from transformers import AutoTokenizer, AutoModelForCausalLM
-            
-            # ПРОСТАЯ загрузка без сложных параметров
-            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                torch_dtype=torch.float16,
-                device_map="auto" if self.device == "cuda" else None,
-                local_files_only=True 
-            )
-            
-            if self.device == "cpu":
-                self.model = self.model.to(self.device)
-            
-            print("✅ Модель успешно загружена!")
-            self.model_loaded = True
-            
-        except Exception as e:
-            print(f"❌ Не удалось загрузить модель: {e}")
-            print("   Использую улучшенный fallback")
-            self.model_loaded = False
+        # Кэш прямого прохода по неизменной части промпта (past_key_values)
+        self.prefix_cache_enabled = config.LLM_PREFIX_CACHE
+        self._prefix_ids = None
+        self._prefix_past = None
         
-        # Контекст базы данных
+        # Ограничение генерации грамматикой SQL по именам из схемы
+        self.constrained = config.LLM_CONSTRAINED_DECODING
+        self.schema_identifiers = None
+        self._vocab_bytes = None
+        self._terminator_ids = None
+        self._grammar = None
+        
+        # Контекст базы данных (до загрузки каталога схемы, см. schema_catalog.py и set_schema)
         self.db_schema = """
         База данных "company_db", таблица "employees":
         
@@ -56,158 +76,487 @@ class LLMSQLConverter:
         Важно: Для поиска по отделу используй department = 'Название_отдела'.
         Для зарплаты используй salary >, <, =.
         """
+        
+        # Библиотека проверенных примеров: похожие вопросы идут в промпт после кэшируемого префикса
+        self.few_shot = None
+        if config.FEW_SHOT_ENABLED and not serving:
+            try:
+                self.few_shot = FewShotIndex(
+                    config.FEW_SHOT_DIR,
+                    seed_path=config.FEW_SHOT_SEED_PATH,
+                    mode=config.FEW_SHOT_INDEX,
+                    ivf_min_size=config.FEW_SHOT_IVF_MIN_SIZE,
+                    nprobe=config.FEW_SHOT_NPROBE
+                )
+                logger.info("📚 Примеров для промпта: %s", len(self.few_shot.examples))
+            except Exception as e:
+                logger.warning("⚠️  Индекс примеров недоступен: %s", e)
+        
+        # Правила для fallback компилируются один раз
+        self.rules = RuleEngine(config.SUPPORTED_DEPARTMENTS)
+        
+        # Гонка правил и LLM (см. convert)
+        self.latency_budget_ms = config.LLM_LATENCY_BUDGET_MS
+        self.rule_confidence_threshold = config.RULE_CONFIDENCE_THRESHOLD
+        
+        # Кэш готовых переводов: повторные вопросы не доходят до модели
+        self.cache = TranslationCache(
+            max_entries=config.TRANSLATION_CACHE_SIZE,
+            ttl=config.TRANSLATION_CACHE_TTL,
+            disk_path=None if serving else (config.TRANSLATION_CACHE_PATH or None),
+            fingerprint=self._schema_fingerprint()
+        )
+        
+        if not lazy:
+            self.load_model()
     
-    def _fallback_sql(self, query):
-        """УЛУЧШЕННЫЙ fallback - теперь понимает зарплату!"""
-        import re
-        query_lower = query.lower()
-        
-        # Извлекаем число
-        numbers = re.findall(r'\d+', query)
-        amount = numbers[0] if numbers else None
-        
-        # Определяем оператор
-        operator = None
-        if "больше" in query_lower or "выше" in query_lower or "свыше" in query_lower:
-            operator = ">"
-        elif "меньше" in query_lower or "ниже" in query_lower or "менее" in query_lower:
-            operator = "<"
-        elif "равно" in query_lower or "равен" in query_lower:
-            operator = "="
-        elif "от" in query_lower and "до" in query_lower:
-            # Обработка диапазона "от X до Y"
-            if numbers and len(numbers) >= 2:
-                return f"SELECT first_name, last_name, position, department, salary FROM employees WHERE salary BETWEEN {numbers[0]} AND {numbers[1]};"
-        
-        # Основная логика
-        base_select = "SELECT first_name, last_name, position, department, salary"
-        
-        if "все" in query_lower and "сотрудник" in query_lower:
-            if amount and operator:
-                # "всех сотрудников с зарплатой меньше 150000"
-                return f"{base_select} FROM employees WHERE salary {operator} {amount};"
-            else:
-                return "SELECT * FROM employees;"
+    @property
+    def model_loaded(self):
+        return self.state == self.STATE_READY
+    
+    def start_loading(self):
+        """Фоновая загрузка модели; сервис отвечает сразу"""
+        if self.state != self.STATE_NOT_LOADED:
+            return
+        self.state = self.STATE_LOADING
+        self._loader = threading.Thread(target=self.load_model, name="llm-loader", daemon=True)
+        self._loader.start()
+    
+    def wait_until_ready(self, timeout=None):
+        """Ожидание окончания загрузки (успешной или нет)"""
+        self._ready.wait(timeout)
+        return self.model_loaded
+    
+    def load_model(self):
+        """Загрузка модели и токенизатора (тяжелые импорты - только здесь)"""
+        self.state = self.STATE_LOADING
         
-        elif "зарплат" in query_lower or "оклад" in query_lower or "доход" in query_lower:
-            if amount and operator:
-                return f"{base_select} FROM employees WHERE salary {operator} {amount};"
-            elif "средн" in query_lower:
-                return "SELECT AVG(salary) as avg_salary FROM employees;"
+        # Пробуем загрузить модель
+        try:
+            if self.worker_address:
+                self._connect_worker()
             else:
-                return f"{base_select} FROM employees ORDER BY salary DESC LIMIT 10;"
+                self._load_weights()
+                self._start_engine()
+            
+        except Exception as e:
+            logger.error("❌ Не удалось загрузить модель: %s. Использую улучшенный fallback", e)
+            self.load_error = str(e)
+            self.state = self.STATE_FAILED
+        finally:
+            self._ready.set()
+    
+    @staticmethod
+    def _load_tokenizer(model_name):
+        from transformers import AutoTokenizer
         
-        elif "ит" in query_lower or "it" in query_lower:
-            if amount and operator and "зарплат" in query_lower:
-                # "ит с зарплатой больше X"
-                return f"{base_select} FROM employees WHERE department = 'IT' AND salary {operator} {amount};"
-            else:
-                return f"{base_select} FROM employees WHERE department = 'IT';"
+        # ПРОСТАЯ загрузка без сложных параметров
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Для батчевой генерации decoder-only модели дополняем промпты слева
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+        return tokenizer
+    
+    def _load_weights(self):
+        """Токенизатор, веса и грамматика (в inference_worker.py - до fork)"""
+        import torch
         
-        elif "менеджер" in query_lower:
-            if amount and operator and "зарплат" in query_lower:
-                return f"{base_select} FROM employees WHERE position ILIKE '%менеджер%' AND salary {operator} {amount};"
-            else:
-                return f"{base_select} FROM employees WHERE position ILIKE '%менеджер%';"
-        
-        elif "сортир" in query_lower or "упорядоч" in query_lower:
-            if "зарплат" in query_lower:
-                direction = "DESC" if "убыван" in query_lower else "ASC"
-                return f"{base_select} FROM employees ORDER BY salary {direction};"
-            elif "фамили" in query_lower:
-                return f"{base_select} FROM employees ORDER BY last_name ASC;"
-        
-        elif "сколько" in query_lower or "количеств" in query_lower:
-            if "ит" in query_lower:
-                return "SELECT COUNT(*) as count FROM employees WHERE department = 'IT';"
-            elif "менеджер" in query_lower:
-                return "SELECT COUNT(*) as count FROM employees WHERE position ILIKE '%менеджер%';"
-            else:
-                return "SELECT COUNT(*) as count FROM employees;"
+        logger.info("🔄 Загрузка модели %s...", self.model_name)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        logger.info("   Устройство: %s", self.device)
+        
+        tokenizer = self._load_tokenizer(self.model_name)
         
-        # Если ничего не подошло - возвращаем ограниченный набор
-        return "SELECT first_name, last_name, position, department, salary FROM employees LIMIT 10;"
+        # Точность/квантование/ONNX выбираются в Config.LLM_BACKEND
+        backend = get_backend(self.backend_name, self.device)
+        model = backend.load(self.model_name, self.device)
+        self.backend_name = backend.name
+        logger.info("   Бэкенд: %s", backend.name)
+        if not backend.supports_prefix_cache:
+            self.prefix_cache_enabled = False
+        
+        self.tokenizer, self.model = tokenizer, model
+        
+        # Байты токенов: для грамматики и для остановки на ';'
+        self._vocab_bytes = token_bytes(tokenizer)
+        self._terminator_ids = torch.tensor(
+            [token_id for raw, token_id in self._vocab_bytes if b';' in raw], device=self.device
+        )
+        if self.constrained:
+            self._get_grammar()
     
-    def generate_sql_with_llm(self, query):
-        """Генерация SQL через настоящую LLM"""
+    def _start_engine(self):
+        """Кэш префикса и поток батчей (в inference_worker.py - после fork)"""
+        if self.prefix_cache_enabled:
+            self.refresh_prefix_cache()
+        
+        # Запросы от разных пользователей объединяются в батчи
+        self.engine = BatchingInferenceEngine(
+            self._generate_batch,
+            max_batch_size=config.LLM_BATCH_MAX_SIZE,
+            max_wait_ms=config.LLM_BATCH_MAX_WAIT_MS
+        )
+        
+        logger.info("✅ Модель успешно загружена!")
+        self.state = self.STATE_READY
+    
+    def _connect_worker(self):
+        """Генерация в inference_worker.py: здесь только токенизатор (для бюджета примеров)"""
+        logger.info("🔄 Подключение к процессу генерации %s...", self.worker_address)
         try:
-            prompt = f"""
+            self.tokenizer = self._load_tokenizer(self.model_name)
+        except Exception as e:
+            logger.warning("⚠️  Токенизатор недоступен, длина примеров оценивается приблизительно: %s", e)
+        
+        client = InferenceClient(self.worker_address)
+        client.wait_until_connected(config.LLM_WORKER_CONNECT_TIMEOUT)
+        client.set_schema(self.db_schema, self.schema_identifiers)
+        self.engine = client
+        self.backend_name = 'worker'
+        
+        logger.info("✅ Процесс генерации подключен!")
+        self.state = self.STATE_READY
+    
+    def status(self):
+        """Состояние модели для /api/health"""
+        return {
+            'state': self.state,
+            'model': self.model_name,
+            'backend': self.backend_name,
+            'device': self.device,
+            'error': self.load_error,
+            'grammar': self._grammar.stats() if self._grammar is not None else None,
+            'worker': self.worker_address,
+        }
+    
+    def _fallback_sql(self, query):
+        """Fallback без LLM: табличный движок правил"""
+        return self.rules.translate(query)['sql']
+    
+    def _prompt_prefix(self):
+        """Неизменная часть промпта: инструкция и схема БД"""
+        return f"""
             Преобразуй запрос на русском в SQL.
             
             Схема БД: {self.db_schema}
             
-            Запрос: {query}
+            Запрос:"""
+    
+    def _prompt_suffix(self, query, examples=()):
+        """
+        Часть промпта, зависящая от запроса пользователя. Примеры идут
+        сразу после префикса (он заканчивается на "Запрос:"), поэтому
+        кэш префикса от них не зависит.
+        """
+        shots = ''.join(f""" {example['question']}
+            SQL: {example['sql']}
+            
+            Запрос:""" for example in examples)
+        return f"""{shots} {query}
             
             SQL (только запрос, без объяснений):
             """
+    
+    def _build_prompt(self, query, examples=()):
+        """Промпт для LLM"""
+        return self._prompt_prefix() + self._prompt_suffix(query, examples)
+    
+    def _select_examples(self, query):
+        """Похожие проверенные примеры в пределах бюджета токенов"""
+        if self.few_shot is None:
+            return []
+        count_tokens = None
+        if self.tokenizer is not None:
+            count_tokens = lambda text: len(self.tokenizer(text).input_ids)
+        return self.few_shot.select(
+            query,
+            k=config.FEW_SHOT_K,
+            token_budget=config.FEW_SHOT_TOKEN_BUDGET,
+            min_score=config.FEW_SHOT_MIN_SCORE,
+            count_tokens=count_tokens
+        )
+    
+    def remember_example(self, query, sql):
+        """Успешно выполненный перевод пополняет библиотеку примеров"""
+        if self.few_shot is not None:
+            self.few_shot.add(query, sql, source='executed')
+    
+    def set_schema(self, db_schema, identifiers=None):
+        """
+        Замена описания схемы с пересчетом кэша префикса.
+        identifiers - {таблица: [столбцы]} для грамматики генерации.
+        """
+        self.db_schema = db_schema
+        if identifiers is not None:
+            self.schema_identifiers = identifiers
+            self._grammar = None
+        self.cache.set_fingerprint(self._schema_fingerprint())
+        if self.model_loaded and self.worker_address:
+            # Кэш префикса и грамматика живут в процессе генерации
+            self.engine.set_schema(db_schema, self.schema_identifiers)
+        elif self.model_loaded and self.prefix_cache_enabled:
+            self.refresh_prefix_cache()
+    
+    def _schema_fingerprint(self):
+        """Отпечаток всего, от чего зависит перевод: модель, схема и правила ключа кэша"""
+        return schema_fingerprint(self.model_name, self.db_schema, KEY_VERSION)
+    
+    def refresh_prefix_cache(self):
+        """Однократный прогон неизменного префикса через модель"""
+        import torch
+        
+        prefix_ids = self.tokenizer(self._prompt_prefix(), return_tensors="pt").input_ids.to(self.device)
+        
+        with torch.no_grad():
+            outputs = self.model(input_ids=prefix_ids, use_cache=True)
+        
+        past = outputs.past_key_values
+        if hasattr(past, "to_legacy_cache"):
+            # Храним неизменяемые кортежи тензоров: generate их не модифицирует
+            past = past.to_legacy_cache()
+        
+        # Присваиваем парой, чтобы батч не увидел ids от одного префикса и кэш от другого
+        self._prefix_ids, self._prefix_past = prefix_ids, past
+        logger.info("   Кэш префикса промпта: %s токенов", prefix_ids.shape[1])
+    
+    def _generate_batch(self, suffixes, should_stop=None):
+        """Один вызов model.generate для целого батча запросов"""
+        prefix_ids, prefix_past = self._prefix_ids, self._prefix_past
+        if self.prefix_cache_enabled and prefix_past is not None:
+            return self._generate_from_prefix(suffixes, prefix_ids, prefix_past, should_stop)
+        
+        prefix = self._prompt_prefix()
+        return self._generate_full([prefix + suffix for suffix in suffixes], should_stop)
+    
+    def _get_grammar(self):
+        """Грамматика SQL для текущей схемы (строится после смены схемы)"""
+        grammar = self._grammar
+        if grammar is None and self.constrained and self._vocab_bytes is not None:
+            grammar = SQLGrammar(self._vocab_bytes, self.schema_identifiers,
+                                 cache_states=config.LLM_GRAMMAR_CACHE_STATES)
+            grammar.allowed(grammar.initial)
+            self._grammar = grammar
+        return grammar
+    
+    def _stopping_criteria(self, should_stop):
+        """
+        Строка батча завершается, как только сгенерирован токен с ';';
+        весь батч прерывается, когда результат больше никому не нужен.
+        """
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+        
+        terminators = self._terminator_ids
+        
+        class _StatementEndCriteria(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                if should_stop is not None and should_stop():
+                    return torch.ones((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+                if terminators is None or terminators.numel() == 0:
+                    return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+                return torch.isin(input_ids[:, -1], terminators)
+        
+        return StoppingCriteriaList([_StatementEndCriteria()])
+    
+    def _generation_kwargs(self, should_stop):
+        """Общие параметры model.generate"""
+        from transformers import LogitsProcessorList
+        
+        kwargs = {
+            'max_new_tokens': config.LLM_MAX_NEW_TOKENS,
+            'do_sample': False,
+            'pad_token_id': self.tokenizer.pad_token_id,
+            'eos_token_id': self.tokenizer.eos_token_id,
+            'stopping_criteria': self._stopping_criteria(should_stop),
+        }
+        grammar = self._get_grammar()
+        if grammar is not None:
+            kwargs['logits_processor'] = LogitsProcessorList([
+                grammar.logits_processor(self.tokenizer.eos_token_id)
+            ])
+        return kwargs
+    
+    def _generate_full(self, prompts, should_stop=None):
+        """Генерация с полным прогоном промптов (без кэша префикса)"""
+        import torch
+        
+        inputs = self.tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=1024
+        )
+        inputs = inputs.to(self.device)
+        
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, **self._generation_kwargs(should_stop))
+        
+        return self._decode_new_tokens(outputs[:, inputs.input_ids.shape[1]:])
+    
+    def _decode_new_tokens(self, new_tokens):
+        """Декодирование только новых токенов (без эха промпта) с учетом их числа в метриках"""
+        # Хвост строки после остановки заполнен pad (= eos у GPT-2) - его не считаем
+        for count in (new_tokens != self.tokenizer.pad_token_id).sum(dim=1).tolist():
+            LLM_TOKENS.observe(count)
+        return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+    
+    def _generate_from_prefix(self, suffixes, prefix_ids, prefix_past, should_stop=None):
+        """Генерация, начинающаяся с закэшированного состояния префикса"""
+        import torch
+        
+        batch_size = len(suffixes)
+        prefix_len = prefix_ids.shape[1]
+        
+        suffix_inputs = self.tokenizer(
+            suffixes,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=max(1, 1024 - prefix_len),
+            add_special_tokens=False
+        ).to(self.device)
+        
+        # Паддинг оказывается между префиксом и запросом; маска внимания его скрывает,
+        # а position_ids считаются по маске, поэтому позиции запроса идут сразу за префиксом
+        input_ids = torch.cat([prefix_ids.expand(batch_size, -1), suffix_inputs.input_ids], dim=1)
+        attention_mask = torch.cat([
+            torch.ones((batch_size, prefix_len), dtype=suffix_inputs.attention_mask.dtype, device=self.device),
+            suffix_inputs.attention_mask
+        ], dim=1)
+        past_key_values = tuple(
+            tuple(t.expand(batch_size, *t.shape[1:]) for t in layer)
+            for layer in prefix_past
+        )
+        
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=past_key_values,
+                **self._generation_kwargs(should_stop)
+            )
+        
+        return self._decode_new_tokens(outputs[:, input_ids.shape[1]:])
+    
+    def generate_sql_with_llm(self, query, cancel_event=None, timeout=None):
+        """
+        Генерация SQL через настоящую LLM (запрос попадает в общий батч).
+        По истечении timeout секунд запрос отменяется и возвращается None.
+        """
+        try:
+            sql = self.engine.generate(
+                self._prompt_suffix(query, self._select_examples(query)),
+                timeout=timeout or config.LLM_REQUEST_TIMEOUT,
+                cancel_event=cancel_event
+            )
             
-            inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1024)
-            inputs = inputs.to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=200,
-                    temperature=0.1,
-                    do_sample=False,
-                    pad_token_id=self.tokenizer.eos_token_id
-                )
-            
-            sql = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            
-            # Извлекаем SQL из ответа
-            if "SQL" in sql:
-                sql = sql.split("SQL")[-1].strip()
-            
-            # Очищаем
-            sql = re.sub(r'```sql|```', '', sql).strip()
-            if not sql.endswith(';'):
-                sql += ';'
-                
-            return sql
+            # Ответ - только новые токены; генерация останавливается на первой ';'
+            sql = re.sub(r'```sql|```', '', sql)
+            sql = sql.split(';')[0].strip()
+            return sql + ';' if sql else None
             
+        except TimeoutError:
+            logger.info("⏱️  LLM не уложилась в %g с, генерация отменена", timeout or config.LLM_REQUEST_TIMEOUT)
+            return None
         except Exception as e:
-            print(f"   ⚠️  Ошибка LLM генерации: {e}")
+            logger.warning("⚠️  Ошибка LLM генерации: %s", e)
             return None
     
-    def convert(self, query):
-        """Основной метод конвертации"""
+    def cache_stats(self):
+        """Счетчики кэша переводов"""
+        return self.cache.stats()
+    
+    def few_shot_stats(self):
+        """Размер и режим индекса примеров"""
+        return self.few_shot.stats() if self.few_shot else None
+    
+    def inference_stats(self):
+        """Метрики очереди и батчей генерации"""
+        return self.engine.stats() if self.engine else None
+    
+    def convert(self, query, cancel_event=None):
+        """
+        Основной метод конвертации (cancel_event - отмена генерации извне).
+        
+        Кэш и правила отвечают сразу; LLM запускается, только если правила
+        не уверены (confidence < rule_confidence_threshold; незнакомые слова и
+        непереведенные отрицания ее снижают, см. RuleEngine.confidence), и ее ответ ждем
+        не дольше latency_budget_ms, после чего генерация отменяется и
+        побеждают правила. Итог гонки и время каждого пути - в 'translation'.
+        """
+        started = time.perf_counter()
+        translation = {
+            'winner': None,
+            'reason': None,
+            'cache_ms': None,
+            'rules_ms': None,
+            'llm_ms': None,
+            'rule_confidence': None,
+            'budget_ms': self.latency_budget_ms,
+        }
+        
+        def elapsed_ms(since):
+            return round((time.perf_counter() - since) * 1000, 3)
+        
+        def finish(sql, source, winner, reason):
+            translation.update(winner=winner, reason=reason, total_ms=elapsed_ms(started))
+            TRANSLATIONS.inc(winner=winner, reason=reason)
+            for path in ('cache', 'rules', 'llm'):
+                if translation[path + '_ms'] is not None:
+                    STAGE_SECONDS.observe(translation[path + '_ms'] / 1000, stage='translate_' + path)
+            return {
+                'success': True,
+                'sql_query': sql,
+                'entities': {},
+                'lemmas': [],
+                'source': source,
+                'translation': translation
+            }
+        
         try:
-            print(f"\n{'='*60}")
-            print(f"🤖 Обработка: '{query}'")
+            logger.debug("🤖 Обработка: '%s'", query)
+            
+            # Повторный вопрос - отвечаем из кэша, не трогая модель
+            cached_sql = self.cache.get(query)
+            translation['cache_ms'] = elapsed_ms(started)
+            if cached_sql:
+                logger.debug("✅ SQL из кэша: %s", cached_sql)
+                return finish(cached_sql, 'cache', 'cache', 'cache_hit')
+            
+            # Правила: микросекунды, их ответ всегда готов к моменту решения
+            rules_started = time.perf_counter()
+            rule = self.rules.translate(query)
+            translation['rules_ms'] = elapsed_ms(rules_started)
+            translation['rule_confidence'] = rule['confidence']
             
-            # Пробуем LLM если она загружена
-            if self.model_loaded:
-                print("   Использую LLM...")
-                sql = self.generate_sql_with_llm(query)
+            if not self.model_loaded:
+                reason = 'llm_unavailable'
+            elif rule['confidence'] >= self.rule_confidence_threshold:
+                reason = 'rules_confident'
+            else:
+                llm_started = time.perf_counter()
+                budget = self.latency_budget_ms / 1000 if self.latency_budget_ms > 0 else None
+                sql = self.generate_sql_with_llm(query, cancel_event, timeout=budget)
+                translation['llm_ms'] = elapsed_ms(llm_started)
                 
                 if sql and "SELECT" in sql.upper():
-                    print(f"✅ LLM SQL: {sql}")
-                    return {
-                        'success': True,
-                        'sql_query': sql,
-                        'entities': {},
-                        'lemmas': []
-                    }
-                else:
-                    print("   LLM не сгенерировала SQL, переключаюсь на fallback")
+                    logger.debug("✅ LLM SQL: %s", sql)
+                    self.cache.put(query, sql)
+                    return finish(sql, 'llm', 'llm', 'llm_in_budget')
+                
+                over_budget = budget is not None and translation['llm_ms'] >= self.latency_budget_ms
+                reason = 'llm_over_budget' if over_budget else 'llm_failed'
             
-            # Используем fallback
-            print("   Использую улучшенный fallback")
-            sql = self._fallback_sql(query)
-            print(f"✅ Fallback SQL: {sql}")
+            logger.debug("✅ Fallback SQL (%s, уверенность %s): %s", reason, rule['confidence'], rule['sql'])
             
-            return {
-                'success': True,
-                'sql_query': sql,
-                'entities': {},
-                'lemmas': []
-            }
+            # Результат fallback не кэшируем: правила дешевы, а кэш не должен
+            # заслонять ответ модели, когда она станет доступна
+            return finish(rule['sql'], 'fallback', 'rules', reason)
             
         except Exception as e:
-            print(f"❌ Ошибка: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Ошибка перевода: %s", e)
             
             return {
                 'success': False,
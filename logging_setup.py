@@ -0,0 +1,41 @@
+# logging_setup.py - уровни и выборка логов вместо print на горячем пути
+import logging
+import random
+import sys
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю rate записей ниже WARNING (INFO/DEBUG на каждый
+    запрос под нагрузкой); предупреждения и ошибки проходят всегда.
+    Запись с extra={'sampled': False} проходит без выборки.
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+        self._random = random.Random()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        if not getattr(record, 'sampled', True):
+            return True
+        return self._random.random() < self.rate
+
+
+def configure_logging(level='INFO', sample_rate=1.0, stream=None):
+    """Обработчик корневого логгера (повторный вызов ничего не добавляет)"""
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    for handler in root.handlers:
+        if getattr(handler, '_text2sql', False):
+            return handler
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler._text2sql = True
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(SamplingFilter(sample_rate))
+    root.addHandler(handler)
+    return handler
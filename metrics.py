@@ -0,0 +1,256 @@
+# metrics.py - счетчики и гистограммы в текстовом формате Prometheus (/metrics)
+#
+# Своя минимальная реализация без prometheus_client: метрики процесса веб-воркера
+# живут в памяти (запись - блокировка и bisect), формат выдачи - text/plain 0.0.4.
+# При нескольких процессах (uvicorn --workers) каждый отдает свои значения.
+import math
+import threading
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы по умолчанию (секунды): от 0.5 мс до 30 с
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(_Metric):
+    """Монотонный счетчик с метками"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами (кумулятивные ведра при выдаче)"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}    # метки -> [счетчики по ведрам (+Inf последним), сумма, количество]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels):
+        """(количество, сумма) для набора меток"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return (series[2], series[1]) if series else (0, 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class CallbackGauge(_Metric):
+    """
+    Значение, вычисляемое при выдаче: fn() -> число или {значения меток: число}.
+    Для состояния, которое уже хранится в других объектах (очереди, пулы, кэши).
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, fn, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        lines = self.header()
+        for key, number in sorted(items, key=lambda item: str(item[0])):
+            if number is None:
+                continue
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(number)}')
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их выдача для /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Повторная регистрация (перезагрузка модуля, второй экземпляр) заменяет прежнюю
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        return self.register(CallbackGauge(name, documentation, fn, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+# ===== ОБЩИЕ МЕТРИКИ =====
+STAGE_SECONDS = registry.histogram(
+    'text2sql_stage_seconds',
+    'Время этапа обработки запроса',
+    ['stage']
+)
+HTTP_REQUESTS = registry.counter(
+    'text2sql_http_requests_total',
+    'HTTP-запросы по маршрутам и кодам ответа',
+    ['endpoint', 'status']
+)
+HTTP_SECONDS = registry.histogram(
+    'text2sql_http_request_seconds',
+    'Время ответа по маршрутам',
+    ['endpoint']
+)
+QUERY_OUTCOMES = registry.counter(
+    'text2sql_query_outcomes_total',
+    'Итоги /api/query: ok, rejected, too_expensive, db_error, timeout, error',
+    ['outcome']
+)
+TRANSLATIONS = registry.counter(
+    'text2sql_translations_total',
+    'Переводы NL -> SQL по победившему пути и причине',
+    ['winner', 'reason']
+)
+LLM_TOKENS = registry.histogram(
+    'text2sql_llm_generated_tokens',
+    'Сгенерировано токенов на один запрос к модели',
+    buckets=(4, 8, 16, 32, 64, 128, 256, 512)
+)
+ROWS_RETURNED = registry.histogram(
+    'text2sql_rows_returned',
+    'Строк в результате запроса',
+    buckets=(0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+)
+DB_QUERY_SECONDS = registry.histogram(
+    'text2sql_db_query_seconds',
+    'Время выполнения SQL в БД',
+    ['kind']
+)
+
+
+def register_service_gauges(converter, pool_stats, result_cache=None):
+    """
+    Состояние сервиса, уже доступное через /api/health, - в виде gauge.
+    pool_stats() -> словарь с 'idle' и 'in_use' (или None, пока пула нет).
+    """
+    def pool_connections():
+        stats = pool_stats()
+        return {'idle': stats['idle'], 'in_use': stats['in_use']} if stats else None
+
+    def llm_queue_depth():
+        stats = converter.inference_stats() or {}
+        if 'processes' in stats:
+            # Процесс генерации отдельно (inference_worker.py): сумма по дочерним процессам
+            # из снимка InferenceClient (обновляется в фоне, сокет здесь не опрашивается)
+            return sum(p.get('queue_depth') or 0 for p in stats['processes'] if p.get('alive'))
+        return stats.get('queue_depth')
+
+    def cache_entries():
+        entries = {'translation': converter.cache_stats()['size']}
+        if result_cache is not None:
+            entries['result'] = result_cache.stats()['entries']
+        return entries
+
+    def cache_hit_rate():
+        rates = {'translation': converter.cache_stats()['hit_rate']}
+        if result_cache is not None:
+            rates['result'] = result_cache.stats()['hit_rate']
+        return rates
+
+    registry.gauge('text2sql_db_pool_connections', 'Соединения пула БД', pool_connections, ['state'])
+    registry.gauge('text2sql_llm_queue_depth', 'Запросов в очереди генерации', llm_queue_depth)
+    registry.gauge('text2sql_cache_entries', 'Записей в кэшах', cache_entries, ['cache'])
+    registry.gauge('text2sql_cache_hit_rate', 'Доля попаданий в кэши', cache_hit_rate, ['cache'])
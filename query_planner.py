@@ -0,0 +1,226 @@
+# query_planner.py - оценка стоимости SQL через EXPLAIN перед выполнением
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from result_cache import canonical_sql
+from sql_validator import tokenize
+
+# Операторы, после которых литерал можно вынести в параметр.
+# LIMIT/OFFSET остаются в тексте: от них зависит оценка числа строк
+_COMPARISON = {'=', '<>', '!=', '<', '>', '<=', '>=', 'LIKE', 'ILIKE'}
+
+
+class QueryCostError(Exception):
+    """Оценка плана запроса превышает допустимые пороги"""
+
+    def __init__(self, message, estimate):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+def _literal_value(kind, text):
+    if kind == 'number':
+        return int(text) if text.isdigit() else Decimal(text)
+    return text[1:-1].replace("''", "'")
+
+
+def parameterize(sql):
+    """
+    Форма запроса: литералы в сравнениях, IN (...) и BETWEEN
+    заменены на $1..$n. Возвращает (форма, значения параметров).
+    Запросы, отличающиеся только значениями, имеют одну форму.
+    """
+    tokens = [t for t in tokenize(sql.strip().rstrip(';')) if t[0] != 'comment']
+    significant = [i for i, (kind, _) in enumerate(tokens) if kind != 'ws']
+
+    out = [value for _, value in tokens]
+    params = []
+    in_list = []            # стек скобок: True, если это список IN (...)
+    between = False
+
+    for n, i in enumerate(significant):
+        kind, value = tokens[i]
+        upper = value.upper()
+        prev = tokens[significant[n - 1]][1].upper() if n else None
+        nxt = tokens[significant[n + 1]] if n + 1 < len(significant) else None
+
+        if value == '(':
+            in_list.append(prev == 'IN')
+        elif value == ')' and in_list:
+            in_list.pop()
+        elif upper == 'BETWEEN':
+            between = True
+
+        if kind not in ('number', 'string') or value[:1] in 'eE':
+            continue
+        if nxt is not None and (nxt[0] == 'op' or nxt[1] in ('.', '[')):
+            continue        # литерал - часть выражения ('a' || 'b', 1.5 * x)
+
+        if prev in _COMPARISON or prev == 'BETWEEN' or (prev == 'AND' and between):
+            if prev == 'AND':
+                between = False
+        elif prev in ('(', ',') and in_list and in_list[-1]:
+            pass
+        else:
+            continue        # в т.ч. DATE '2020-01-01', ROUND(x, 2), ORDER BY 1
+
+        params.append(_literal_value(kind, value))
+        out[i] = f"${len(params)}"
+
+    return ''.join(out).strip(), params
+
+
+def statement_name(shape):
+    """Имя подготовленного оператора для формы запроса"""
+    return 't2s_' + hashlib.sha1(shape.encode('utf-8')).hexdigest()[:16]
+
+
+def set_limit(sql, limit):
+    """
+    Замена числа строк в LIMIT или FETCH FIRST верхнего уровня (после
+    sql_validator есть одно из них) на limit
+    """
+    tokens = tokenize(sql)
+    depth = 0
+    for i, (kind, value) in enumerate(tokens):
+        if value == '(':
+            depth += 1
+        elif value == ')':
+            depth -= 1
+        elif kind == 'ident' and value.upper() in ('LIMIT', 'FETCH') and depth == 0:
+            following = [j for j in range(i + 1, len(tokens)) if tokens[j][0] != 'ws']
+            if value.upper() == 'FETCH':
+                following = following[1:]       # FIRST / NEXT
+            if not following:
+                break
+            j = following[0]
+            if tokens[j][1].upper() in ('ROW', 'ROWS'):
+                tokens.insert(j, ('number', f"{limit} "))   # FETCH FIRST ROW ONLY
+            else:
+                tokens[j] = ('number', str(limit))
+            return ''.join(value for _, value in tokens)
+    return sql.rstrip().rstrip(';') + f" LIMIT {limit};"
+
+
+def summarize_plan(explain_output):
+    """Стоимость и ожидаемое число строк из результата EXPLAIN (FORMAT JSON)"""
+    if isinstance(explain_output, str):
+        explain_output = json.loads(explain_output)
+    plan = explain_output[0]['Plan']
+    return {
+        'cost': plan['Total Cost'],
+        'startup_cost': plan['Startup Cost'],
+        'rows': plan['Plan Rows'],
+        'node': plan['Node Type'],
+    }
+
+
+class QueryPlanner:
+    """
+    Проверка стоимости запроса по плану PostgreSQL.
+
+    EXPLAIN выполняется для первого появления каждого текста запроса, оценка
+    кэшируется на ttl секунд. Ключ - SQL вместе с литералами: оценка строк
+    для salary > 900000 ничего не говорит о salary > 0, поэтому запросы
+    одной формы (см. parameterize) оцениваются каждый отдельно; общая форма
+    используется только для подготовленных операторов. Если ожидается больше max_rows строк,
+    LIMIT ужесточается до max_rows; если стоимость и после этого больше
+    max_cost - запрос отклоняется с QueryCostError.
+    """
+
+    def __init__(self, max_cost, max_rows, cache_size=512, ttl=300):
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.cache_size = cache_size
+        self.ttl = ttl
+
+        self._plans = OrderedDict()   # plan_key(sql) -> (оценка, время)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._rewritten = 0
+        self._rejected = 0
+
+    @staticmethod
+    def plan_key(sql):
+        """Ключ кэша планов: текст запроса с литералами, без лишних пробелов"""
+        return canonical_sql(sql)
+
+    def lookup(self, key):
+        """Оценка для ключа plan_key из кэша (None, если нет или устарела)"""
+        with self._lock:
+            entry = self._plans.get(key)
+            if entry is not None and (not self.ttl or time.monotonic() - entry[1] < self.ttl):
+                self._plans.move_to_end(key)
+                self._hits += 1
+                return dict(entry[0])
+            self._misses += 1
+            return None
+
+    def remember(self, key, estimate):
+        with self._lock:
+            self._plans[key] = (dict(estimate), time.monotonic())
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.cache_size:
+                self._plans.popitem(last=False)
+
+    def gate(self, sql, estimate):
+        """Сравнение оценки с порогами: (SQL, оценка) или QueryCostError"""
+        estimate = dict(estimate, rewritten=False)
+        if self.max_rows and estimate['rows'] > self.max_rows:
+            # Limit над потоковым планом: стоимость пропорциональна доле строк
+            ratio = self.max_rows / estimate['rows']
+            estimate['cost'] = round(
+                estimate['startup_cost'] + (estimate['cost'] - estimate['startup_cost']) * ratio, 2
+            )
+            estimate['rows'] = self.max_rows
+            estimate['rewritten'] = True
+            sql = set_limit(sql, self.max_rows)
+            with self._lock:
+                self._rewritten += 1
+
+        if self.max_cost and estimate['cost'] > self.max_cost:
+            with self._lock:
+                self._rejected += 1
+            raise QueryCostError(
+                f"Слишком дорогой запрос: оценка стоимости {estimate['cost']:.0f} "
+                f"(допустимо {self.max_cost:g})",
+                estimate
+            )
+        return sql, estimate
+
+    def check(self, sql, explain_fn):
+        """
+        Оценка и проверка запроса. explain_fn(sql) возвращает результат
+        EXPLAIN (FORMAT JSON); вызывается только при промахе кэша планов.
+        """
+        key = self.plan_key(sql)
+        estimate = self.lookup(key)
+        cached = estimate is not None
+        if estimate is None:
+            estimate = summarize_plan(explain_fn(sql))
+            self.remember(key, estimate)
+        sql, estimate = self.gate(sql, estimate)
+        estimate['cached'] = cached
+        return sql, estimate
+
+    def clear(self):
+        """Сброс оценок (например, после изменения схемы)"""
+        with self._lock:
+            self._plans.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'plans': len(self._plans),
+                'hits': self._hits,
+                'misses': self._misses,
+                'rewritten': self._rewritten,
+                'rejected': self._rejected,
+                'max_cost': self.max_cost,
+                'max_rows': self.max_rows,
+            }
@@ -0,0 +1,70 @@
+# query_service.py - общие шаги обработки запроса для app.py и asgi_app.py
+import json
+import time
+
+from metrics import STAGE_SECONDS
+from wire_format import columnar, json_value
+
+# Запрос на случай, если перевести вопрос не удалось
+FALLBACK_SQL = "SELECT first_name, last_name, position, department, salary FROM employees LIMIT 10;"
+
+# Примеры запросов для быстрого выбора
+SAMPLE_QUERIES = [
+    "Показать всех сотрудников",
+    "Сотрудники IT отдела",
+    "Найти менеджеров",
+    "Зарплата больше 150000"
+]
+
+# ===== РЕЗУЛЬТАТЫ И ПРОВЕРКИ =====
+def format_row(columns, row):
+    """
+    Строка результата БД -> словарь для JSON (строчный ответ). Значения
+    типизированы, суммы и даты для показа форматирует static/script.js.
+    """
+    return {col: json_value(value) for col, value in zip(columns, row)}
+
+def result_body(columns, rows, columnar_layout=False):
+    """Результат для ответа: results (строки-словари) или types/data по столбцам"""
+    if columnar_layout:
+        types, data = columnar(columns, rows)
+        return {'layout': 'columnar', 'types': types, 'data': data}
+    return {'results': [format_row(columns, row) for row in rows]}
+
+def humanize_db_error(error_msg):
+    """Упрощенное сообщение об ошибке БД для пользователя"""
+    if "relation" in error_msg.lower() and "does not exist" in error_msg.lower():
+        return "Ошибка: таблица не найдена. Проверьте подключение к БД."
+    elif "syntax error" in error_msg.lower():
+        return "Ошибка синтаксиса SQL. LLM сгенерировал некорректный запрос."
+    elif "column" in error_msg.lower() and "does not exist" in error_msg.lower():
+        return "Ошибка: столбец не найден. Проверьте схему базы данных."
+    return error_msg
+
+class StageTimings:
+    """
+    Время этапов обработки запроса (мс) для поля timings ответа;
+    каждый этап также попадает в гистограмму text2sql_stage_seconds.
+    """
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages = {}
+
+    def mark(self, stage):
+        """Конец этапа stage: время с предыдущей отметки"""
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self.stages[stage + '_ms'] = round(elapsed * 1000, 3)
+        self._last = now
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+
+    def as_dict(self):
+        return dict(self.stages, total_ms=round((time.perf_counter() - self.started) * 1000, 3))
+
+def ndjson_line(payload):
+    return json.dumps(payload, ensure_ascii=False, default=str) + '\n'
+
+def rows_line(columns, rows, columnar_layout=False):
+    """Строка NDJSON с порцией результатов"""
+    return ndjson_line({'type': 'rows', **result_body(columns, rows, columnar_layout)})
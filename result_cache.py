@@ -0,0 +1,217 @@
+# result_cache.py - кэш результатов SELECT с инвалидацией по версии данных
+import logging
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE "таблица/функция не существует": нет DDL для версии по триггеру
+_MISSING_OBJECT_CODES = {'42P01', '42883'}
+# Версия данных неизвестна (проверка не удалась) - кэш не выдает и не хранит результаты
+_UNKNOWN = object()
+
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^'\"\s]+")
+
+
+def canonical_sql(query):
+    """SQL без лишних пробелов и завершающей ';' (литералы не трогаем)"""
+    parts = []
+    for token in _SQL_TOKEN.findall(query.strip()):
+        if token.isspace():
+            parts.append(' ')
+        else:
+            parts.append(token)
+    return ''.join(parts).rstrip('; ')
+
+
+def _missing_object(error):
+    """Ошибка UndefinedTable/UndefinedFunction (pgcode у psycopg2, sqlstate у asyncpg)"""
+    code = getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)
+    return code in _MISSING_OBJECT_CODES
+
+
+def _estimate_size(results, columns):
+    """Приблизительный размер результата в байтах"""
+    size = sys.getsizeof(results) + sum(sys.getsizeof(c) for c in columns or [])
+    for row in results or []:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class DataVersionProbe:
+    """
+    Дешевая проверка "изменились ли данные".
+
+    source='trigger' - счетчик в таблице data_version, который увеличивают
+    триггеры (см. data/data_version.sql); точный и мгновенный.
+    source='pg_stat' - сумма n_tup_ins/upd/del из pg_stat_user_tables;
+    не требует DDL, но статистика может запаздывать примерно на секунду.
+    Запрос к БД выполняется не чаще одного раза в min_interval_ms.
+    """
+
+    QUERIES = {
+        'trigger': "SELECT version FROM data_version WHERE id = 1;",
+        'pg_stat': "SELECT COALESCE(SUM(n_tup_ins + n_tup_upd + n_tup_del), 0) FROM pg_stat_user_tables;",
+    }
+
+    def __init__(self, db, source='trigger', min_interval_ms=500):
+        if source not in self.QUERIES:
+            raise ValueError(f"Неизвестный источник версии данных: {source}")
+        self.db = db
+        self.source = source
+        self.min_interval = min_interval_ms / 1000.0
+
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self.probes = 0
+
+    def current(self):
+        """Текущая версия данных (из памяти, если проверяли недавно)"""
+        with self._lock:
+            now = time.monotonic()
+            if self._version is not None and now - self._checked_at < self.min_interval:
+                return self._version
+
+            try:
+                results, _ = self.db.execute_query(self.QUERIES[self.source])
+            except Exception as e:
+                # Временные ошибки (соединение, таймаут) - наверх; следующий вызов повторит
+                if self.source != 'trigger' or not _missing_object(e):
+                    raise
+                # Таблица data_version не создана - переходим на статистику PostgreSQL
+                logger.warning("⚠️  Версия данных по триггеру недоступна (%s), использую pg_stat_user_tables", e)
+                self.source = 'pg_stat'
+                results, _ = self.db.execute_query(self.QUERIES[self.source])
+
+            self._version = results[0][0] if results else None
+            self._checked_at = now
+            self.probes += 1
+            return self._version
+
+
+class ResultCache:
+    """
+    LRU-кэш результатов SELECT, ограниченный по памяти.
+
+    Ключ - канонический текст SQL и параметры. Все записи относятся к одной
+    версии данных; как только DataVersionProbe сообщает о новой версии,
+    кэш целиком очищается, поэтому после записи в БД старые строки не
+    выдаются (с точностью до интервала проверки версии).
+    """
+
+    def __init__(self, probe, max_bytes=32 * 1024 * 1024):
+        self.probe = probe
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()   # ключ -> (results, columns, размер)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._version = None
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @property
+    def version(self):
+        """Версия данных, к которой относятся записи (передается в put после выполнения)"""
+        return self._version
+
+    @staticmethod
+    def make_key(query, params=None):
+        return (canonical_sql(query), tuple(params) if params else ())
+
+    def _sync_version(self):
+        """Сверка с версией данных; False - версия недоступна"""
+        try:
+            version = self.probe.current()
+        except Exception as e:
+            # Изменились ли данные - неизвестно: старые записи не выдаем
+            logger.warning("⚠️  Версия данных недоступна, кэш результатов пропускается: %s", e)
+            version = _UNKNOWN
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self._invalidations += 1
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+        return version is not _UNKNOWN
+
+    def get(self, query, params=None):
+        """(results, columns) из кэша или None"""
+        known = self._sync_version()
+        key = self.make_key(query, params)
+        with self._lock:
+            entry = self._entries.get(key) if known else None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0], entry[1]
+
+    def put(self, query, params, results, columns, version):
+        """Сохранение результата, полученного при версии данных version"""
+        size = _estimate_size(results, columns)
+        if size > self.max_bytes or version is _UNKNOWN:
+            return
+        key = self.make_key(query, params)
+        with self._lock:
+            # Пока выполнялся запрос, данные могли измениться - такой результат не храним
+            if version != self._version:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[2]
+            self._entries[key] = (results, columns, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]
+                self._evictions += 1
+
+    def get_or_execute(self, query, params, execute_fn):
+        """
+        Результат из кэша или выполнение execute_fn(query, params).
+        Возвращает (results, columns, cached).
+        """
+        cached = self.get(query, params)
+        if cached is not None:
+            return cached[0], cached[1], True
+
+        version = self._version
+        results, columns = execute_fn(query, params)
+        if columns is not None:
+            self.put(query, params, results, columns, version)
+        return results, columns, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Счетчики кэша результатов для /api/health"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'data_version': None if self._version is _UNKNOWN else self._version,
+                'version_source': self.probe.source,
+                'version_probes': self.probe.probes,
+            }
@@ -0,0 +1,339 @@
+# rule_engine.py - табличный движок правил NL -> SQL (fallback без LLM)
+import re
+from decimal import Decimal, InvalidOperation
+from config import config
+
+BASE_COLUMNS = "first_name, last_name, position, department, salary"
+
+# Признаки запроса: имя признака -> (точные слова, основы слов).
+# Все слова и основы компилируются в одну таблицу поиска, поэтому разбор -
+# один проход по словам запроса с поиском каждого слова в хеш-таблице.
+FEATURES = [
+    ('gt', ['больше', 'выше', 'свыше', 'более'], ['превыша']),
+    ('lt', ['меньше', 'ниже', 'менее'], []),
+    ('eq', ['ровно'], ['равн']),
+    ('range_from', ['от'], []),
+    ('range_to', ['до'], []),
+    ('all', ['все', 'всех', 'весь', 'список'], []),
+    ('employee', [], ['сотрудник', 'работник', 'персонал']),
+    ('salary', ['зп'], ['зарплат', 'оклад', 'доход']),
+    ('avg', [], ['средн']),
+    ('max', [], ['максимальн', 'наибольш']),
+    ('min', [], ['минимальн', 'наименьш']),
+    ('sum', [], ['сумм', 'фонд']),
+    ('count', ['сколько'], ['количеств']),
+    ('sort', [], ['сортир', 'отсортир', 'упорядоч']),
+    ('desc', [], ['убыван']),
+    ('asc', [], ['возрастан']),
+    ('surname', [], ['фамили']),
+]
+
+# Признаки из двух слов: (имя, первое слово, основа второго слова)
+BIGRAM_FEATURES = [
+    ('by_department', 'по', 'отдел'),
+]
+
+# Дополнительные написания отделов из Config.SUPPORTED_DEPARTMENTS: (точные слова, основы)
+DEPARTMENT_ALIASES = {
+    'IT': (['it', 'ит', 'айти'], []),
+    'HR': (['hr', 'эйчар'], ['кадр']),
+    'Закупки': (['закупок'], []),
+}
+
+# Основы должностей -> подстрока для ILIKE
+POSITION_STEMS = ['менеджер', 'разработчик', 'инженер', 'бухгалтер', 'аналитик',
+                  'директор', 'рекрутер', 'экономист', 'руководител']
+
+# Признак -> SQL-шаблон
+COMPARISON_OPERATORS = {'gt': '>', 'lt': '<', 'eq': '=', 'not_gt': '<=', 'not_lt': '>=', 'not_eq': '<>'}
+
+# Отрицания: "не" перед оператором сравнения обращает его ("не больше" -> <=);
+# остальные отрицания ("не из IT", "кроме менеджеров") правила не переводят
+NEGATION_WORDS = {'не', 'кроме', 'исключая', 'помимо'}
+# Потолок уверенности для запроса с непереведенным отрицанием
+NEGATION_CONFIDENCE = 0.5
+# Потолок уверенности, если отдел угадан по короткой основе ("продавцы" -> 'Продажи')
+FUZZY_DEPARTMENT_CONFIDENCE = 0.5
+
+# Множители после числа: "150 тысяч" -> 150000
+NUMBER_MULTIPLIERS = {
+    'тыс': 1000, 'тысяча': 1000, 'тысячи': 1000, 'тысяч': 1000, 'тысячу': 1000,
+    'млн': 1000000, 'миллион': 1000000, 'миллиона': 1000000, 'миллионов': 1000000,
+}
+AGGREGATES = {
+    'count': "COUNT(*) as count",
+    'avg': "AVG(salary) as avg_salary",
+    'max': "MAX(salary) as max_salary",
+    'min': "MIN(salary) as min_salary",
+    'sum': "SUM(salary) as total_salary",
+}
+# При нескольких агрегатах в одном запросе берем все, в этом порядке
+AGGREGATE_ORDER = ['count', 'avg', 'min', 'max', 'sum']
+
+# Слова, не несущие смысла для перевода (не снижают уверенность)
+STOP_WORDS = {
+    'с', 'в', 'во', 'и', 'на', 'у', 'из', 'для', 'по', 'к', 'а', 'же', 'ли',
+    'показать', 'покажи', 'найти', 'найди', 'вывести', 'выведи', 'вывод', 'дай',
+    'какие', 'какая', 'какой', 'кто', 'который', 'которые', 'чем',
+    'отдел', 'отдела', 'отделе', 'отделов', 'отделу', 'отделом', 'отдельно',
+    'рублей', 'руб', 'р', 'всего', 'мне', 'их',
+}
+
+
+# Сколько разобранных слов запоминать (защита от неограниченного роста)
+RESOLVED_WORDS_LIMIT = 50000
+
+_THOUSANDS_SEP = re.compile(r'(?<=\d)[ \u00a0](?=\d{3}(?!\d))')
+_TOKEN = re.compile(r'\d+(?:[.,]\d+)?|\w+')
+
+
+def _department_stem(name):
+    """Основа названия отдела без окончания: 'Продажи' -> 'продаж' ('продажах', 'продажам')"""
+    lower = name.lower()
+    stem = lower.rstrip('аяыиоеьй')
+    return stem if len(stem) >= 4 else lower
+
+
+def _fuzzy_department_stem(name):
+    """Короткая основа: 'Продажи' -> 'прода' (совпадет и с 'продавцы' - только догадка)"""
+    lower = name.lower()
+    return lower[:max(4, len(lower) - 2)]
+
+
+def _scaled_number(token, multiplier):
+    """'1,5' и 1000 -> '1500'"""
+    try:
+        value = Decimal(token.replace(',', '.')) * multiplier
+    except InvalidOperation:
+        return token.replace(',', '.')
+    return str(int(value)) if value == value.to_integral_value() else str(value.normalize())
+
+
+def _sql_literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+class RuleEngine:
+    """
+    Перевод запроса в SQL по таблице правил.
+
+    Ключевые слова, основы, операторы, отделы и должности один раз
+    компилируются в таблицы поиска; запрос разбивается на слова одним
+    регулярным выражением, и каждое слово ищется в таблице. Найденные признаки
+    собираются в набор, а SQL строится по таблицам шаблонов, поэтому
+    сочетания (отдел + зарплата + сортировка + количество) обрабатываются
+    независимо от порядка проверок.
+    """
+
+    def __init__(self, departments=None):
+        self.departments = list(departments or config.SUPPORTED_DEPARTMENTS)
+
+        # Таблицы поиска: слово/основа -> (вид признака, значение)
+        self._exact = {}
+        self._stems = {}
+
+        for name, words, stems in FEATURES:
+            for word in words:
+                self._exact[word] = ('flag', name)
+            for stem in stems:
+                self._stems[stem] = ('flag', name)
+
+        for department in self.departments:
+            words, stems = DEPARTMENT_ALIASES.get(department, ([], []))
+            for word in words:
+                self._exact[word] = ('department', department)
+            for stem in [_department_stem(department)] + stems:
+                self._stems[stem] = ('department', department)
+        for department in self.departments:
+            self._stems.setdefault(_fuzzy_department_stem(department), ('department_fuzzy', department))
+
+        for stem in POSITION_STEMS:
+            self._stems[stem] = ('position', stem)
+
+        self._bigrams = {first: (name, stem) for name, first, stem in BIGRAM_FEATURES}
+        # Длины основ от длинных к коротким: первой находится самая специфичная
+        self._stem_lengths = sorted({len(stem) for stem in self._stems}, reverse=True)
+        self._resolved = {}
+
+    def _lookup(self, word):
+        try:
+            return self._resolved[word]
+        except KeyError:
+            pass
+
+        entry = self._exact.get(word)
+        if entry is None:
+            for length in self._stem_lengths:
+                if length <= len(word):
+                    entry = self._stems.get(word[:length])
+                    if entry is not None:
+                        break
+
+        # Словарь пользователей невелик - запоминаем разбор каждого слова
+        if len(self._resolved) < RESOLVED_WORDS_LIMIT:
+            self._resolved[word] = entry
+        return entry
+
+    def extract(self, query):
+        """Один проход по словам: признаки, отделы, должности и числа"""
+        features = {
+            'flags': [],
+            'departments': [],
+            'positions': [],
+            'numbers': [],
+            'negations': [],
+            'fuzzy': [],
+            'words': [],
+            'covered_words': 0,
+        }
+        covered = set()         # позиции слов, понятых правилами
+
+        text = _THOUSANDS_SEP.sub('', query.lower())
+        tokens = _TOKEN.findall(text)
+        features['words'] = tokens
+
+        skip_next = False
+        for i, token in enumerate(tokens):
+            if skip_next:
+                skip_next = False
+                continue
+
+            if token[0].isdigit():
+                multiplier = NUMBER_MULTIPLIERS.get(tokens[i + 1]) if i + 1 < len(tokens) else None
+                if multiplier is not None:
+                    features['numbers'].append(_scaled_number(token, multiplier))
+                    covered.update((i, i + 1))
+                    skip_next = True
+                else:
+                    features['numbers'].append(token.replace(',', '.'))
+                    covered.add(i)
+                continue
+
+            if token in NEGATION_WORDS:
+                following = self._lookup(tokens[i + 1]) if i + 1 < len(tokens) else None
+                if token == 'не' and following is not None and following[1] in ('gt', 'lt', 'eq'):
+                    features['flags'].append('not_' + following[1])
+                    covered.update((i, i + 1))
+                    skip_next = True
+                else:
+                    features['negations'].append(token)
+                continue
+
+            bigram = self._bigrams.get(token)
+            if bigram is not None and i + 1 < len(tokens) and tokens[i + 1].startswith(bigram[1]):
+                features['flags'].append(bigram[0])
+                covered.update((i, i + 1))
+                skip_next = True
+                continue
+
+            entry = self._lookup(token)
+            if entry is None:
+                continue
+            kind, value = entry
+            if kind == 'flag':
+                features['flags'].append(value)
+            elif kind == 'department':
+                features['departments'].append(value)
+            elif kind == 'department_fuzzy':
+                features['departments'].append(value)
+                features['fuzzy'].append(token)
+            else:
+                features['positions'].append(value)
+            covered.add(i)
+
+        features['covered'] = covered
+        features['covered_words'] = len(covered)
+        return features
+
+    def _salary_condition(self, flags, numbers):
+        if not numbers:
+            return None, False
+        if 'range_from' in flags and 'range_to' in flags and len(numbers) >= 2:
+            return f"salary BETWEEN {numbers[0]} AND {numbers[1]}", True
+        for flag in flags:
+            if flag in COMPARISON_OPERATORS:
+                return f"salary {COMPARISON_OPERATORS[flag]} {numbers[0]}", True
+        return None, False
+
+    def build_sql(self, features):
+        """SQL из набора признаков по таблицам шаблонов"""
+        flags = set(features['flags'])
+        departments = list(dict.fromkeys(features['departments']))
+        positions = list(dict.fromkeys(features['positions']))
+
+        conditions = []
+        if len(departments) == 1:
+            conditions.append(f"department = {_sql_literal(departments[0])}")
+        elif departments:
+            conditions.append(f"department IN ({', '.join(_sql_literal(d) for d in departments)})")
+
+        if positions:
+            likes = [f"position ILIKE {_sql_literal('%' + p + '%')}" for p in positions]
+            conditions.append(likes[0] if len(likes) == 1 else f"({' OR '.join(likes)})")
+
+        salary_condition, _ = self._salary_condition(features['flags'], features['numbers'])
+        if salary_condition:
+            conditions.append(salary_condition)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        aggregates = [AGGREGATES[name] for name in AGGREGATE_ORDER if name in flags]
+
+        # Агрегаты (в том числе с разбивкой по отделам)
+        if aggregates:
+            if 'by_department' in flags:
+                return (f"SELECT department, {', '.join(aggregates)} FROM employees{where} "
+                        f"GROUP BY department ORDER BY department;")
+            return f"SELECT {', '.join(aggregates)} FROM employees{where};"
+
+        # Сортировка
+        order = ""
+        if 'sort' in flags or 'desc' in flags or 'asc' in flags:
+            direction = "DESC" if 'desc' in flags else "ASC"
+            if 'surname' in flags:
+                order = f" ORDER BY last_name {direction}"
+            else:
+                order = f" ORDER BY salary {direction}"
+
+        if not conditions and not order:
+            if 'all' in flags and 'employee' in flags:
+                return "SELECT * FROM employees;"
+            if 'salary' in flags:
+                # "Зарплаты" без условий - самые высокие оклады
+                return f"SELECT {BASE_COLUMNS} FROM employees ORDER BY salary DESC LIMIT 10;"
+            # Если ничего не подошло - возвращаем ограниченный набор
+            return f"SELECT {BASE_COLUMNS} FROM employees LIMIT 10;"
+
+        return f"SELECT {BASE_COLUMNS} FROM employees{where}{order};"
+
+    def confidence(self, query, features):
+        """
+        Доля значимых слов запроса, понятых правилами (0..1). Незнакомые слова
+        (кроме STOP_WORDS) снижают уверенность; стоп-слова, вошедшие в
+        понятые сочетания ("по отделам"), ее не завышают.
+        """
+        significant = [i for i, word in enumerate(features['words']) if word not in STOP_WORDS]
+        covered = features['covered']
+        if not significant or not covered:
+            return 0.0
+
+        score = sum(1 for i in significant if i in covered) / len(significant)
+
+        # Число без оператора сравнения - правила его не поняли
+        _, numbers_used = self._salary_condition(features['flags'], features['numbers'])
+        if features['numbers'] and not numbers_used:
+            score *= 0.5
+        # Отрицание, которое правила не применили, меняет смысл запроса
+        if features['negations']:
+            score = min(score, NEGATION_CONFIDENCE)
+        if features['fuzzy']:
+            score = min(score, FUZZY_DEPARTMENT_CONFIDENCE)
+        return round(score, 3)
+
+    def translate(self, query):
+        """Перевод запроса: SQL, уверенность и найденные признаки"""
+        features = self.extract(query)
+        return {
+            'sql': self.build_sql(features),
+            'confidence': self.confidence(query, features),
+            'features': features,
+        }
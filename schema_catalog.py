@@ -0,0 +1,303 @@
+# schema_catalog.py - каталог схемы БД: источник промпта LLM и белого списка SQL
+import json
+import logging
+import threading
+import time
+
+from translation_cache import schema_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Дешевая проверка DDL: подпись каждой таблицы (столбцы, типы, индексы, ограничения).
+# Выполняется в фоне раз в refresh_interval секунд.
+DDL_SIGNATURE_QUERY = """
+    SELECT c.relname,
+           md5(
+               COALESCE((SELECT string_agg(a.attname || ':' || format_type(a.atttypid, a.atttypmod)
+                                           || ':' || a.attnotnull, ',' ORDER BY a.attnum)
+                         FROM pg_attribute a
+                         WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped), '')
+               || '|' ||
+               COALESCE((SELECT string_agg(i.indexrelid::regclass::text, ',' ORDER BY i.indexrelid)
+                         FROM pg_index i WHERE i.indrelid = c.oid), '')
+               || '|' ||
+               COALESCE((SELECT string_agg(con.conname, ',' ORDER BY con.conname)
+                         FROM pg_constraint con WHERE con.conrelid = c.oid), '')
+               || '|' || COALESCE(obj_description(c.oid, 'pg_class'), '')
+           )
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm')
+    ORDER BY c.relname;
+"""
+
+COLUMNS_QUERY = """
+    SELECT c.table_name, c.column_name, c.data_type, c.character_maximum_length,
+           c.numeric_precision, c.numeric_scale, c.is_nullable,
+           col_description(format('%I.%I', c.table_schema, c.table_name)::regclass::oid,
+                           c.ordinal_position::int)
+    FROM information_schema.columns c
+    WHERE c.table_schema = 'public'
+    ORDER BY c.table_name, c.ordinal_position;
+"""
+
+KEYS_QUERY = """
+    SELECT tc.table_name, tc.constraint_type, tc.constraint_name, kcu.column_name,
+           ccu.table_name, ccu.column_name
+    FROM information_schema.table_constraints tc
+    JOIN information_schema.key_column_usage kcu
+      ON kcu.constraint_name = tc.constraint_name AND kcu.table_schema = tc.table_schema
+    LEFT JOIN information_schema.constraint_column_usage ccu
+      ON tc.constraint_type = 'FOREIGN KEY'
+     AND ccu.constraint_name = tc.constraint_name AND ccu.table_schema = tc.table_schema
+    WHERE tc.table_schema = 'public' AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')
+    ORDER BY tc.table_name, tc.constraint_name, kcu.ordinal_position;
+"""
+
+INDEXES_QUERY = """
+    SELECT tablename, indexname, indexdef
+    FROM pg_indexes
+    WHERE schemaname = 'public'
+    ORDER BY tablename, indexname;
+"""
+
+# Оценка числа различных значений (после ANALYZE); без статистики проверяем запросом
+DISTINCT_STATS_QUERY = """
+    SELECT tablename, attname, n_distinct
+    FROM pg_stats
+    WHERE schemaname = 'public';
+"""
+
+# Текстовые типы, для которых собираем перечень значений
+_TEXT_TYPES = {'character varying', 'character', 'text'}
+
+# Пояснения к столбцам, если в БД нет COMMENT ON COLUMN
+COLUMN_HINTS = {
+    ('employees', 'first_name'): 'имя',
+    ('employees', 'last_name'): 'фамилия',
+    ('employees', 'patronymic'): 'отчество',
+    ('employees', 'department'): 'отдел',
+    ('employees', 'position'): 'должность',
+    ('employees', 'salary'): 'зарплата в рублях',
+    ('employees', 'hire_date'): 'дата приема',
+    ('employees', 'email'): 'email',
+}
+
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _type_name(data_type, char_length, precision, scale):
+    if char_length:
+        return f"{data_type}({char_length})"
+    if data_type == 'numeric' and precision:
+        return f"numeric({precision},{scale or 0})"
+    return data_type
+
+
+class SchemaCatalog:
+    """
+    Модель схемы public: таблицы, столбцы с типами, первичные и внешние
+    ключи, индексы и значения столбцов с малым числом вариантов (отделы).
+
+    Из модели строятся текст схемы для промпта (prompt_text) и белый список
+    для sql_validator (whitelist). Фоновый поток раз в refresh_interval
+    секунд сверяет подписи таблиц (DDL_SIGNATURE_QUERY): при изменении
+    перечитываются метаданные, а перечень значений - только для
+    изменившихся таблиц (и для всех раз в values_ttl секунд).
+    Подписчики (subscribe) вызываются, когда меняется отпечаток модели.
+
+    fetch(sql) -> список строк; запросы каталога выполняются без параметров.
+    """
+
+    def __init__(self, fetch, db_name='', refresh_interval=30.0, max_distinct=20, values_ttl=600.0):
+        self.fetch = fetch
+        self.db_name = db_name
+        self.refresh_interval = refresh_interval
+        self.max_distinct = max_distinct
+        self.values_ttl = values_ttl
+
+        self.tables = {}
+        self.fingerprint = None
+        self.loaded_at = None
+
+        self._signatures = {}
+        self._values = {}              # таблица -> {столбец: [значения]}
+        self._values_at = 0.0
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.last_error = None
+
+    def subscribe(self, callback):
+        """callback(catalog) при каждом изменении схемы (и сразу, если она уже загружена)"""
+        self._subscribers.append(callback)
+        if self.fingerprint is not None:
+            callback(self)
+
+    def start(self):
+        """Первичная загрузка и фоновая проверка DDL"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="schema-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("⚠️  Не удалось обновить каталог схемы: %s", e)
+            self._stop.wait(self.refresh_interval)
+
+    def refresh(self, force=False):
+        """Сверка DDL и перечитывание изменившегося; True, если модель изменилась"""
+        signatures = {row[0]: row[1] for row in self.fetch(DDL_SIGNATURE_QUERY)}
+        values_expired = time.monotonic() - self._values_at >= self.values_ttl
+        if not force and not values_expired and signatures == self._signatures:
+            return False
+
+        changed = {t for t, sig in signatures.items() if self._signatures.get(t) != sig}
+        tables = self._introspect()
+
+        # Перечень значений: для новых/измененных таблиц или для всех по истечении values_ttl
+        stale = set(tables) if (force or values_expired) else changed
+        values = {t: v for t, v in self._values.items() if t in tables and t not in stale}
+        values.update(self._distinct_values(tables, stale))
+        for table_name, table in tables.items():
+            table['values'] = values.get(table_name, {})
+
+        fingerprint = schema_fingerprint(json.dumps(tables, sort_keys=True, default=str))
+        with self._lock:
+            self._signatures = signatures
+            self._values = values
+            if stale == set(tables):
+                self._values_at = time.monotonic()
+            changed_model = fingerprint != self.fingerprint
+            self.tables = tables
+            self.fingerprint = fingerprint
+            self.loaded_at = time.time()
+            self.refreshes += 1
+
+        if changed_model:
+            logger.info("🗂️  Каталог схемы обновлен: %s (отпечаток %s)", ', '.join(tables), fingerprint)
+            for callback in self._subscribers:
+                try:
+                    callback(self)
+                except Exception as e:
+                    logger.warning("⚠️  Ошибка обработчика изменения схемы: %s", e)
+        return changed_model
+
+    def _introspect(self):
+        """Таблицы, столбцы, ключи и индексы одной выборкой на каждый вид метаданных"""
+        tables = {}
+        for table_name, column, data_type, char_length, precision, scale, nullable, comment in self.fetch(COLUMNS_QUERY):
+            table = tables.setdefault(table_name, {
+                'columns': [], 'primary_key': [], 'foreign_keys': [], 'indexes': []
+            })
+            table['columns'].append({
+                'name': column,
+                'type': _type_name(data_type, char_length, precision, scale),
+                'nullable': nullable == 'YES',
+                'comment': comment or COLUMN_HINTS.get((table_name, column)),
+            })
+
+        foreign_keys = {}
+        for table_name, constraint_type, constraint_name, column, ref_table, ref_column in self.fetch(KEYS_QUERY):
+            if table_name not in tables:
+                continue
+            if constraint_type == 'PRIMARY KEY':
+                tables[table_name]['primary_key'].append(column)
+            else:
+                fk = foreign_keys.get(constraint_name)
+                if fk is None:
+                    fk = foreign_keys[constraint_name] = {'columns': [], 'ref_table': ref_table, 'ref_columns': []}
+                    tables[table_name]['foreign_keys'].append(fk)
+                if column not in fk['columns']:
+                    fk['columns'].append(column)
+                if ref_column not in fk['ref_columns']:
+                    fk['ref_columns'].append(ref_column)
+
+        for table_name, index_name, definition in self.fetch(INDEXES_QUERY):
+            if table_name in tables:
+                tables[table_name]['indexes'].append({'name': index_name, 'definition': definition})
+        return tables
+
+    def _distinct_values(self, tables, table_names):
+        """Значения текстовых столбцов, у которых не больше max_distinct вариантов"""
+        if not table_names or not self.max_distinct:
+            return {}
+        estimates = {(t, c): n for t, c, n in self.fetch(DISTINCT_STATS_QUERY)}
+
+        values = {}
+        for table_name in table_names:
+            for column in tables[table_name]['columns']:
+                if column['type'].split('(')[0] not in _TEXT_TYPES:
+                    continue
+                estimate = estimates.get((table_name, column['name']))
+                # n_distinct < 0 - доля от числа строк, т.е. значений много
+                if estimate is not None and (estimate < 0 or estimate > self.max_distinct):
+                    continue
+                rows = self.fetch(
+                    f"SELECT DISTINCT {quote_ident(column['name'])} FROM {quote_ident(table_name)} "
+                    f"WHERE {quote_ident(column['name'])} IS NOT NULL "
+                    f"ORDER BY 1 LIMIT {self.max_distinct + 1};"
+                )
+                if len(rows) <= self.max_distinct:
+                    values.setdefault(table_name, {})[column['name']] = [row[0] for row in rows]
+        return values
+
+    def whitelist(self):
+        """Таблицы и столбцы для SQLValidator.set_whitelist"""
+        with self._lock:
+            return {name: [c['name'] for c in table['columns']] for name, table in self.tables.items()}
+
+    def prompt_text(self):
+        """Компактное описание схемы для промпта LLM"""
+        with self._lock:
+            tables = self.tables
+        lines = [f'База данных "{self.db_name}":' if self.db_name else 'База данных:']
+        hints = []
+        for table_name, table in tables.items():
+            lines.append('')
+            lines.append(f'Таблица "{table_name}":')
+            for column in table['columns']:
+                flags = [column['type']]
+                if column['name'] in table['primary_key']:
+                    flags.append('PRIMARY KEY')
+                elif not column['nullable']:
+                    flags.append('NOT NULL')
+                line = f"- {column['name']} ({', '.join(flags)})"
+                if column['comment']:
+                    line += f" - {column['comment']}"
+                column_values = table.get('values', {}).get(column['name'])
+                if column_values:
+                    line += ': ' + ', '.join(f"'{v}'" for v in column_values)
+                    hints.append(f"{table_name}.{column['name']} = 'значение'")
+                lines.append(line)
+            for fk in table['foreign_keys']:
+                lines.append(f"Связь: {table_name}({', '.join(fk['columns'])}) -> "
+                             f"{fk['ref_table']}({', '.join(fk['ref_columns'])})")
+        if hints:
+            lines.append('')
+            lines.append('Важно: для фильтра по перечисленным значениям используй ' + ', '.join(hints) + '.')
+        return '\n'.join(lines)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tables': {name: len(table['columns']) for name, table in self.tables.items()},
+                'fingerprint': self.fingerprint,
+                'loaded_at': self.loaded_at,
+                'refreshes': self.refreshes,
+                'refresh_interval': self.refresh_interval,
+                'last_error': self.last_error,
+            }
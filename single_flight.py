@@ -0,0 +1,151 @@
+# single_flight.py - один исполнитель на одинаковые одновременные запросы
+#
+# Первый вызов с ключом (лидер) выполняет работу, остальные вызовы с тем же
+# ключом, пришедшие до ее окончания, ждут тот же результат или ту же ошибку.
+# Результат не кэшируется: после завершения ключ освобождается.
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from metrics import registry
+
+SINGLE_FLIGHT_CALLS = registry.counter(
+    'text2sql_single_flight_total',
+    'Вызовы через single-flight: leader выполнил работу, shared получил чужой результат',
+    ['group', 'role']
+)
+
+
+class SingleFlightTimeout(TimeoutError):
+    """Результат лидера не получен за отведенное время"""
+
+
+class _Stats:
+    def __init__(self, name):
+        self.name = name
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def as_dict(self, in_flight):
+        return {
+            'in_flight': in_flight,
+            'leaders': self.leaders,
+            'shared': self.shared,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+        }
+
+
+class SingleFlight:
+    """
+    Single-flight для потоков (app.py, синхронный код).
+    do(key, fn, timeout) -> (результат, shared): shared=True, если результат
+    получен от другого вызова. timeout ограничивает только ожидание чужого
+    результата; лидер выполняет fn в своем потоке без ограничения.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}          # ключ -> Future
+        self._lock = threading.Lock()
+        self._stats = _Stats(name)
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats.leaders += 1
+            else:
+                self._stats.shared += 1
+        SINGLE_FLIGHT_CALLS.inc(group=self.name, role='leader' if leader else 'shared')
+
+        if not leader:
+            timeout = self.timeout if timeout is None else timeout
+            try:
+                return future.result(timeout), True
+            except FutureTimeoutError:
+                with self._lock:
+                    self._stats.timeouts += 1
+                raise SingleFlightTimeout(
+                    f"Не дождались одинакового запроса ({self.name}) за {timeout:g} с"
+                ) from None
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._stats.errors += 1
+                self._calls.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._calls.pop(key, None)
+        future.set_result(result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return self._stats.as_dict(len(self._calls))
+
+
+class AsyncSingleFlight:
+    """
+    Single-flight для asyncio (asgi_app.py). Работа выполняется отдельной
+    задачей; каждый вызов ждет ее не дольше своего timeout (по истечении -
+    asyncio.TimeoutError, как у остальных шагов с дедлайном). Когда ждать
+    перестали все вызовы (таймауты, отмена запросов), задача отменяется.
+    Все вызовы с одним ключом должны идти из одного цикла событий.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}          # ключ -> [задача, число ожидающих]
+        self._stats = _Stats(name)
+
+    async def do(self, key, coro_fn, timeout=None):
+        entry = self._calls.get(key)
+        leader = entry is None
+        if leader:
+            task = asyncio.ensure_future(coro_fn())
+            entry = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _, key=key, entry=entry: self._release(key, entry))
+            self._stats.leaders += 1
+        else:
+            self._stats.shared += 1
+        SINGLE_FLIGHT_CALLS.inc(group=self.name, role='leader' if leader else 'shared')
+
+        task = entry[0]
+        entry[1] += 1
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout), not leader
+        except asyncio.TimeoutError:
+            # Таймаут самой работы (например, statement_timeout) - ее ошибка,
+            # иначе истекло время ожидания этого вызова
+            if task.done():
+                self._stats.errors += leader
+            else:
+                self._stats.timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._stats.errors += leader
+            raise
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                task.cancel()
+
+    def _release(self, key, entry):
+        if self._calls.get(key) is entry:
+            del self._calls[key]
+
+    def stats(self):
+        return self._stats.as_dict(len(self._calls))
@@ -0,0 +1,300 @@
+# sql_grammar.py - ограничение генерации LLM грамматикой SELECT по известной схеме
+#
+# Грамматика лексическая: SQL собирается из ключевых слов, разрешенных функций,
+# имен таблиц/столбцов схемы, псевдонимов после AS, чисел, строк в одинарных
+# кавычках и операторов. Запрос обязан начинаться с SELECT, скобки должны
+# быть сбалансированы; после ';' допускается только конец последовательности.
+# Проверка идет по байтам (токены byte-level BPE могут резать символы UTF-8).
+import bisect
+from collections import OrderedDict
+
+from sql_validator import KEYWORDS, ALLOWED_FUNCTIONS, DEFAULT_WHITELIST
+
+_WORD_START = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_')
+_WORD_CHARS = _WORD_START | frozenset(b'0123456789')
+_DIGITS = frozenset(b'0123456789')
+_SPACE = frozenset(b' \t\r\n')
+_OPERATORS = frozenset(b'=<>!*+-/%,.|')
+
+MAX_DEPTH = 8           # вложенность скобок
+MAX_NUMBER_LEN = 12     # цифр в числе
+MAX_ALIAS_LEN = 30
+
+# Состояние: (режим, буфер, глубина скобок, начат ли SELECT, после AS, псевдонимы).
+# Режимы: sep - между лексемами, word - слово, alias - новый псевдоним после AS,
+# num - число, str - строка, str_q - закрывающая кавычка (или '' внутри строки)
+DONE = ('done',)
+
+
+def token_bytes(tokenizer):
+    """Байтовое представление каждого токена словаря: список (bytes, id)"""
+    vocab = tokenizer.get_vocab()
+    byte_decoder = None
+    try:
+        from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+        byte_decoder = {v: k for k, v in bytes_to_unicode().items()}
+    except ImportError:
+        pass
+
+    special = set(tokenizer.all_special_ids)
+    result = []
+    for token, token_id in vocab.items():
+        if token_id in special:
+            continue
+        if byte_decoder is not None and all(ch in byte_decoder for ch in token):
+            raw = bytes(byte_decoder[ch] for ch in token)
+        else:
+            raw = tokenizer.convert_tokens_to_string([token]).encode('utf-8')
+        if raw:
+            result.append((raw, token_id))
+    result.sort()
+    return result
+
+
+def _next_prefix(prefix):
+    """Наименьшая строка байт, большая всех строк с данным префиксом"""
+    prefix = bytearray(prefix)
+    while prefix and prefix[-1] == 255:
+        prefix.pop()
+    if not prefix:
+        return None
+    prefix[-1] += 1
+    return bytes(prefix)
+
+
+class SQLGrammar:
+    """
+    Автомат допустимых префиксов SQL над байтами и разрешенные токены
+    для каждого состояния. Переходы и наборы токенов запоминаются
+    (LRU на cache_states состояний), поэтому обход словаря выполняется
+    один раз на состояние, а шаг генерации сводится к поиску в словаре.
+    """
+
+    def __init__(self, vocab, identifiers=None, cache_states=1024):
+        """
+        vocab - результат token_bytes(tokenizer);
+        identifiers - {таблица: [столбцы]} (по умолчанию DEFAULT_WHITELIST).
+        """
+        identifiers = identifiers or DEFAULT_WHITELIST
+        words = {w.lower() for w in KEYWORDS | ALLOWED_FUNCTIONS}
+        for table, columns in identifiers.items():
+            words.add(table.lower())
+            words.update(c.lower() for c in columns)
+        self.words = frozenset(w.encode('ascii') for w in words if w.isascii())
+        self.prefixes = frozenset(w[:i] for w in self.words for i in range(1, len(w) + 1))
+
+        self.vocab = vocab
+        self._keys = [raw for raw, _ in vocab]
+        self._token_bytes = {token_id: raw for raw, token_id in vocab}
+        self.cache_states = cache_states
+
+        self.initial = ('sep', b'', 0, False, False, frozenset())
+        self._steps = {}
+        self._advances = {}
+        self._allowed = OrderedDict()
+
+    # ===== ПЕРЕХОДЫ ПО БАЙТАМ =====
+    def _end_word(self, state):
+        """Завершение слова: оно должно быть известным (или это псевдоним)"""
+        mode, buf, depth, started, after_as, aliases = state
+        if mode == 'alias':
+            return ('sep', b'', depth, started, False, aliases | {buf})
+        if not started:
+            return ('sep', b'', depth, True, False, aliases) if buf == b'select' else None
+        if buf in self.words or buf in aliases:
+            return ('sep', b'', depth, started, buf == b'as', aliases)
+        return None
+
+    def _from_sep(self, state, byte):
+        _, _, depth, started, after_as, aliases = state
+        if byte in _SPACE:
+            return state
+        if byte in _WORD_START:
+            word = bytes([byte]).lower()
+            if after_as:
+                return ('alias', word, depth, started, False, aliases)
+            if not started:
+                return ('word', word, depth, started, False, aliases) if b'select'.startswith(word) else None
+            if word in self.prefixes or any(a.startswith(word) for a in aliases):
+                return ('word', word, depth, started, False, aliases)
+            return None
+        if not started:
+            return None
+        if byte in _DIGITS:
+            return ('num', b'1', depth, started, False, aliases)
+        if byte == ord("'"):
+            return ('str', b'', depth, started, False, aliases)
+        if byte == ord('('):
+            return ('sep', b'', depth + 1, started, False, aliases) if depth < MAX_DEPTH else None
+        if byte == ord(')'):
+            return ('sep', b'', depth - 1, started, False, aliases) if depth > 0 else None
+        if byte == ord(';'):
+            return DONE if depth == 0 else None
+        if byte in _OPERATORS:
+            return ('sep', b'', depth, started, False, aliases)
+        return None
+
+    def step(self, state, byte):
+        """Состояние после байта (None - недопустимое продолжение)"""
+        key = (state, byte)
+        if key in self._steps:
+            return self._steps[key]
+
+        mode = state[0]
+        if mode == 'done':
+            result = None
+        elif mode == 'sep':
+            result = self._from_sep(state, byte)
+        elif mode in ('word', 'alias'):
+            _, buf, depth, started, after_as, aliases = state
+            if byte in _WORD_CHARS:
+                word = buf + bytes([byte]).lower()
+                if mode == 'alias':
+                    ok = len(word) <= MAX_ALIAS_LEN
+                elif not started:
+                    ok = b'select'.startswith(word)
+                else:
+                    ok = word in self.prefixes or any(a.startswith(word) for a in aliases)
+                result = (mode, word, depth, started, after_as, aliases) if ok else None
+            else:
+                ended = self._end_word(state)
+                result = self._from_sep(ended, byte) if ended is not None else None
+        elif mode == 'num':
+            _, buf, depth, started, after_as, aliases = state
+            if byte in _DIGITS:
+                result = state[:1] + (buf + b'1',) + state[2:] if len(buf) < MAX_NUMBER_LEN else None
+            elif byte == ord('.') and b'.' not in buf:
+                result = state[:1] + (buf + b'.',) + state[2:]
+            elif byte in _WORD_CHARS:
+                result = None
+            else:
+                result = self._from_sep(('sep', b'') + state[2:], byte)
+        elif mode == 'str':
+            # Длину строки в состоянии не считаем: иначе каждая позиция внутри
+            # литерала потребовала бы отдельного обхода словаря
+            if byte == ord("'"):
+                result = ('str_q',) + state[1:]
+            elif byte in (ord('\n'), ord('\r')):
+                result = None
+            else:
+                result = state
+        else:   # str_q
+            if byte == ord("'"):
+                result = ('str',) + state[1:]
+            else:
+                result = self._from_sep(('sep', b'') + state[2:], byte)
+
+        self._steps[key] = result
+        return result
+
+    def advance(self, state, token_id):
+        """Состояние после целого токена"""
+        key = (state, token_id)
+        if key not in self._advances:
+            raw = self._token_bytes.get(token_id)
+            result = state if raw is not None else None
+            for byte in raw or b'':
+                result = self.step(result, byte)
+                if result is None:
+                    break
+            self._advances[key] = result
+        return self._advances[key]
+
+    # ===== РАЗРЕШЕННЫЕ ТОКЕНЫ =====
+    def allowed(self, state):
+        """Идентификаторы токенов, допустимых в состоянии (с запоминанием)"""
+        cached = self._allowed.get(state)
+        if cached is not None:
+            self._allowed.move_to_end(state)
+            return cached
+
+        allowed = []
+        vocab, keys = self.vocab, self._keys
+        stack = [state]         # stack[k] - состояние после k байт текущего токена
+        prev = b''
+        i = 0
+        while i < len(vocab):
+            raw, token_id = vocab[i]
+            common = 0
+            limit = min(len(prev), len(raw), len(stack) - 1)
+            while common < limit and prev[common] == raw[common]:
+                common += 1
+            del stack[common + 1:]
+
+            dead_at = None
+            for k in range(common, len(raw)):
+                nxt = self.step(stack[-1], raw[k])
+                if nxt is None:
+                    dead_at = k
+                    break
+                stack.append(nxt)
+
+            if dead_at is None:
+                allowed.append(token_id)
+                prev = raw
+                i += 1
+            else:
+                # Все токены с этим недопустимым префиксом пропускаем разом
+                prev = raw[:dead_at]
+                upper = _next_prefix(raw[:dead_at + 1])
+                i = len(vocab) if upper is None else bisect.bisect_left(keys, upper, i + 1)
+
+        self._allowed[state] = allowed
+        while len(self._allowed) > self.cache_states:
+            self._allowed.popitem(last=False)
+        return allowed
+
+    def logits_processor(self, eos_token_id):
+        """LogitsProcessor для model.generate (torch импортируется только здесь)"""
+        import torch
+        from transformers import LogitsProcessor
+
+        grammar = self
+        masks = OrderedDict()
+
+        def allowed_tensor(state, device):
+            tensor = masks.get(state)
+            if tensor is None or tensor.device != device:
+                tensor = torch.tensor(grammar.allowed(state), dtype=torch.long, device=device)
+                masks[state] = tensor
+                while len(masks) > grammar.cache_states:
+                    masks.popitem(last=False)
+            return tensor
+
+        class _SQLGrammarProcessor(LogitsProcessor):
+            def __init__(self):
+                self.prompt_len = None
+                self.states = None
+
+            def __call__(self, input_ids, scores):
+                if self.prompt_len is None:
+                    # Первый вызов - до первого нового токена: запоминаем длину промпта
+                    self.prompt_len = input_ids.shape[1]
+                    self.states = [grammar.initial] * input_ids.shape[0]
+                else:
+                    last = input_ids[:, -1].tolist()
+                    for row, state in enumerate(self.states):
+                        if state is not None and state != DONE:
+                            self.states[row] = grammar.advance(state, last[row])
+
+                mask = torch.full_like(scores, float('-inf'))
+                for row, state in enumerate(self.states):
+                    if state is None:
+                        mask[row] = 0           # сбились с грамматики - без ограничений
+                    elif state == DONE:
+                        mask[row, eos_token_id] = 0
+                    else:
+                        allowed = allowed_tensor(state, scores.device)
+                        mask[row, allowed] = 0
+                        if allowed.numel() == 0:
+                            mask[row, eos_token_id] = 0
+                return scores + mask
+
+        return _SQLGrammarProcessor()
+
+    def stats(self):
+        return {
+            'words': len(self.words),
+            'states_cached': len(self._allowed),
+            'transitions': len(self._steps),
+        }
@@ -0,0 +1,351 @@
+# sql_validator.py - разбор и проверка сгенерированного SQL перед выполнением
+import re
+import threading
+from collections import OrderedDict
+
+# Лексемы SQL (порядок важен: сначала комментарии и строки)
+_TOKEN_SPEC = [
+    ('comment', r'--[^\n]*|/\*.*?\*/'),
+    # E'...' - с экранированием обратной косой чертой (E'\'' - одна кавычка)
+    ('string', r"[eE]'(?:[^'\\]|''|\\.)*'|'(?:[^']|'')*'"),
+    ('qident', r'"(?:[^"]|"")+"'),
+    ('dollar', r'\$[A-Za-z_]*\$'),
+    ('param', r'%\([A-Za-z_]\w*\)s|%s|\$\d+'),
+    ('number', r'\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|\.\d+'),
+    ('ident', r'[A-Za-z_Ѐ-ӿ][\w$]*'),
+    ('op', r'::|<=|>=|<>|!=|\|\||[-+*/%<>=~!^&|#@]'),
+    ('punct', r'[(),;.\[\]]'),
+    ('ws', r'\s+'),
+]
+_TOKEN_RE = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in _TOKEN_SPEC), re.DOTALL)
+
+# Ключевые слова, допустимые в SELECT (не являются именами столбцов)
+KEYWORDS = {
+    'SELECT', 'DISTINCT', 'ALL', 'FROM', 'WHERE', 'GROUP', 'BY', 'HAVING', 'ORDER', 'ASC', 'DESC',
+    'NULLS', 'FIRST', 'LAST', 'LIMIT', 'OFFSET', 'FETCH', 'NEXT', 'ROW', 'ROWS', 'ONLY',
+    'AND', 'OR', 'NOT', 'IN', 'IS', 'NULL', 'LIKE', 'ILIKE', 'SIMILAR', 'BETWEEN', 'SYMMETRIC',
+    'EXISTS', 'ANY', 'SOME', 'AS', 'ON', 'USING', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'OUTER',
+    'CASE', 'WHEN', 'THEN', 'ELSE', 'END', 'TRUE', 'FALSE', 'UNION', 'INTERSECT', 'EXCEPT',
+    'CAST', 'INTERVAL', 'DATE', 'TIME', 'TIMESTAMP', 'NUMERIC', 'DECIMAL', 'INTEGER', 'INT',
+    'BIGINT', 'TEXT', 'VARCHAR', 'CHAR', 'BOOLEAN', 'FLOAT', 'REAL', 'DOUBLE', 'PRECISION',
+    'YEAR', 'MONTH', 'DAY', 'HOUR', 'MINUTE', 'SECOND', 'ESCAPE', 'FILTER', 'OVER', 'PARTITION',
+    'WITHIN', 'CURRENT_DATE', 'CURRENT_TIMESTAMP', 'LOCALTIMESTAMP', 'AT', 'ZONE',
+}
+
+# Операторы, изменяющие данные или состояние сервера
+FORBIDDEN_KEYWORDS = {
+    'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'DROP', 'ALTER', 'TRUNCATE', 'CREATE', 'GRANT',
+    'REVOKE', 'COPY', 'INTO', 'LOCK', 'VACUUM', 'ANALYZE', 'EXECUTE', 'CALL', 'DO', 'SET',
+    'RESET', 'LISTEN', 'NOTIFY', 'PREPARE', 'DEALLOCATE', 'COMMENT', 'SHARE', 'CROSS',
+    'NATURAL', 'LATERAL', 'RECURSIVE', 'WITH', 'TABLESAMPLE',
+}
+
+# Разрешенные функции
+ALLOWED_FUNCTIONS = {
+    'COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'ROUND', 'TRUNC', 'ABS', 'CEIL', 'FLOOR',
+    'LOWER', 'UPPER', 'LENGTH', 'TRIM', 'CONCAT', 'SUBSTRING', 'POSITION', 'REPLACE',
+    'COALESCE', 'NULLIF', 'GREATEST', 'LEAST', 'EXTRACT', 'DATE_PART', 'DATE_TRUNC',
+    'AGE', 'NOW', 'TO_CHAR', 'STRING_AGG', 'ARRAY_AGG', 'CAST', 'PERCENTILE_CONT',
+    'PERCENTILE_DISC', 'MODE', 'STDDEV', 'VARIANCE', 'ROW_NUMBER', 'RANK', 'DENSE_RANK',
+    'EXISTS', 'ANY', 'SOME', 'IN', 'NOT', 'AND', 'OR', 'OVER', 'FILTER', 'WITHIN',
+    'DATE', 'TIMESTAMP', 'NUMERIC', 'DECIMAL', 'VARCHAR', 'CHAR', 'INTERVAL',
+}
+
+# Лексемы, после которых идентификатор считается псевдонимом ("employees e", "COUNT(*) cnt")
+_VALUE_END = {'ident', 'qident', 'number', 'string', 'close', 'table'}
+
+# Ключевые слова, завершающие список FROM
+_FROM_END = {'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT', 'OFFSET', 'FETCH', 'ON', 'USING',
+             'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'UNION', 'INTERSECT', 'EXCEPT'}
+
+# Белый список по умолчанию (data/create_db.sql), пока схема не прочитана из БД
+# (актуальный строит schema_catalog.SchemaCatalog.whitelist)
+DEFAULT_WHITELIST = {
+    'employees': ['id', 'first_name', 'last_name', 'patronymic', 'department',
+                  'position', 'salary', 'hire_date', 'email'],
+}
+
+
+class SQLValidationError(ValueError):
+    """Сгенерированный SQL не прошел проверку"""
+
+
+def tokenize(sql):
+    """Список лексем (вид, текст); нераспознанный символ - ошибка"""
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        match = _TOKEN_RE.match(sql, pos)
+        if match is None:
+            raise SQLValidationError(f"Недопустимый символ в SQL: {sql[pos]!r}")
+        tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    return tokens
+
+
+class SQLValidator:
+    """
+    Проверка и переписывание SQL, сгенерированного LLM.
+
+    Запрос разбирается на лексемы один раз. Допускается только один оператор
+    SELECT по таблицам и столбцам из белого списка, без функций вне списка
+    ALLOWED_FUNCTIONS, без CROSS/NATURAL JOIN и перечисления таблиц через
+    запятую. Если нет LIMIT (или он больше max_rows), добавляется
+    LIMIT max_rows. Результаты проверки (и отказы) кэшируются по тексту SQL.
+    """
+
+    def __init__(self, whitelist=None, max_rows=1000, max_joins=3, cache_size=1024):
+        self.max_rows = max_rows
+        self.max_joins = max_joins
+        self.cache_size = cache_size
+        self.introspected = False
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self.set_whitelist(whitelist or DEFAULT_WHITELIST, introspected=False)
+
+    def set_whitelist(self, whitelist, introspected=True):
+        """Новый белый список таблиц и столбцов (кэш проверок сбрасывается)"""
+        tables = {table.lower(): {column.lower() for column in columns}
+                  for table, columns in whitelist.items()}
+        with self._lock:
+            self._tables = tables
+            self._cache.clear()
+            self.introspected = introspected
+
+    def validate(self, sql):
+        """
+        Проверка SQL. Возвращает словарь с переписанным запросом ('sql'),
+        таблицами ('tables') и признаком добавленного LIMIT ('limit_applied').
+        При нарушении бросает SQLValidationError.
+        """
+        with self._lock:
+            cached = self._cache.get(sql)
+            if cached is not None:
+                self._cache.move_to_end(sql)
+                self._hits += 1
+            else:
+                self._misses += 1
+            tables = self._tables
+
+        if cached is None:
+            try:
+                cached = self._validate(sql, tables)
+            except SQLValidationError as e:
+                cached = e
+            with self._lock:
+                self._cache[sql] = cached
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if isinstance(cached, SQLValidationError):
+            raise cached
+        return dict(cached)
+
+    def _validate(self, sql, tables):
+        tokens = [t for t in tokenize(sql) if t[0] != 'comment']
+
+        # Один оператор: ';' допускается только в конце
+        while tokens and (tokens[-1][0] == 'ws' or tokens[-1][1] == ';'):
+            tokens.pop()
+        while tokens and tokens[0][0] == 'ws':
+            tokens.pop(0)
+        if any(value == ';' for _, value in tokens):
+            raise SQLValidationError("Допускается только один SQL-оператор")
+        if any(kind == 'dollar' for kind, _ in tokens):
+            raise SQLValidationError("Строки в долларовых кавычках не допускаются")
+
+        significant = [(i, kind, value) for i, (kind, value) in enumerate(tokens) if kind != 'ws']
+        if not significant or significant[0][2].upper() != 'SELECT':
+            raise SQLValidationError("Разрешены только запросы SELECT")
+
+        used_tables = []
+        aliases = set()
+        columns = []            # (имя, квалификатор или None)
+        joins = 0
+        depth = 0
+        in_function = []        # стек скобок: True, если скобка открыта вызовом функции
+        tail_start = None       # первое LIMIT / OFFSET / FETCH верхнего уровня в significant
+        prev = None             # вид предыдущей значимой лексемы
+        prev_upper = None
+        expect_table = False
+        from_depth = None       # глубина скобок текущего списка FROM
+
+        for n, (i, kind, value) in enumerate(significant):
+            upper = value.upper()
+            nxt = significant[n + 1] if n + 1 < len(significant) else None
+
+            if value == '(':
+                depth += 1
+                # IN (SELECT ...), EXISTS (SELECT ...) - подзапрос, а не аргументы функции
+                in_function.append(prev == 'ident' and prev_upper in ALLOWED_FUNCTIONS
+                                   and not (nxt is not None and nxt[2].upper() == 'SELECT'))
+            elif value == ')':
+                depth -= 1
+                if depth < 0:
+                    raise SQLValidationError("Несбалансированные скобки")
+                in_function.pop()
+                if from_depth is not None and depth < from_depth:
+                    from_depth = None
+
+            if kind == 'ident' and upper in FORBIDDEN_KEYWORDS:
+                raise SQLValidationError(f"Недопустимая операция: {upper}")
+
+            if kind == 'ident' and upper == 'JOIN':
+                joins += 1
+
+            # Таблица после FROM / JOIN (FROM внутри EXTRACT(... FROM ...) не в счет)
+            if kind == 'ident' and upper in ('FROM', 'JOIN') and not (in_function and in_function[-1]):
+                expect_table = True
+            elif expect_table:
+                if value == '(':
+                    expect_table = False        # подзапрос - проверяется тем же проходом
+                elif kind in ('ident', 'qident'):
+                    name = value.strip('"').lower()
+                    if nxt is not None and nxt[2] == '.':
+                        # schema.table: разрешаем только public
+                        if name != 'public':
+                            raise SQLValidationError(f"Схема {name} недоступна")
+                        continue
+                    if name not in tables:
+                        raise SQLValidationError(f"Таблица {name} недоступна")
+                    used_tables.append(name)
+                    from_depth = depth
+                    expect_table = False
+                    prev, prev_upper = 'table', upper
+                    continue
+            elif kind == 'ident' and upper in _FROM_END and depth == from_depth:
+                from_depth = None
+            elif value == ',' and depth == from_depth:
+                raise SQLValidationError("Перечисление таблиц через запятую запрещено, используйте JOIN ... ON")
+
+            if kind == 'ident' and upper in ('LIMIT', 'OFFSET', 'FETCH') and depth == 0 and tail_start is None:
+                tail_start = n
+
+            if kind in ('ident', 'qident'):
+                is_function = (kind == 'ident' and nxt is not None and nxt[2] == '('
+                               and (upper not in KEYWORDS or upper in ALLOWED_FUNCTIONS))
+                name = value.strip('"').lower() if kind == 'qident' else value.lower()
+
+                if is_function:
+                    if upper not in ALLOWED_FUNCTIONS:
+                        raise SQLValidationError(f"Функция {value} не разрешена")
+                elif kind == 'ident' and upper in KEYWORDS:
+                    pass
+                elif prev_upper == 'AS' or (prev in _VALUE_END and prev_upper not in KEYWORDS):
+                    # Псевдоним таблицы или столбца
+                    aliases.add(name)
+                elif nxt is not None and nxt[2] == '.':
+                    pass                        # квалификатор (таблица или псевдоним) - проверим ниже
+                elif prev_upper == '.':
+                    qualifier = significant[n - 2][2].strip('"').lower() if n >= 2 else None
+                    columns.append((name, qualifier))
+                else:
+                    columns.append((name, None))
+
+            prev = 'close' if value == ')' else kind
+            prev_upper = upper if kind in ('ident', 'punct', 'op') else None
+
+        if depth != 0:
+            raise SQLValidationError("Несбалансированные скобки")
+        if joins > self.max_joins:
+            raise SQLValidationError(f"Слишком много JOIN: {joins} (максимум {self.max_joins})")
+        if not used_tables:
+            raise SQLValidationError("В запросе не указана таблица")
+
+        allowed_columns = set().union(*(tables[t] for t in used_tables))
+        for name, qualifier in columns:
+            if name in aliases:
+                continue
+            if qualifier is not None and qualifier not in aliases and qualifier not in tables:
+                raise SQLValidationError(f"Неизвестная таблица или псевдоним: {qualifier}")
+            if name not in allowed_columns:
+                raise SQLValidationError(f"Столбец {name} недоступен")
+
+        # Ограничение числа строк
+        limit_applied = False
+        out = [value for _, value in tokens]
+        count_index, limited = self._row_limit(significant[tail_start:] if tail_start is not None else [])
+        if count_index is not None:
+            current = tokens[count_index][1]
+            if not current.isdigit() or int(current) > self.max_rows:
+                out[count_index] = str(self.max_rows)
+                limit_applied = True
+        elif not limited:
+            out.append(f" LIMIT {self.max_rows}")
+            limit_applied = True
+
+        return {
+            'sql': ''.join(out) + ';',
+            'tables': sorted(set(used_tables)),
+            'limit_applied': limit_applied,
+        }
+
+    @staticmethod
+    def _row_limit(tail):
+        """
+        Разбор хвоста запроса от первого LIMIT / OFFSET / FETCH верхнего уровня
+        до конца оператора. Допускаются только LIMIT n|$1|ALL,
+        OFFSET n|$1 [ROW|ROWS] и FETCH FIRST|NEXT [n|$1] ROW|ROWS ONLY, где n -
+        целое число; выражения, NULL и подзапросы отклоняются.
+        Возвращает (позиция числа строк в tokens или None, задано ли ограничение).
+        """
+        def error():
+            clause = ' '.join(value for _, _, value in tail)
+            return SQLValidationError(f"Недопустимое ограничение числа строк: {clause}")
+
+        def is_count(entry):
+            return entry is not None and (entry[1] == 'param' or (entry[1] == 'number' and entry[2].isdigit()))
+
+        def at(pos):
+            return tail[pos] if pos < len(tail) else None
+
+        def upper_at(pos):
+            entry = at(pos)
+            return entry[2].upper() if entry is not None else None
+
+        count_index = None
+        limited = False
+        seen = set()
+        pos = 0
+        while pos < len(tail):
+            clause = upper_at(pos)
+            if clause not in ('LIMIT', 'OFFSET', 'FETCH') or clause in seen:
+                raise error()
+            seen.add(clause)
+            if clause == 'LIMIT':
+                if 'FETCH' in seen or not (is_count(at(pos + 1)) or upper_at(pos + 1) == 'ALL'):
+                    raise error()
+                count_index = tail[pos + 1][0]
+                limited = True
+                pos += 2
+            elif clause == 'OFFSET':
+                if not is_count(at(pos + 1)):
+                    raise error()
+                pos += 2
+                if upper_at(pos) in ('ROW', 'ROWS'):
+                    pos += 1
+            else:
+                if 'LIMIT' in seen or upper_at(pos + 1) not in ('FIRST', 'NEXT'):
+                    raise error()
+                pos += 2
+                if is_count(at(pos)):
+                    count_index = tail[pos][0]
+                    pos += 1
+                if upper_at(pos) not in ('ROW', 'ROWS') or upper_at(pos + 1) != 'ONLY':
+                    raise error()
+                limited = True
+                pos += 2
+        return count_index, limited
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cached': len(self._cache),
+                'hits': self._hits,
+                'misses': self._misses,
+                'tables': sorted(self._tables),
+                'introspected': self.introspected,
+            }
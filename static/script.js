@@ -80,43 +80,22 @@ function processQuery() {
     // Засечь время начала
     const startTime = Date.now();
     
-    // Отправить запрос на сервер
+    // Отправить запрос на сервер (результаты приходят потоком NDJSON,
+    // порции - по столбцам: columns, types и массив значений на столбец)
     fetch('/api/query', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
+            'Accept': 'application/x-ndjson, application/vnd.text2sql.columnar+json, application/json;q=0.5'
         },
-        body: JSON.stringify({ query: query })
+        body: JSON.stringify({ query: query, layout: 'columnar' })
     })
-    .then(response => response.json())
-    .then(data => {
-        showLoading(false);
-        
-        if (data.success) {
-            // Обновить SQL запрос с форматированием
-            const sqlElement = document.getElementById('sqlQuery');
-            if (data.sql_query) {
-                sqlElement.textContent = formatSQL(data.sql_query);
-            } else {
-                sqlElement.textContent = '-- SQL не сгенерирован';
-            }
-            
-            // Обновить историю
-            if (data.history) {
-                updateHistory(data.history);
-            }
-            
-            // Отобразить результаты
-            displayResults(data.results, data.columns);
-            
-            // Показать статистику выполнения
-            const endTime = Date.now();
-            const executionTime = endTime - startTime;
-            updateExecutionStats(executionTime, data.results ? data.results.length : 0);
-            
-        } else {
-            showError(data.error || 'Неизвестная ошибка');
+    .then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (contentType.includes('application/x-ndjson') && response.body) {
+            return readQueryStream(response, startTime);
         }
+        return response.json().then(data => handleQueryResponse(data, startTime));
     })
     .catch(error => {
         showLoading(false);
@@ -124,6 +103,107 @@ function processQuery() {
     });
 }
 
+// Обработка обычного (не потокового) JSON-ответа
+function handleQueryResponse(data, startTime) {
+    showLoading(false);
+    
+    if (data.success) {
+        showQueryMeta(data);
+        
+        // Отобразить результаты
+        if (data.layout === 'columnar') {
+            displayColumnarResults(data.columns, data.types, data.data);
+        } else {
+            displayResults(data.results, data.columns);
+        }
+        
+        // Показать статистику выполнения
+        const executionTime = Date.now() - startTime;
+        updateExecutionStats(executionTime, data.row_count !== undefined ? data.row_count : (data.results || []).length);
+        
+    } else {
+        showError(data.error || 'Неизвестная ошибка');
+    }
+}
+
+// SQL-запрос и история из ответа сервера
+function showQueryMeta(data) {
+    // Обновить SQL запрос с форматированием
+    const sqlElement = document.getElementById('sqlQuery');
+    if (data.sql_query) {
+        sqlElement.textContent = formatSQL(data.sql_query);
+        if (data.estimate) {
+            sqlElement.textContent += `\n-- оценка плана: стоимость ${data.estimate.cost}, строк ~${data.estimate.rows}`;
+        }
+        if (data.translation) {
+            const t = data.translation;
+            const parts = [`${t.winner} (${t.reason})`];
+            if (t.rules_ms !== null) parts.push(`правила ${t.rules_ms} мс`);
+            if (t.llm_ms !== null) parts.push(`LLM ${t.llm_ms} мс`);
+            sqlElement.textContent += `\n-- перевод: ${parts.join(', ')}`;
+        }
+    } else {
+        sqlElement.textContent = '-- SQL не сгенерирован';
+    }
+    
+    // Обновить историю
+    if (data.history) {
+        updateHistory(data.history);
+    }
+}
+
+// Чтение потокового ответа: строки таблицы дорисовываются по мере поступления
+async function readQueryStream(response, startTime) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    let columns = [];
+    let rowCount = 0;
+    let tbody = null;
+    
+    const handleLine = line => {
+        if (!line.trim()) return;
+        const message = JSON.parse(line);
+        
+        if (message.type === 'meta') {
+            showLoading(false);
+            showQueryMeta(message);
+            columns = message.columns || [];
+            tbody = startResultsTable(columns);
+        } else if (message.type === 'rows') {
+            if (message.data) {
+                appendColumnarRows(tbody, columns, message.types, message.data);
+                rowCount += columnLength(message.data);
+            } else {
+                appendResultRows(tbody, columns, message.rows);
+                rowCount += message.rows.length;
+            }
+            updateExecutionStats(Date.now() - startTime, rowCount);
+        } else if (message.type === 'end') {
+            if (rowCount === 0) {
+                displayResults([], columns);
+            }
+            updateExecutionStats(Date.now() - startTime, message.row_count);
+        } else if (message.type === 'error') {
+            showError(message.error || 'Неизвестная ошибка');
+        }
+    };
+    
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        let newline;
+        while ((newline = buffer.indexOf('\n')) >= 0) {
+            handleLine(buffer.slice(0, newline));
+            buffer = buffer.slice(newline + 1);
+        }
+    }
+    handleLine(buffer + decoder.decode());
+    showLoading(false);
+}
+
 // Функция для форматирования SQL
 function formatSQL(sql) {
     if (!sql || sql.trim() === '') return '-- Нет SQL запроса';
@@ -154,32 +234,101 @@ function displayResults(results, columns) {
         return;
     }
     
+    const tbody = startResultsTable(columns);
+    appendResultRows(tbody, columns, results);
+}
+
+// Пустая таблица с заголовками; возвращает tbody для добавления строк
+function startResultsTable(columns) {
+    const resultsContainer = document.getElementById('resultsTable');
+    
     let html = '<table><thead><tr>';
     
     // Заголовки таблицы
     columns.forEach(col => {
         html += `<th>${col}</th>`;
     });
-    html += '</tr></thead><tbody>';
+    html += '</tr></thead><tbody></tbody></table>';
+    resultsContainer.innerHTML = html;
+    
+    return resultsContainer.querySelector('tbody');
+}
+
+// Результат по столбцам (columns, types, data[i] - значения столбца i)
+function displayColumnarResults(columns, types, data) {
+    const resultsContainer = document.getElementById('resultsTable');
+    
+    if (!data || columnLength(data) === 0) {
+        resultsContainer.innerHTML = '<p class="placeholder">Запрос выполнен успешно, но данных не найдено</p>';
+        return;
+    }
+    
+    const tbody = startResultsTable(columns);
+    appendColumnarRows(tbody, columns, types, data);
+}
+
+// Число строк в результате по столбцам
+function columnLength(data) {
+    return data.length ? data[0].length : 0;
+}
+
+// Сервер присылает значения без форматирования: числа - числами, даты - ISO-строками
+const moneyFormat = new Intl.NumberFormat('ru-RU', { minimumFractionDigits: 2, maximumFractionDigits: 2 });
+
+// Тип значения строчного ответа (в столбцовом тип приходит с сервера)
+function valueType(value) {
+    if (typeof value === 'number') return 'number';
+    if (typeof value === 'boolean') return 'boolean';
+    if (typeof value === 'string' && /^\d{4}-\d{2}-\d{2}(T|$)/.test(value)) return 'date';
+    return 'string';
+}
+
+// HTML ячейки таблицы
+function formatCell(column, type, value) {
+    if (value === null || value === undefined) {
+        return '<span style="color: #94a3b8; font-style: italic;">NULL</span>';
+    }
+    if (type === 'number' && column === 'salary') {
+        // Для денежных значений
+        return `<span style="color: #059669; font-weight: 500;">${moneyFormat.format(value)}</span>`;
+    }
+    if (type === 'date' || type === 'timestamp') {
+        return String(value).slice(0, 10);
+    }
+    return value;
+}
+
+// Добавление порции результата по столбцам в таблицу
+function appendColumnarRows(tbody, columns, types, data) {
+    const count = columnLength(data);
+    let html = '';
+    
+    for (let i = 0; i < count; i++) {
+        html += '<tr>';
+        for (let j = 0; j < columns.length; j++) {
+            html += `<td>${formatCell(columns[j], types[j], data[j][i])}</td>`;
+        }
+        html += '</tr>';
+    }
+    
+    tbody.insertAdjacentHTML('beforeend', html);
+}
+
+// Добавление порции строк в таблицу
+function appendResultRows(tbody, columns, rows) {
+    let html = '';
     
     // Данные
-    results.forEach(row => {
+    rows.forEach(row => {
         html += '<tr>';
         columns.forEach(col => {
-            let value = row[col];
-            if (value === null || value === undefined) {
-                value = '<span style="color: #94a3b8; font-style: italic;">NULL</span>';
-            } else if (typeof value === 'string' && value.includes('₽')) {
-                // Для денежных значений
-                value = `<span style="color: #059669; font-weight: 500;">${value}</span>`;
-            }
-            html += `<td>${value}</td>`;
+            const value = row[col];
+            html += `<td>${formatCell(col, valueType(value), value)}</td>`;
         });
         html += '</tr>';
     });
     
-    html += '</tbody></table>';
-    resultsContainer.innerHTML = html;
+    tbody.insertAdjacentHTML('beforeend', html);
 }
 
 // Обновить список истории
@@ -0,0 +1,70 @@
+import pytest
+
+from bulk_translate import _BulkWorker, results_match, summarize
+from sql_validator import SQLValidator
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def execute_query(self, query, params=None, fetch=True, timeout_ms=None, read_only=False):
+        assert read_only and timeout_ms
+        self.queries.append(query)
+        return self.rows[query], ['value']
+
+
+class FakeConverter:
+    def __init__(self, sql):
+        self.sql = sql
+
+    def convert(self, question):
+        return {'success': True, 'sql_query': self.sql, 'source': 'llm',
+                'translation': {'winner': 'llm', 'reason': 'llm_in_budget'}}
+
+
+def make_worker(generated_sql, rows, max_rows=2):
+    worker = _BulkWorker.__new__(_BulkWorker)
+    worker.db = FakeDB(rows)
+    worker.execute = True
+    worker.validator = SQLValidator(max_rows=max_rows)
+    worker.converter = FakeConverter(generated_sql)
+    worker._gold = {}
+    return worker
+
+
+GOLD = "SELECT salary FROM employees WHERE salary > 100"
+
+
+def test_gold_sql_runs_verbatim():
+    generated = "SELECT salary FROM employees WHERE salary > 100 LIMIT 1"
+    worker = make_worker(generated, {
+        "SELECT salary FROM employees WHERE salary > 100 LIMIT 1;": [(150,)],
+        GOLD: [(150,), (200,), (300,)],
+    })
+    record = worker.process({'id': '1', 'question': 'q', 'gold_sql': GOLD})
+    assert GOLD in worker.db.queries
+    assert record['match'] is False and 'truncated' not in record
+
+
+def test_truncated_result_is_indeterminate():
+    worker = make_worker(GOLD, {
+        GOLD + " LIMIT 2;": [(150,), (200,)],
+        GOLD: [(150,), (200,), (300,)],
+    })
+    record = worker.process({'id': '1', 'question': 'q', 'gold_sql': GOLD})
+    assert record['row_count'] == 2
+    assert record['match'] is None and record['truncated'] is True
+
+    summary = summarize([record, dict(record, match=True, truncated=None)])
+    assert summary['with_gold'] == 1 and summary['truncated'] == 1
+
+
+@pytest.mark.parametrize('rows, gold_rows, ordered, expected', [
+    ([(1, 'a'), (2, 'b')], [(2, 'b'), (1, 'a')], False, True),
+    ([(1, 'a'), (2, 'b')], [(2, 'b'), (1, 'a')], True, False),
+    ([(5,)], [(5.0,)], False, True),
+])
+def test_results_match(rows, gold_rows, ordered, expected):
+    assert results_match(rows, gold_rows, ordered) is expected
@@ -0,0 +1,24 @@
+import pytest
+
+from index_advisor import IndexCandidate
+
+
+def candidate_with(*costs):
+    candidate = IndexCandidate('employees', ['salary'])
+    candidate.estimates = [
+        {'sql': 'SELECT 1', 'cost_before': before, 'cost_after': after,
+         'node_before': 'Seq Scan', 'node_after': 'Index Scan'}
+        for before, after in costs
+    ]
+    return candidate
+
+
+@pytest.mark.parametrize('costs, improves', [
+    ([], False),                                # evaluate не выполнялся или упал
+    ([(100.0, 100.0)], False),
+    ([(100.0, 120.0)], False),
+    ([(100.0, 8.0)], True),
+    ([(100.0, 8.0), (50.0, 200.0)], False),
+])
+def test_improves(costs, improves):
+    assert candidate_with(*costs).improves is improves
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+import inference_worker
+from inference_worker import InferenceClient
+
+
+class FakeChannel:
+    """Дочерний процесс: отвечает на 'stats' из отдельного потока или молчит"""
+
+    def __init__(self, address, stats=None):
+        self.address = address
+        self.alive = True
+        self.pending = {}
+        self.stats = stats
+
+    def send(self, message):
+        if message[0] == 'stats' and self.stats is not None:
+            request = self.pending.pop(message[1])
+            threading.Thread(target=request.set_result, args=(self.stats,)).start()
+
+
+def test_stats_returns_snapshot_without_ipc(monkeypatch):
+    monkeypatch.setattr(inference_worker, 'STATS_TIMEOUT', 0.2)
+    client = InferenceClient('/tmp/test.sock', authkey='key')
+    client._channels = [FakeChannel('/tmp/test.sock.0', {'queue_depth': 3}),
+                        FakeChannel('/tmp/test.sock.1'),
+                        FakeChannel('/tmp/test.sock.2')]
+    assert client.stats() == {'worker': '/tmp/test.sock', 'processes': [], 'age_s': None}
+
+    started = time.monotonic()
+    client.refresh_stats()
+    # Молчащие процессы ждем вместе, а не по STATS_TIMEOUT на каждый
+    assert time.monotonic() - started < 0.35
+
+    started = time.monotonic()
+    snapshot = client.stats()
+    assert time.monotonic() - started < 0.01
+    processes = snapshot['processes']
+    assert processes[0] == {'queue_depth': 3, 'address': '/tmp/test.sock.0', 'alive': True}
+    assert [p['alive'] for p in processes[1:]] == [True, True]
+    assert all('error' in p for p in processes[1:])
+    assert not any(channel.pending for channel in client._channels)
+
+
+def test_authkey_required(monkeypatch):
+    monkeypatch.setattr(inference_worker.config, 'LLM_WORKER_AUTHKEY', '')
+    with pytest.raises(RuntimeError):
+        InferenceClient('/tmp/test.sock')
+    assert InferenceClient('/tmp/test.sock', authkey='key').authkey == b'key'
+
+
+def test_socket_dir_private(tmp_path):
+    directory = tmp_path / 'llm'
+    inference_worker._private_socket_dir(str(directory / 'worker.sock'))
+    assert directory.stat().st_mode & 0o777 == 0o700
+
+    directory.chmod(0o755)
+    with pytest.raises(RuntimeError):
+        inference_worker._private_socket_dir(str(directory / 'worker.sock'))
@@ -0,0 +1,45 @@
+import pytest
+
+from config import config
+from llm_sql_converter import LLMSQLConverter
+
+LLM_SQL = "SELECT * FROM employees WHERE department <> 'IT';"
+
+
+@pytest.fixture
+def converter(monkeypatch):
+    monkeypatch.setattr(config, 'FEW_SHOT_ENABLED', False)
+    monkeypatch.setattr(config, 'TRANSLATION_CACHE_PATH', '')
+    monkeypatch.setattr(config, 'LLM_WORKER_SOCKET', '')
+    converter = LLMSQLConverter(lazy=True)
+    converter.state = LLMSQLConverter.STATE_READY
+    converter.asked = []
+
+    def generate(query, cancel_event=None, timeout=None):
+        converter.asked.append(query)
+        return LLM_SQL
+    converter.generate_sql_with_llm = generate
+    return converter
+
+
+@pytest.mark.parametrize('query', [
+    "Сотрудники не из IT",
+    "Все кроме менеджеров",
+    "Средняя зарплата по отделам за прошлый квартал",
+])
+def test_uncertain_rules_defer_to_llm(converter, query):
+    result = converter.convert(query)
+    assert converter.asked == [query]
+    assert result['sql_query'] == LLM_SQL
+    assert result['translation']['winner'] == 'llm'
+
+
+@pytest.mark.parametrize('query, condition', [
+    ("Зарплата больше 150000", "salary > 150000"),
+    ("Зарплата не больше 100000", "salary <= 100000"),
+])
+def test_confident_rules_skip_llm(converter, query, condition):
+    result = converter.convert(query)
+    assert converter.asked == []
+    assert condition in result['sql_query']
+    assert result['translation']['reason'] == 'rules_confident'
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from query_planner import QueryCostError, QueryPlanner, set_limit
+
+
+def explain_output(rows, cost):
+    return json.dumps([{'Plan': {'Total Cost': cost, 'Startup Cost': 0.0,
+                                 'Plan Rows': rows, 'Node Type': 'Seq Scan'}}])
+
+
+def test_plan_cache_keyed_on_literals():
+    planner = QueryPlanner(max_cost=1000, max_rows=100)
+    plans = {
+        "SELECT * FROM employees WHERE salary > 900000 LIMIT 100;": explain_output(5, 50.0),
+        "SELECT * FROM employees WHERE salary > 0 LIMIT 100;": explain_output(100000, 500000.0),
+    }
+    explained = []
+
+    def explain(sql):
+        explained.append(sql)
+        return plans[sql]
+
+    selective, unselective = plans
+    _, estimate = planner.check(selective, explain)
+    assert estimate['rows'] == 5 and not estimate['cached']
+
+    # Та же форма с другим литералом - собственный EXPLAIN, а не чужая оценка
+    sql, estimate = planner.check(unselective, explain)
+    assert explained == [selective, unselective]
+    assert estimate['rewritten'] and sql.endswith('LIMIT 100;')
+
+    _, estimate = planner.check("SELECT *  FROM employees WHERE salary > 900000 LIMIT 100", explain)
+    assert estimate['cached'] and len(explained) == 2
+
+
+def test_rejected_literal_does_not_block_selective_one():
+    planner = QueryPlanner(max_cost=1000, max_rows=0)
+    with pytest.raises(QueryCostError):
+        planner.check("SELECT * FROM employees WHERE salary > 0", lambda sql: explain_output(100000, 5000.0))
+    _, estimate = planner.check("SELECT * FROM employees WHERE salary > 900000",
+                                lambda sql: explain_output(5, 50.0))
+    assert estimate['cost'] == 50.0
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM t LIMIT 1000;", "SELECT * FROM t LIMIT 10;"),
+    ("SELECT * FROM t OFFSET 5 FETCH FIRST 1000 ROWS ONLY;", "SELECT * FROM t OFFSET 5 FETCH FIRST 10 ROWS ONLY;"),
+    ("SELECT * FROM t FETCH NEXT ROW ONLY;", "SELECT * FROM t FETCH NEXT 10 ROW ONLY;"),
+    ("SELECT * FROM t WHERE id IN (SELECT id FROM t LIMIT 5);",
+     "SELECT * FROM t WHERE id IN (SELECT id FROM t LIMIT 5) LIMIT 10;"),
+])
+def test_set_limit(sql, expected):
+    assert set_limit(sql, 10) == expected
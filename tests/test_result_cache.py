@@ -0,0 +1,52 @@
+import pytest
+
+from result_cache import DataVersionProbe, ResultCache
+
+
+class PgError(Exception):
+    def __init__(self, message, pgcode=None):
+        super().__init__(message)
+        self.pgcode = pgcode
+
+
+class FakeDB:
+    """Ответы на запросы версии: значение или исключение по очереди"""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.queries = []
+
+    def execute_query(self, query):
+        self.queries.append(query)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return [(answer,)], ['version']
+
+
+def test_missing_version_table_falls_back_to_pg_stat():
+    db = FakeDB(PgError('relation "data_version" does not exist', '42P01'), 7)
+    probe = DataVersionProbe(db, min_interval_ms=0)
+    assert probe.current() == 7
+    assert probe.source == 'pg_stat'
+
+
+def test_transient_error_keeps_trigger_source():
+    db = FakeDB(PgError('server closed the connection unexpectedly', '08006'), 3)
+    probe = DataVersionProbe(db, min_interval_ms=0)
+    with pytest.raises(PgError):
+        probe.current()
+    assert probe.source == 'trigger'
+    assert probe.current() == 3
+    assert db.queries == [DataVersionProbe.QUERIES['trigger']] * 2
+
+
+def test_cache_bypassed_while_version_unknown():
+    db = FakeDB(1, 1, PgError('timeout', '57014'), 1)
+    cache = ResultCache(DataVersionProbe(db, min_interval_ms=0))
+    assert cache.get_or_execute("SELECT 1", None, lambda q, p: ([(1,)], ['x'])) == ([(1,)], ['x'], False)
+    assert cache.get("SELECT 1") == ([(1,)], ['x'])
+    # Версия недоступна: записи не выдаются, а после восстановления проверяются заново
+    assert cache.get("SELECT 1") is None
+    assert cache.get("SELECT 1") is None
+    assert cache.stats()['entries'] == 0
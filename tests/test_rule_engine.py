@@ -0,0 +1,50 @@
+import pytest
+
+from rule_engine import RuleEngine
+
+
+@pytest.fixture(scope='module')
+def engine():
+    return RuleEngine()
+
+
+@pytest.mark.parametrize('query, condition', [
+    ("Зарплата не больше 100000", "salary <= 100000"),
+    ("Зарплата не меньше 50000", "salary >= 50000"),
+])
+def test_negated_comparison_inverts_operator(engine, query, condition):
+    result = engine.translate(query)
+    assert condition in result['sql']
+    assert result['confidence'] == 1.0
+
+
+@pytest.mark.parametrize('query', [
+    "Сотрудники не из IT",
+    "Все кроме менеджеров",
+])
+def test_untranslated_negation_lowers_confidence(engine, query):
+    assert engine.translate(query)['confidence'] <= 0.5
+
+
+def test_unknown_words_lower_confidence(engine):
+    known = engine.translate("Средняя зарплата по отделам")
+    partial = engine.translate("Средняя зарплата по отделам за прошлый квартал")
+    assert known['confidence'] == 1.0
+    assert partial['confidence'] < known['confidence']
+
+
+@pytest.mark.parametrize('query, condition', [
+    ("зарплата больше 150 тысяч", "salary > 150000"),
+    ("зарплата меньше 1,5 млн рублей", "salary < 1500000"),
+])
+def test_number_multipliers(engine, query, condition):
+    result = engine.translate(query)
+    assert result['sql'].endswith(condition + ';')
+    assert result['confidence'] == 1.0
+
+
+def test_fuzzy_department_lowers_confidence(engine):
+    assert engine.translate("продавцы")['confidence'] <= 0.5
+    exact = engine.translate("сотрудники отдела продаж")
+    assert "department = 'Продажи'" in exact['sql']
+    assert exact['confidence'] == 1.0
@@ -0,0 +1,71 @@
+import pytest
+
+from sql_validator import SQLValidator, SQLValidationError
+
+
+@pytest.fixture
+def validator():
+    return SQLValidator(max_rows=1000)
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT * FROM employees LIMIT 10 + 1000000;",
+    "SELECT * FROM employees LIMIT NULL;",
+    "SELECT * FROM employees LIMIT (SELECT 100000);",
+    "SELECT * FROM employees LIMIT 10.5;",
+    "SELECT * FROM employees LIMIT 10 LIMIT 5;",
+    "SELECT * FROM employees LIMIT 10 FETCH FIRST 5 ROWS ONLY;",
+    "SELECT * FROM employees FETCH FIRST 10 + 1000000 ROWS ONLY;",
+    "SELECT * FROM employees OFFSET 5 + 1;",
+])
+def test_row_limit_expressions_rejected(validator, sql):
+    with pytest.raises(SQLValidationError):
+        validator.validate(sql)
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT * FROM employees LIMIT 5;", "SELECT * FROM employees LIMIT 5;"),
+    ("SELECT * FROM employees LIMIT 5000;", "SELECT * FROM employees LIMIT 1000;"),
+    ("SELECT * FROM employees LIMIT ALL;", "SELECT * FROM employees LIMIT 1000;"),
+    ("SELECT * FROM employees LIMIT $1;", "SELECT * FROM employees LIMIT 1000;"),
+    ("SELECT * FROM employees LIMIT 5000 OFFSET 10;", "SELECT * FROM employees LIMIT 1000 OFFSET 10;"),
+    ("SELECT * FROM employees OFFSET 10;", "SELECT * FROM employees OFFSET 10 LIMIT 1000;"),
+    ("SELECT * FROM employees FETCH FIRST 1000000 ROWS ONLY;",
+     "SELECT * FROM employees FETCH FIRST 1000 ROWS ONLY;"),
+    ("SELECT * FROM employees FETCH NEXT 5 ROWS ONLY;", "SELECT * FROM employees FETCH NEXT 5 ROWS ONLY;"),
+    ("SELECT * FROM employees FETCH FIRST ROW ONLY;", "SELECT * FROM employees FETCH FIRST ROW ONLY;"),
+    ("SELECT * FROM employees", "SELECT * FROM employees LIMIT 1000;"),
+])
+def test_row_limit_clamped(validator, sql, expected):
+    assert validator.validate(sql)['sql'] == expected
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT * FROM employees WHERE id IN (SELECT id FROM employees WHERE salary > 1)",
+    "SELECT * FROM employees e WHERE EXISTS (SELECT 1 FROM employees e2 WHERE e2.id = e.id)",
+    "SELECT * FROM employees WHERE id = ANY (SELECT id FROM employees)",
+    "SELECT * FROM employees WHERE NOT EXISTS (SELECT 1 FROM employees WHERE salary > 500000)",
+    "SELECT EXTRACT(YEAR FROM hire_date) FROM employees",
+])
+def test_subqueries_accepted(validator, sql):
+    assert validator.validate(sql)['tables'] == ['employees']
+
+
+def test_subquery_tables_checked(validator):
+    with pytest.raises(SQLValidationError):
+        validator.validate("SELECT * FROM employees WHERE id IN (SELECT id FROM pg_shadow)")
+
+
+def test_escape_string_cannot_hide_statement(validator):
+    with pytest.raises(SQLValidationError):
+        validator.validate("SELECT id FROM employees WHERE first_name = E'\\'' ; DELETE FROM employees; --'")
+
+
+@pytest.mark.parametrize('sql, expected', [
+    ("SELECT id FROM employees WHERE first_name = E'O\\'Brien'",
+     "SELECT id FROM employees WHERE first_name = E'O\\'Brien' LIMIT 1000;"),
+    ("SELECT id FROM employees WHERE first_name = 'C:\\'",
+     "SELECT id FROM employees WHERE first_name = 'C:\\' LIMIT 1000;"),
+])
+def test_string_escapes(validator, sql, expected):
+    assert validator.validate(sql)['sql'] == expected
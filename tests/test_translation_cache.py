@@ -0,0 +1,37 @@
+import pytest
+
+from translation_cache import TranslationCache, normalize_query
+
+
+@pytest.mark.parametrize('first, second', [
+    ("Зарплата > 150000", "Зарплата < 150000"),
+    ("Зарплата >= 150000", "Зарплата > 150000"),
+    ("Зарплата <= 150000", "Зарплата < 150000"),
+    ("Зарплата = 150000", "Зарплата 150000"),
+    ("Зарплата != 150000", "Зарплата = 150000"),
+    ("Ставка больше 1.05", "Ставка больше 1.5"),
+    ("Ставка больше 1,05", "Ставка больше 1,5"),
+    ("Ставка больше 1.5", "Ставка больше 1 5"),
+])
+def test_comparison_operators_kept(first, second):
+    assert normalize_query(first) != normalize_query(second)
+
+
+@pytest.mark.parametrize('first, second', [
+    ("Зарплата>150 000,00", "зарплата > 150000"),
+    ("Зарплата ≥ 150000", "зарплата >= 150000"),
+    ("Зарплата <> 150000", "зарплата != 150000"),
+    ("Сотрудники  IT-отдела!", "сотрудники it отдела"),
+    ("Ещё сотрудники", "еще сотрудники"),
+    ("Ставка больше 1,5", "ставка больше 1.50"),
+    ("Ставка больше 01.05", "ставка больше 1.05"),
+])
+def test_equivalent_questions_share_key(first, second):
+    assert normalize_query(first) == normalize_query(second)
+
+
+def test_cache_does_not_serve_opposite_filter():
+    cache = TranslationCache()
+    cache.put("Зарплата > 150000", "SELECT * FROM employees WHERE salary > 150000;")
+    assert cache.get("Зарплата < 150000") is None
+    assert cache.get("зарплата>150000") == "SELECT * FROM employees WHERE salary > 150000;"
@@ -0,0 +1,44 @@
+import pytest
+
+import wire_format
+from wire_format import COLUMNAR_JSON, JSON, choose_encoding, negotiate
+
+
+@pytest.mark.parametrize('accept, layout, expected', [
+    (None, None, JSON),
+    (None, 'columnar', COLUMNAR_JSON),
+    (COLUMNAR_JSON, None, COLUMNAR_JSON),
+    (f"{COLUMNAR_JSON};q=0.5, application/json", None, JSON),
+    (f"application/json;q=0.5, {COLUMNAR_JSON}", None, COLUMNAR_JSON),
+    (f"application/json, {COLUMNAR_JSON}", None, JSON),
+    (f"*/*, {COLUMNAR_JSON};q=0.9", None, JSON),
+    (f"text/html, {COLUMNAR_JSON};q=0.9", None, COLUMNAR_JSON),
+    ("application/json", 'columnar', COLUMNAR_JSON),
+    (f"application/json;q=0, {COLUMNAR_JSON}", None, COLUMNAR_JSON),
+    ("application/json;q=0, */*", None, COLUMNAR_JSON),
+])
+def test_negotiate_by_q(accept, layout, expected):
+    assert negotiate(accept, layout) == expected
+
+
+@pytest.mark.parametrize('accept_encoding, with_brotli, expected', [
+    ("gzip, deflate, br", True, 'br'),
+    ("gzip, br", False, 'gzip'),
+    ("br, gzip", True, 'br'),
+    ("br;q=0.5, gzip", True, 'gzip'),
+    ("gzip;q=0.5, br", True, 'br'),
+    ("br, gzip;q=0.5", False, 'gzip'),
+    ("br", False, None),
+    ("identity, gzip;q=0.5", True, None),
+    ("gzip;q=0", True, None),
+    ("*", False, 'gzip'),
+    ("*", True, 'br'),
+    ("gzip;q=0, *", False, None),
+    ("x-gzip;q=0, *", False, None),
+    ("br;q=0, *", True, 'gzip'),
+    ("gzip;q=0, br;q=0, *", True, None),
+    (None, True, None),
+])
+def test_choose_encoding_by_q(monkeypatch, accept_encoding, with_brotli, expected):
+    monkeypatch.setattr(wire_format, 'brotli', object() if with_brotli else None)
+    assert choose_encoding(accept_encoding) == expected
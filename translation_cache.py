@@ -0,0 +1,184 @@
+# translation_cache.py - кэш переводов NL -> SQL
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+_THOUSANDS_SEP = re.compile(r'(?<=\d)[ \u00a0\u202f](?=\d{3}(?!\d))')
+_NON_WORD = re.compile(r'[^\w]+')
+# Числа (целиком, с дробной частью или группами через точку, как в датах) и
+# операторы сравнения - часть смысла вопроса ("зарплата > 150000" != "зарплата < 150000")
+_NUMBER = re.compile(r'\d+(?:[.,]\d+)*')
+_SPECIAL = re.compile(r'((?<![\w.,])\d+(?:[.,]\d+)*(?!\w)|!=|[<>=≤≥≠]+)')
+_OPERATOR_ALIASES = {'≥': '>=', '≤': '<=', '≠': '!=', '<>': '!=', '==': '=', '=>': '>=', '=<': '<='}
+
+# Версия правил normalize_query: входит в отпечаток кэша, чтобы ключи,
+# построенные по прежним правилам, не выдавались
+KEY_VERSION = 3
+
+
+def _canonical_number(text):
+    """'150000,00' -> '150000', '1,50' -> '1.5', '01.02.2024' -> '1.2.2024'"""
+    groups = re.split(r'[.,]', text)
+    if len(groups) == 2:
+        return format(Decimal('.'.join(groups)).normalize(), 'f')
+    return '.'.join(group.lstrip('0') or '0' for group in groups)
+
+
+def normalize_query(query):
+    """
+    Нормализованный текст запроса для ключа кэша:
+    нижний регистр, ё -> е, числа в каноническом виде целиком ("150 000,00" ->
+    "150000", "1,50" -> "1.5"; "1.05" остается "1.05"), пунктуация и
+    повторяющиеся пробелы схлопнуты в один пробел, операторы сравнения
+    (<, >, =, <=, >=, !=) сохраняются отдельными словами.
+    """
+    text = query.lower().replace('ё', 'е')
+    text = _THOUSANDS_SEP.sub('', text)
+    words = []
+    for n, part in enumerate(_SPECIAL.split(text)):
+        if n % 2 == 0:
+            words.extend(_NON_WORD.sub(' ', part).split())
+        elif _NUMBER.fullmatch(part):
+            words.append(_canonical_number(part))
+        else:
+            words.append(_OPERATOR_ALIASES.get(part, part))
+    return ' '.join(words)
+
+
+def schema_fingerprint(*parts):
+    """Отпечаток схемы (и всего, от чего зависит перевод)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+class TranslationCache:
+    """
+    Двухуровневый кэш переводов.
+
+    Первый уровень - LRU в памяти процесса с TTL. Второй (необязательный) -
+    SQLite-файл, переживающий перезапуски. Оба уровня привязаны к отпечатку
+    схемы: при его смене старые переводы перестают выдаваться.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, disk_path=None, fingerprint=''):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fingerprint = fingerprint
+
+        self._memory = OrderedDict()   # ключ -> (sql, время записи)
+        self._lock = threading.Lock()
+
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("""
+                CREATE TABLE IF NOT EXISTS translations (
+                    fingerprint TEXT NOT NULL,
+                    query_key TEXT NOT NULL,
+                    sql_query TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (fingerprint, query_key)
+                )
+            """)
+            self._disk.commit()
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _expired(self, created_at, now):
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def get(self, query):
+        """SQL для запроса из кэша или None"""
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                sql, created_at = entry
+                if not self._expired(created_at, now):
+                    self._memory.move_to_end(key)
+                    self._memory_hits += 1
+                    return sql
+                del self._memory[key]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT sql_query, created_at FROM translations WHERE fingerprint = ? AND query_key = ?",
+                    (self.fingerprint, key)
+                ).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._disk_hits += 1
+                    self._remember(key, row[0], row[1])
+                    return row[0]
+
+            self._misses += 1
+            return None
+
+    def put(self, query, sql):
+        """Сохранение перевода в оба уровня"""
+        key = normalize_query(query)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, sql, now)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO translations (fingerprint, query_key, sql_query, created_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self.fingerprint, key, sql, now)
+                )
+                self._disk.commit()
+
+    def _remember(self, key, sql, created_at):
+        self._memory[key] = (sql, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._evictions += 1
+
+    def set_fingerprint(self, fingerprint):
+        """Смена отпечатка схемы: все ранее сохраненные переводы недействительны"""
+        with self._lock:
+            if fingerprint == self.fingerprint:
+                return
+            self.fingerprint = fingerprint
+            self._memory.clear()
+            self._invalidations += 1
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM translations WHERE fingerprint != ?", (fingerprint,))
+                self._disk.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM translations")
+                self._disk.commit()
+
+    def stats(self):
+        """Счетчики попаданий и промахов для /api/health"""
+        with self._lock:
+            lookups = self._memory_hits + self._disk_hits + self._misses
+            return {
+                'fingerprint': self.fingerprint,
+                'size': len(self._memory),
+                'memory_hits': self._memory_hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'hit_rate': round((self._memory_hits + self._disk_hits) / lookups, 3) if lookups else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'disk_enabled': self._disk is not None,
+            }
@@ -0,0 +1,287 @@
+# wire_format.py - компактная выдача результатов запроса
+#
+# Строчный ответ повторяет имена столбцов в каждой строке. Столбцовый ответ -
+# columns, types и data (по массиву значений на столбец): имена передаются
+# один раз, а преобразование значений выбирается один раз на столбец.
+# Значения типизированы (числа - числами, даты - ISO-строками), форматирование
+# для показа делает static/script.js.
+#
+# Кодирование выбирается по Accept: JSON, msgpack, Arrow IPC (последние два -
+# если установлены msgpack / pyarrow). Сжатие - по Accept-Encoding: brotli
+# (если установлен brotli), иначе gzip.
+import gzip
+import json
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.text2sql.columnar+json'
+MSGPACK = 'application/msgpack'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+# Синонимы типов в Accept и сжатий в Accept-Encoding
+_ALIASES = {'application/x-msgpack': MSGPACK, 'x-gzip': 'gzip'}
+# Предпочтение сервера между сжатиями с равным q
+_ENCODING_RANK = {'identity': 0, 'gzip': 1, 'br': 2}
+
+# Уровни сжатия для динамических ответов: заметно быстрее максимальных,
+# размер - в пределах нескольких процентов от них
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def available_types():
+    """Столбцовые кодировки, доступные в этом окружении"""
+    types = [COLUMNAR_JSON]
+    if msgpack is not None:
+        types.append(MSGPACK)
+    if pyarrow is not None:
+        types.append(ARROW)
+    return types
+
+
+# ===== ТИПИЗИРОВАННЫЕ ЗНАЧЕНИЯ =====
+def _iso(value):
+    return value.isoformat()
+
+
+def _column_type(values):
+    """(тип для клиента, преобразование значения или None) по первому значению не NULL"""
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return 'boolean', None
+        if isinstance(value, (int, float)):
+            return 'number', None
+        if isinstance(value, Decimal):
+            return 'number', float
+        if isinstance(value, datetime):
+            return 'timestamp', _iso
+        if isinstance(value, date):
+            return 'date', _iso
+        if isinstance(value, time):
+            return 'time', _iso
+        if isinstance(value, str):
+            return 'string', None
+        return 'string', str
+    return 'null', None
+
+
+def json_value(value):
+    """Значение из БД -> значение для JSON (без форматирования для показа)"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    _, convert = _column_type((value,))
+    return convert(value) if convert else value
+
+
+def columnar(columns, rows):
+    """
+    Строки результата -> (types, data): data[i] - значения столбца columns[i].
+    Столбец SQL однороден, поэтому тип определяется по первому значению не NULL.
+    """
+    if not rows:
+        return ['null'] * len(columns), [[] for _ in columns]
+    types, data = [], []
+    for values in zip(*rows):
+        column_type, convert = _column_type(values)
+        types.append(column_type)
+        if convert is None:
+            data.append(list(values))
+        else:
+            data.append([None if value is None else convert(value) for value in values])
+    return types, data
+
+
+# ===== ВЫБОР КОДИРОВКИ =====
+def _parse_accept(header, refused=None):
+    """
+    Заголовок Accept/Accept-Encoding -> [(значение, q)] в порядке убывания q.
+    Значения с q=0 (явный отказ) не входят в список; их собирает множество refused.
+    """
+    items = []
+    for position, part in enumerate((header or '').split(',')):
+        fields = part.strip().split(';')
+        value = fields[0].strip().lower()
+        if not value:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, number = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            items.append((value, q, position))
+        elif refused is not None:
+            refused.add(value)
+    items.sort(key=lambda item: (-item[1], item[2]))
+    return [(value, q) for value, q, _ in items]
+
+
+def negotiate(accept, layout=None):
+    """
+    Тип ответа по Accept: поддерживаемый тип с наибольшим q (при равных q -
+    первый в заголовке). application/json и */* - JSON по умолчанию:
+    строчный, а при layout='columnar' в теле запроса - столбцовый.
+    """
+    default = COLUMNAR_JSON if layout == 'columnar' else JSON
+    supported = available_types()
+    refused = set()
+    offered = _parse_accept(accept, refused)
+    for media_type, _ in offered:
+        media_type = _ALIASES.get(media_type, media_type)
+        if media_type in supported:
+            return media_type
+        if media_type == JSON or (media_type in ('application/*', '*/*') and default not in refused):
+            return default
+        if media_type in ('application/*', '*/*'):
+            # JSON по умолчанию отклонен (q=0) - первая не отклоненная кодировка
+            for candidate in supported:
+                if candidate not in refused:
+                    return candidate
+    return default
+
+
+def choose_encoding(accept_encoding):
+    """
+    'br', 'gzip' или None по Accept-Encoding: доступное сжатие с наибольшим q,
+    при равных q - лучшее по _ENCODING_RANK. '*' - любое сжатие, кроме
+    отклоненных явно (q=0).
+    """
+    refused = set()
+    offered = _parse_accept(accept_encoding, refused)
+    refused = {_ALIASES.get(encoding, encoding) for encoding in refused}
+    best, best_key = None, None
+    for encoding, q in offered:
+        if encoding == '*':
+            candidates = [e for e in ('br', 'gzip') if e not in refused]
+        else:
+            candidates = [_ALIASES.get(encoding, encoding)]
+        for encoding in candidates:
+            if encoding not in _ENCODING_RANK or (encoding == 'br' and brotli is None):
+                continue
+            key = (q, _ENCODING_RANK[encoding])
+            if best_key is None or key > best_key:
+                best, best_key = encoding, key
+    return None if best == 'identity' else best
+
+
+# ===== КОДИРОВАНИЕ =====
+def _arrow_ipc(payload):
+    """Таблица результата в Arrow IPC; остальные поля ответа - в метаданных схемы"""
+    meta = {key: value for key, value in payload.items() if key != 'data'}
+    arrays = []
+    for values, column_type in zip(payload['data'], payload['types']):
+        if column_type == 'null':
+            arrays.append(pyarrow.nulls(len(values)))
+        else:
+            arrays.append(pyarrow.array(values))
+    table = pyarrow.Table.from_arrays(arrays, names=[str(name) for name in payload['columns']])
+    table = table.replace_schema_metadata({
+        'text2sql': json.dumps(meta, ensure_ascii=False, default=str)
+    })
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(payload, media_type):
+    """Ответ -> байты в выбранной кодировке"""
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, default=str, use_bin_type=True)
+    if media_type == ARROW:
+        return _arrow_ipc(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def encode_body(payload, media_type, accept_encoding=None, min_bytes=None):
+    """
+    (тело, заголовки) готового ответа. Сжимается тело не короче min_bytes
+    (None - не сжимать).
+    """
+    body = encode(payload, media_type)
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    encoding = choose_encoding(accept_encoding) if min_bytes is not None else None
+    if encoding and len(body) >= min_bytes:
+        body = compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+    return body, headers
+
+
+class StreamCompressor:
+    """
+    Сжатие потокового ответа по частям: каждая часть сбрасывается сразу
+    (sync flush), поэтому клиент получает строки NDJSON без задержки.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        # Клиент отключился - закрываем исходный генератор (курсор, соединение)
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+async def compress_stream_async(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    try:
+        async for chunk in chunks:
+            yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        await chunks.aclose()